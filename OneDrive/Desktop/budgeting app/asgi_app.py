@@ -0,0 +1,681 @@
+"""Production ASGI entry point for the budget API
+
+Serves the same routes as the Flask app in budget_backend as async handlers.
+Tax and budget math is shared with budget_backend; SQLite access runs on the
+thread pool so it never blocks the event loop.
+
+    uvicorn asgi_app:app --workers 4
+    python asgi_app.py            # same, configured from the environment
+    python launcher.py --workers 4  # pre-forked workers sharing warm state
+"""
+import io
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+
+import anyio
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import budget_backend
+import database
+import expenses
+import exports
+import goals
+import history_archive
+import income_conversion
+import passwords
+import reports
+import scenarios
+import sessions
+from instrumentation import MetricsMiddleware, metrics
+from rate_limits import RateLimitMiddleware
+from tax_tables import UnknownTaxYear
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def error(message, status_code, **extra):
+    return JSONResponse({"error": message, **extra}, status_code=status_code)
+
+
+def query_int(request, name, default=None):
+    """Integer query parameter; default when missing or malformed, like Flask's type=int"""
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+class RequestStream(io.RawIOBase):
+    """Blocking file-like view of a request body for parsers running on the thread pool
+
+    Chunks are pulled from the event loop as the parser asks for them, so an
+    upload is never held in memory all at once.
+    """
+
+    def __init__(self, request):
+        self._chunks = request.stream()
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    async def _next_chunk(self):
+        return await self._chunks.__anext__()
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = anyio.from_thread.run(self._next_chunk)
+            except StopAsyncIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def accept_quality(accept, mimetype):
+    """Quality the Accept header gives a mimetype; the most specific matching range wins"""
+    if not accept:
+        return 1.0
+    best = (-1, 0.0)
+    main_type = mimetype.split('/')[0]
+    for media_range in accept.split(','):
+        value, *params = [part.strip() for part in media_range.split(';')]
+        if value == mimetype:
+            specificity = 2
+        elif value == f'{main_type}/*':
+            specificity = 1
+        elif value == '*/*':
+            specificity = 0
+        else:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, q = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(q)
+                except ValueError:
+                    quality = 0.0
+        best = max(best, (specificity, quality))
+    return best[1]
+
+
+async def flush_snapshots(request):
+    """Wait for the user's queued budget snapshots; free when none are queued"""
+    user_id = request.session['user_id']
+    writer = budget_backend.snapshot_writer
+    if writer.has_pending(user_id):
+        await run_in_threadpool(writer.flush, user_id)
+
+
+def payload_response(payload, request):
+    status, body, headers = payload.respond(request.headers.get('accept-encoding'),
+                                            request.headers.get('if-none-match'))
+    return Response(body, status_code=status, headers=headers)
+
+
+async def index(request):
+    return payload_response(budget_backend.frontend_payload.get(), request)
+
+
+async def register(request):
+    data = await read_json(request) or {}
+    username = data.get('username')
+    email = data.get('email')
+    password = data.get('password')
+
+    if not all([username, email, password]):
+        return error("Missing required fields", 400)
+
+    try:
+        password_hash = await passwords.get_hasher().hash_async(password)
+    except passwords.HasherBusy:
+        return error("Server busy, try again", 503)
+
+    try:
+        user_id = await run_in_threadpool(database.create_user, username, email, password_hash)
+    except sqlite3.IntegrityError:
+        return error("Username or email already exists", 400)
+
+    request.session['user_id'] = user_id
+    request.session['username'] = username
+    return JSONResponse({"success": True, "message": "User registered successfully"})
+
+
+async def login(request):
+    data = await read_json(request) or {}
+    username = data.get('username')
+    password = data.get('password')
+
+    if not all([username, password]):
+        return error("Missing username or password", 400)
+
+    hasher = passwords.get_hasher()
+    user = await run_in_threadpool(database.find_user_for_login, username)
+    try:
+        matched = await hasher.verify_async(password, user[2] if user else None)
+        if matched and hasher.needs_rehash(user[2]):
+            password_hash = await hasher.hash_async(password)
+            await run_in_threadpool(database.update_password_hash, user[0], password_hash)
+    except passwords.HasherBusy:
+        return error("Server busy, try again", 503)
+
+    if not matched:
+        return error("Invalid username or password", 401)
+
+    request.session['user_id'] = user[0]
+    request.session['username'] = user[1]
+    return JSONResponse({"success": True, "message": "Login successful"})
+
+
+async def logout(request):
+    request.session.clear()
+    return JSONResponse({"success": True, "message": "Logged out successfully"})
+
+
+async def calculate_budget(request):
+    data = await read_json(request) or {}
+    yearly_income = float(data.get('yearly_income', 0))
+    filing_status = data.get('filing_status', 'single')
+    county = data.get('county', 'Los Angeles')
+
+    if yearly_income <= 0:
+        return error("Invalid income amount", 400)
+    invalid = budget_backend.invalid_budget_field(filing_status, county)
+    if invalid:
+        return error(f"Invalid {invalid}", 400)
+
+    try:
+        tables = budget_backend.tax_registry.get(data.get('tax_year'))
+    except UnknownTaxYear as e:
+        return error(str(e), 400)
+
+    result, budget_breakdown = budget_backend.cached_budget(yearly_income, filing_status, county, tables)
+
+    # Save to database if user is logged in
+    if 'user_id' in request.session:
+        row = (request.session['user_id'], yearly_income, filing_status, county, budget_breakdown)
+        writer = budget_backend.snapshot_writer
+        if not writer.submit(row, block=False):
+            # Queue full: wait for room (or write inline) without blocking the event loop
+            await run_in_threadpool(writer.submit, row)
+
+    return JSONResponse(result)
+
+
+async def calculate_budget_batch(request):
+    data = await read_json(request)
+    tax_year = request.query_params.get('tax_year')
+    if isinstance(data, dict):
+        tax_year = data.get('tax_year', tax_year)
+        data = data.get('rows')
+
+    if not isinstance(data, list) or not data:
+        return error("Expected a non-empty list of rows", 400)
+    if len(data) > budget_backend.BATCH_MAX_ROWS:
+        return error(f"Batch is limited to {budget_backend.BATCH_MAX_ROWS} rows", 400)
+
+    rows = []
+    for index, row in enumerate(data):
+        try:
+            yearly_income = float(row.get('yearly_income', 0))
+        except (AttributeError, TypeError, ValueError):
+            yearly_income = 0
+        if yearly_income <= 0:
+            return error("Invalid income amount", 400, row=index)
+        filing_status, county = row.get('filing_status', 'single'), row.get('county', 'Los Angeles')
+        invalid = budget_backend.invalid_budget_field(filing_status, county)
+        if invalid:
+            return error(f"Invalid {invalid}", 400, row=index)
+        rows.append((yearly_income, filing_status, county))
+
+    # Large batches are CPU bound; keep them off the event loop
+    try:
+        results = await run_in_threadpool(budget_backend.compute_budget_batch, rows, tax_year)
+    except UnknownTaxYear as e:
+        return error(str(e), 400)
+    return JSONResponse({"results": results})
+
+
+async def run_scenarios(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return error("Expected a JSON object", 400)
+    try:
+        tables = budget_backend.tax_registry.get(data.get('tax_year'))
+    except UnknownTaxYear as e:
+        return error(str(e), 400)
+
+    # Grids can be large; keep the math off the event loop
+    try:
+        incomes, counties, filing_statuses, fields = scenarios.scenario_axes(data, tables)
+        results = await run_in_threadpool(scenarios.run_scenarios, tables.engine, incomes,
+                                          counties, filing_statuses, fields)
+    except scenarios.ScenarioError as e:
+        return error(str(e), 400)
+
+    return JSONResponse({
+        "tax_year": tables.tax_year,
+        "incomes": incomes.tolist(),
+        "counties": counties,
+        "filing_statuses": filing_statuses,
+        "fields": fields,
+        "results": results
+    })
+
+
+async def cache_stats(request):
+    return JSONResponse({**budget_backend.budget_cache_stats(),
+                         "snapshot_writer": budget_backend.snapshot_writer.stats()})
+
+
+async def budget_tips(request):
+    return payload_response(budget_backend.budget_tips_payload, request)
+
+
+async def convert_income(request):
+    data = await read_json(request) or {}
+    amount = float(data.get('amount', 0))
+    from_type = data.get('from_type')
+    hours_per_week = float(data.get('hours_per_week', 40))
+    weeks_per_year = float(data.get('weeks_per_year', 52))
+
+    if amount <= 0:
+        return error("Invalid amount", 400)
+
+    conversions = budget_backend.convert_income_amount(amount, from_type, hours_per_week, weeks_per_year)
+    if conversions is None:
+        return error("Invalid income type", 400)
+
+    return JSONResponse(conversions)
+
+
+async def convert_income_batch(request):
+    try:
+        if request.headers.get('content-type', '').split(';')[0].strip() == 'text/csv':
+            columns = await run_in_threadpool(income_conversion.columns_from_csv,
+                                              io.BufferedReader(RequestStream(request)))
+        else:
+            columns = await run_in_threadpool(income_conversion.columns_from_json, await read_json(request))
+        results = await run_in_threadpool(income_conversion.convert_columns, *columns)
+    except income_conversion.ConversionError as e:
+        return error(str(e), 400, row=e.row)
+
+    fmt = request.query_params.get('format')
+    if fmt is None:
+        accept = request.headers.get('accept')
+        prefers_csv = accept_quality(accept, 'text/csv') > accept_quality(accept, 'application/json')
+        fmt = 'csv' if prefers_csv else 'json'
+    if fmt == 'csv':
+        return StreamingResponse(income_conversion.stream_csv(columns[0], columns[1], results),
+                                 media_type='text/csv')
+    if fmt != 'json':
+        return error("Unsupported format; use json or csv", 400)
+    return StreamingResponse(income_conversion.stream_json(results), media_type='application/json')
+
+
+async def counties(request):
+    try:
+        tax_year = budget_backend.tax_registry.get(request.query_params.get('tax_year')).tax_year
+    except UnknownTaxYear as e:
+        return error(str(e), 400)
+    return payload_response(budget_backend.county_payloads.get(tax_year), request)
+
+
+async def tax_curves(request):
+    try:
+        tax_year = budget_backend.tax_registry.get(request.query_params.get('tax_year')).tax_year
+    except UnknownTaxYear as e:
+        return error(str(e), 400)
+    return payload_response(budget_backend.tax_curve_payloads.get(tax_year), request)
+
+
+async def user_profile(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    await flush_snapshots(request)
+    profiles = await run_in_threadpool(database.recent_budget_profiles, request.session['user_id'])
+
+    return JSONResponse({
+        "username": request.session['username'],
+        "profiles": [
+            {
+                "yearly_income": profile[0],
+                "filing_status": profile[1],
+                "county": profile[2],
+                "housing_budget": profile[3],
+                "transportation_budget": profile[4],
+                "food_budget": profile[5],
+                "savings_budget": profile[6],
+                "created_at": profile[7]
+            }
+            for profile in profiles
+        ]
+    })
+
+
+async def user_profile_history(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    params = request.query_params
+    await flush_snapshots(request)
+    try:
+        history = await run_in_threadpool(
+            history_archive.history,
+            request.session['user_id'],
+            since=params.get('since'),
+            until=params.get('until'),
+            max_points=query_int(request, 'max_points')
+        )
+    except ValueError as e:
+        return error(str(e), 400)
+
+    return JSONResponse(history)
+
+
+async def list_expenses(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    params = request.query_params
+    try:
+        items, next_cursor = await run_in_threadpool(
+            expenses.list_expenses,
+            request.session['user_id'],
+            limit=query_int(request, 'limit', expenses.DEFAULT_PAGE_SIZE),
+            cursor=params.get('cursor'),
+            category=params.get('category'),
+            since=params.get('since'),
+            until=params.get('until')
+        )
+    except expenses.ExpenseError as e:
+        return error(str(e), 400)
+
+    return JSONResponse({"expenses": items, "next_cursor": next_cursor})
+
+
+async def create_expense(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    data = await read_json(request) or {}
+    try:
+        expense = await run_in_threadpool(expenses.create_expense, request.session['user_id'], data)
+    except expenses.ExpenseError as e:
+        return error(str(e), 400)
+
+    return JSONResponse(expense, status_code=201)
+
+
+async def get_expense(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    expense = await run_in_threadpool(expenses.get_expense, request.session['user_id'],
+                                      request.path_params['expense_id'])
+    if expense is None:
+        return error("Expense not found", 404)
+    return JSONResponse(expense)
+
+
+async def update_expense(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    data = await read_json(request) or {}
+    try:
+        expense = await run_in_threadpool(expenses.update_expense, request.session['user_id'],
+                                          request.path_params['expense_id'], data)
+    except expenses.ExpenseError as e:
+        return error(str(e), 400)
+
+    if expense is None:
+        return error("Expense not found", 404)
+    return JSONResponse(expense)
+
+
+async def delete_expense(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    if not await run_in_threadpool(expenses.delete_expense, request.session['user_id'],
+                                   request.path_params['expense_id']):
+        return error("Expense not found", 404)
+    return JSONResponse({"success": True})
+
+
+async def import_expenses(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    fmt = expenses.import_format(request.query_params.get('format'), request.headers.get('content-type'))
+    if fmt is None:
+        return error("Unsupported import format; use CSV or JSON lines", 400)
+
+    try:
+        imported = await run_in_threadpool(expenses.import_expenses, request.session['user_id'],
+                                           RequestStream(request), fmt)
+    except expenses.ExpenseError as e:
+        return error(str(e), 400, line=e.line)
+
+    return JSONResponse({"success": True, "imported": imported})
+
+
+async def list_goals(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    user_id = request.session['user_id']
+    await flush_snapshots(request)
+    user_goals = await run_in_threadpool(goals.list_goals, user_id)
+    contribution = await run_in_threadpool(goals.default_contribution, user_id)
+    return JSONResponse({"goals": goals.summarize(user_goals, contribution)})
+
+
+async def create_goal(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    data = await read_json(request) or {}
+    try:
+        goal = await run_in_threadpool(goals.create_goal, request.session['user_id'], data)
+    except goals.GoalError as e:
+        return error(str(e), 400)
+
+    return JSONResponse(goal, status_code=201)
+
+
+async def get_goal(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    goal = await run_in_threadpool(goals.get_goal, request.session['user_id'], request.path_params['goal_id'])
+    if goal is None:
+        return error("Goal not found", 404)
+    return JSONResponse(goal)
+
+
+async def update_goal(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    data = await read_json(request) or {}
+    try:
+        goal = await run_in_threadpool(goals.update_goal, request.session['user_id'],
+                                       request.path_params['goal_id'], data)
+    except goals.GoalError as e:
+        return error(str(e), 400)
+
+    if goal is None:
+        return error("Goal not found", 404)
+    return JSONResponse(goal)
+
+
+async def delete_goal(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    if not await run_in_threadpool(goals.delete_goal, request.session['user_id'], request.path_params['goal_id']):
+        return error("Goal not found", 404)
+    return JSONResponse({"success": True})
+
+
+async def goal_projection(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    user_id = request.session['user_id']
+    goal = await run_in_threadpool(goals.get_goal, user_id, request.path_params['goal_id'])
+    if goal is None:
+        return error("Goal not found", 404)
+
+    await flush_snapshots(request)
+    contribution = goals.contribution_for(goal, await run_in_threadpool(goals.default_contribution, user_id))
+    # The Monte Carlo simulation is CPU bound; keep it off the event loop
+    try:
+        projection = await run_in_threadpool(
+            goals.project, goal, contribution,
+            paths=query_int(request, 'paths', goals.DEFAULT_PATHS),
+            horizon=query_int(request, 'horizon_months'),
+            seed=query_int(request, 'seed')
+        )
+    except goals.GoalError as e:
+        return error(str(e), 400)
+
+    return JSONResponse(projection)
+
+
+async def spending_report(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    months = query_int(request, 'months', reports.DEFAULT_REPORT_MONTHS)
+    await flush_snapshots(request)
+    report = await run_in_threadpool(reports.spending_report, request.session['user_id'], months)
+    return JSONResponse(report)
+
+
+async def export_data(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    dataset = request.path_params['dataset']
+    fmt = request.query_params.get('format', 'csv')
+    if dataset not in exports.EXPORT_DATASETS:
+        return error("Unknown dataset", 404)
+    if fmt not in exports.EXPORT_FORMATS:
+        return error("Unsupported export format; use csv or jsonl", 400)
+
+    await flush_snapshots(request)
+    # A sync generator, so Starlette reads the cursor on the thread pool
+    return StreamingResponse(
+        exports.stream_export(request.session['user_id'], dataset, fmt),
+        media_type=exports.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={dataset}.{fmt}"}
+    )
+
+
+async def backup_data(request):
+    if 'user_id' not in request.session:
+        return error("Not logged in", 401)
+
+    await flush_snapshots(request)
+    return StreamingResponse(
+        exports.stream_backup(request.session['user_id']),
+        media_type=exports.EXPORT_FORMATS['jsonl'],
+        headers={"Content-Disposition": "attachment; filename=budget_backup.jsonl"}
+    )
+
+
+class TaxTableReloadMiddleware:
+    """Pick up edited tax table files without restarting the worker"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            budget_backend.tax_registry.reload_if_changed()
+        await self.app(scope, receive, send)
+
+
+routes = [
+    Route('/', index),
+    Route('/api/register', register, methods=['POST']),
+    Route('/api/login', login, methods=['POST']),
+    Route('/api/logout', logout, methods=['POST']),
+    Route('/api/calculate-budget', calculate_budget, methods=['POST']),
+    Route('/api/calculate-budget/batch', calculate_budget_batch, methods=['POST']),
+    Route('/api/scenarios', run_scenarios, methods=['POST']),
+    Route('/api/cache-stats', cache_stats, methods=['GET']),
+    Route('/api/budget-tips', budget_tips, methods=['GET']),
+    Route('/api/convert-income', convert_income, methods=['POST']),
+    Route('/api/convert-income/batch', convert_income_batch, methods=['POST']),
+    Route('/api/counties', counties, methods=['GET']),
+    Route('/api/tax-curves', tax_curves, methods=['GET']),
+    Route('/api/user-profile', user_profile, methods=['GET']),
+    Route('/api/user-profile/history', user_profile_history, methods=['GET']),
+    Route('/api/expenses', list_expenses, methods=['GET']),
+    Route('/api/expenses', create_expense, methods=['POST']),
+    Route('/api/expenses/import', import_expenses, methods=['POST']),
+    Route('/api/expenses/{expense_id:int}', get_expense, methods=['GET']),
+    Route('/api/expenses/{expense_id:int}', update_expense, methods=['PUT']),
+    Route('/api/expenses/{expense_id:int}', delete_expense, methods=['DELETE']),
+    Route('/api/goals', list_goals, methods=['GET']),
+    Route('/api/goals', create_goal, methods=['POST']),
+    Route('/api/goals/{goal_id:int}', get_goal, methods=['GET']),
+    Route('/api/goals/{goal_id:int}', update_goal, methods=['PUT']),
+    Route('/api/goals/{goal_id:int}', delete_goal, methods=['DELETE']),
+    Route('/api/goals/{goal_id:int}/projection', goal_projection, methods=['GET']),
+    Route('/api/reports/spending', spending_report, methods=['GET']),
+    Route('/api/export/backup', backup_data, methods=['GET']),
+    Route('/api/export/{dataset}', export_data, methods=['GET']),
+]
+
+middleware = [
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    # Outside the rate limiter so rejected requests are counted too
+    Middleware(MetricsMiddleware, metrics=metrics, routes=routes),
+    Middleware(TaxTableReloadMiddleware),
+    Middleware(sessions.ServerSessionMiddleware, store=budget_backend.session_store),
+    # Inside the session middleware so limits can key on the logged-in user
+    Middleware(RateLimitMiddleware, limiter=budget_backend.rate_limiter),
+]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(budget_backend.init_db)
+    yield
+    passwords.get_hasher().shutdown()
+
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(
+        'asgi_app:app',
+        host=os.environ.get('BUDGET_HOST', '127.0.0.1'),
+        port=int(os.environ.get('BUDGET_PORT', 8000)),
+        workers=int(os.environ.get('BUDGET_WORKERS', 1)),
+        log_level='warning',
+        access_log=False
+    )
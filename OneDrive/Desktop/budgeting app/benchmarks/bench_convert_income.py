@@ -0,0 +1,81 @@
+"""Batch /api/convert-income/batch against one /api/convert-income request per row
+
+Converts the same synthetic salary sheet both ways through Flask's test
+client, checks that every row agrees, and reports rows/sec for the per-row
+endpoint and for the batch endpoint with JSON and CSV output.
+
+    python benchmarks/bench_convert_income.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+def salary_sheet(rows, seed=0):
+    rng = random.Random(seed)
+    sheet = {"amounts": [], "from_type": [], "hours_per_week": [], "weeks_per_year": []}
+    for _ in range(rows):
+        from_type = rng.choice(['hourly', 'monthly', 'yearly'])
+        amount = {'hourly': rng.uniform(15, 150), 'monthly': rng.uniform(2000, 25000),
+                  'yearly': rng.uniform(25000, 400000)}[from_type]
+        sheet["amounts"].append(round(amount, 2))
+        sheet["from_type"].append(from_type)
+        sheet["hours_per_week"].append(rng.choice([20, 32, 37.5, 40]))
+        sheet["weeks_per_year"].append(rng.choice([48, 50, 52]))
+    return sheet
+
+
+def per_row(client, sheet):
+    results = []
+    for amount, from_type, hours, weeks in zip(*sheet.values()):
+        response = client.post('/api/convert-income', json={
+            "amount": amount, "from_type": from_type, "hours_per_week": hours, "weeks_per_year": weeks})
+        results.append(response.get_json())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['BUDGET_DB_PATH'] = os.path.join(tmp, 'bench.db')
+        import budget_backend as backend
+
+        client = backend.app.test_client()
+        sheet = salary_sheet(args.rows)
+
+        started = time.perf_counter()
+        expected = per_row(client, sheet)
+        per_row_seconds = time.perf_counter() - started
+
+        timings = {}
+        for fmt in ('json', 'csv'):
+            started = time.perf_counter()
+            response = client.post(f'/api/convert-income/batch?format={fmt}', json=sheet)
+            body = response.get_data()
+            timings[fmt] = time.perf_counter() - started
+            if fmt == 'json':
+                columns = json.loads(body)
+
+        mismatches = sum(
+            any(row[period] != columns[period][i] for period in row)
+            for i, row in enumerate(expected))
+
+        print(f'{args.rows} rows, {mismatches} mismatches')
+        print(f'{"per-row":>12}: {per_row_seconds:8.3f} s  {args.rows / per_row_seconds:12.0f} rows/s')
+        for fmt, seconds in timings.items():
+            print(f'{"batch " + fmt:>12}: {seconds:8.3f} s  {args.rows / seconds:12.0f} rows/s  '
+                  f'x{per_row_seconds / seconds:.0f}')
+
+
+if __name__ == '__main__':
+    main()
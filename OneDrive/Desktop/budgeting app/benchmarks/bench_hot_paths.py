@@ -0,0 +1,179 @@
+"""Throughput benchmarks and regression check for the tax and budget hot paths
+
+Covers the pure tax/budget functions, the /api/calculate-budget request cycle
+through Flask's test client, and the SQLite-backed routes against a scratch
+database seeded with synthetic users. Save a baseline, then compare later
+runs against it; the run fails when any benchmark's throughput drops by more
+than the threshold.
+
+    python benchmarks/bench_hot_paths.py --save           # record a baseline
+    python benchmarks/bench_hot_paths.py                  # compare (exit 1 on regression)
+    python benchmarks/bench_hot_paths.py -k calculate --threshold 0.1
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+from load_test import unthrottled_rate_limits  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(APP_DIR, 'benchmarks', '.baseline.json')
+
+SEED_USERS = 200
+SEED_PROFILES_PER_USER = 50
+SEED_EXPENSES_PER_USER = 500
+PASSWORD = 'benchmark-password'
+
+
+def measure(fn, min_time, repeat):
+    """Best-of-repeat operations per second for fn"""
+    # Calibrate the loop count so each timed round lasts about min_time
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10 or loops >= 1 << 20:
+            break
+        loops *= 2
+    loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+
+    best = 0.0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = max(best, loops / (time.perf_counter() - started))
+    return best
+
+
+def seed(backend, database):
+    """Create synthetic users with budget history and expenses"""
+    rng = random.Random(0)
+    password_hash = backend.hash_password(PASSWORD)
+    with database.transaction() as conn:
+        conn.executemany(
+            'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+            ((f'user{i}', f'user{i}@example.com', password_hash) for i in range(SEED_USERS)))
+        conn.executemany('''
+            INSERT INTO budget_profiles (user_id, yearly_income, filing_status, county, housing_budget,
+                                         transportation_budget, food_budget, savings_budget)
+            VALUES (?, ?, 'single', 'Los Angeles', 1500, 700, 500, 900)
+        ''', ((user_id, rng.uniform(30000, 300000))
+              for user_id in range(1, SEED_USERS + 1) for _ in range(SEED_PROFILES_PER_USER)))
+        conn.executemany('''
+            INSERT INTO user_expenses (user_id, category, amount, description, date_added)
+            VALUES (?, ?, ?, NULL, ?)
+        ''', ((user_id, rng.choice(['housing', 'food', 'transportation', 'fun']), rng.uniform(5, 500),
+               f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00')
+              for user_id in range(1, SEED_USERS + 1) for _ in range(SEED_EXPENSES_PER_USER)))
+
+
+def build_benchmarks(backend):
+    rng = random.Random(1)
+    incomes = itertools.cycle([rng.uniform(20000, 600000) for _ in range(10007)])
+    counties = itertools.cycle(list(backend.tax_registry.get().county_rates) + ['Unknown'])
+    statuses = itertools.cycle(['single', 'married'])
+
+    anonymous = backend.app.test_client()
+    logged_in = backend.app.test_client()
+    logged_in.post('/api/login', json={"username": "user1", "password": PASSWORD})
+    login_client = backend.app.test_client()
+
+    def calculate_request(client):
+        def run():
+            client.post('/api/calculate-budget', json={
+                "yearly_income": next(incomes), "filing_status": next(statuses), "county": next(counties)})
+        return run
+
+    def uncached_budget():
+        backend.compute_budget(next(incomes), next(statuses), next(counties))
+
+    return {
+        'pure.calculate_federal_tax': lambda: backend.calculate_federal_tax(next(incomes), next(statuses)),
+        'pure.calculate_ca_state_tax': lambda: backend.calculate_ca_state_tax(next(incomes), next(statuses)),
+        'pure.calculate_budget_breakdown': lambda: backend.calculate_budget_breakdown(next(incomes) / 12),
+        'pure.get_housing_recommendations': lambda: backend.get_housing_recommendations(next(incomes) / 12, next(counties)),
+        'pure.compute_budget': uncached_budget,
+        'request.calculate_budget.anonymous': calculate_request(anonymous),
+        'request.calculate_budget.cached': lambda: anonymous.post('/api/calculate-budget', json={"yearly_income": 85000}),
+        'request.calculate_budget.logged_in': calculate_request(logged_in),
+        'request.counties': lambda: anonymous.get('/api/counties'),
+        'sqlite.login': lambda: login_client.post('/api/login', json={"username": "user7", "password": PASSWORD}),
+        'sqlite.user_profile': lambda: logged_in.get('/api/user-profile'),
+        'sqlite.expenses_page': lambda: logged_in.get('/api/expenses?limit=50'),
+        'sqlite.spending_report': lambda: logged_in.get('/api/reports/spending?months=12'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed fractional throughput drop before failing (default 0.2)')
+    parser.add_argument('-k', dest='pattern', help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timed round')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['BUDGET_DB_PATH'] = os.path.join(tmp.name, 'bench.db')
+    os.environ.setdefault('BUDGET_RATE_LIMITS', unthrottled_rate_limits())
+    sys.path.insert(0, APP_DIR)
+    import budget_backend
+    import database
+
+    database.configure()
+    budget_backend.init_db()
+    seed(budget_backend, database)
+
+    benchmarks = build_benchmarks(budget_backend)
+    if args.pattern:
+        benchmarks = {name: fn for name, fn in benchmarks.items() if args.pattern in name}
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    for name, fn in benchmarks.items():
+        ops = measure(fn, args.min_time, args.repeat)
+        results[name] = ops
+        line = f'{name:<40} {ops:>12,.0f} ops/s'
+        if name in baseline:
+            change = ops / baseline[name] - 1
+            line += f'   {change:+7.1%} vs baseline'
+            if change < -args.threshold:
+                regressions.append(name)
+                line += '   REGRESSION'
+        print(line)
+
+    tmp.cleanup()
+
+    if args.save:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f)
+        saved.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+    elif regressions:
+        print(f'{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
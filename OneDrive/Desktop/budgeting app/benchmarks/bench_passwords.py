@@ -0,0 +1,78 @@
+"""Logins per second at the configured password-hashing cost
+
+Times hash verification inline on one core, then through the process pool
+with concurrent callers, and reports verifications/sec overall and per pool
+worker. Configure the hasher with the same BUDGET_* variables as the app.
+
+    python benchmarks/bench_passwords.py
+    BUDGET_SCRYPT_N=32768 python benchmarks/bench_passwords.py --workers 1 2 4
+    BUDGET_PASSWORD_HASHER=pbkdf2 python benchmarks/bench_passwords.py
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import passwords  # noqa: E402
+
+PASSWORD = 'benchmark-password'
+
+
+def inline_rate(hasher, encoded, duration):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        hasher.verify(PASSWORD, encoded)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def pool_rate(hasher, encoded, workers, duration):
+    """Verifications/sec with 2 callers per pool worker keeping the queue full"""
+    pool = passwords.PasswordHasher(hasher, workers=workers)
+    pool.verify(PASSWORD, encoded)  # start the worker processes outside the timed window
+
+    counts = []
+    deadline = time.perf_counter() + duration
+
+    def caller():
+        count = 0
+        while time.perf_counter() < deadline:
+            pool.verify(PASSWORD, encoded)
+            count += 1
+        counts.append(count)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=caller) for _ in range(2 * workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--duration', type=float, default=3.0)
+    args = parser.parse_args()
+
+    hasher = passwords.hasher_from_env()
+    encoded = hasher.hash(PASSWORD)
+    print(f'hasher: {hasher.algorithm} {hasher.params()}')
+
+    rate = inline_rate(hasher, encoded, args.duration)
+    print(f'{"inline":>12}  {rate:10.1f} logins/s  {1000 / rate:8.2f} ms/login')
+    for workers in sorted(set(args.workers)):
+        rate = pool_rate(hasher, encoded, workers, args.duration)
+        print(f'{f"pool x{workers}":>12}  {rate:10.1f} logins/s  {rate / workers:8.1f} per core')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Profile-history query latency as budget_profiles grows
+
+Seeds a temporary database at increasing row counts and times the
+get_user_profile query with the schema at version 1 (no indexes) and at the
+latest migration. With the indexes the query should stay flat as the table
+grows.
+
+    python benchmarks/bench_profile_history.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+
+PROFILE_QUERY = '''
+    SELECT yearly_income, filing_status, county, housing_budget, transportation_budget,
+           food_budget, savings_budget, created_at
+    FROM budget_profiles
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT 10
+'''
+
+
+def seed(conn, start, stop, users):
+    rng = random.Random(start)
+    rows = (
+        (rng.randrange(1, users + 1), rng.uniform(20000, 400000), 'single', 'Los Angeles',
+         1500.0, 700.0, 500.0, 900.0, f'2024-01-01 00:00:{i % 60:02d}.{i:09d}')
+        for i in range(start, stop)
+    )
+    conn.executemany('''
+        INSERT INTO budget_profiles (user_id, yearly_income, filing_status, county, housing_budget,
+                                     transportation_budget, food_budget, savings_budget, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+
+
+def time_query(conn, users, repeat):
+    rng = random.Random(0)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(PROFILE_QUERY, (rng.randrange(1, users + 1),)).fetchall()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def run(version, sizes, users, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        migrations.migrate(conn, target=version)
+        seeded = 0
+        for size in sizes:
+            seed(conn, seeded, size, users)
+            seeded = size
+            conn.execute('ANALYZE')
+            print(f'  schema v{version}  {size:>9,} rows  {time_query(conn, users, repeat):10.1f} us/query')
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    print('Without indexes:')
+    run(1, sizes, args.users, max(1, args.repeat // 20))
+    print('With migrations applied:')
+    run(migrations.latest_version(), sizes, args.users, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
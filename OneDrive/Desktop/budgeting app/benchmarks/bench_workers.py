@@ -0,0 +1,70 @@
+"""Throughput scaling of the pre-forking launcher across worker counts
+
+Starts launcher.py on a scratch database with each worker count in turn,
+drives it with the same keep-alive clients as load_test.py and reports
+requests/sec, speedup over one worker and how long workers took to become
+ready after fork.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --duration 10
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+from load_test import load, unthrottled_rate_limits, wait_for  # noqa: E402
+
+READY = re.compile(r'worker \d+ ready in ([\d.]+) ms')
+
+
+def run(workers, port, concurrency, duration, db_path):
+    env = dict(os.environ, BUDGET_DB_PATH=db_path, BUDGET_RATE_LIMITS=unthrottled_rate_limits())
+    log_path = db_path + '.log'
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(
+            [sys.executable, 'launcher.py', '--workers', str(workers), '--port', str(port)],
+            cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log)
+        url = f'http://127.0.0.1:{port}'
+        try:
+            wait_for(url)
+            stats = load(url, concurrency, duration)
+        finally:
+            process.terminate()
+            process.wait()
+    with open(log_path) as log:
+        stats["ready_ms"] = [float(ms) for ms in READY.findall(log.read())]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    default_workers = sorted({1, 2, 4, os.cpu_count() or 1})
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5075)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cores')
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for offset, workers in enumerate(args.workers):
+            stats = run(workers, args.port + offset, args.concurrency, args.duration,
+                        os.path.join(tmp, f'workers{workers}.db'))
+            if not stats["requests"]:
+                print(f'{workers:>3} workers: no successful requests ({stats["errors"]} errors)')
+                continue
+            baseline = baseline or stats["rps"]
+            ready = max(stats["ready_ms"]) if stats["ready_ms"] else float('nan')
+            print(f'{workers:>3} workers: {stats["rps"]:9.1f} req/s   x{stats["rps"] / baseline:4.2f}   '
+                  f'p99 {stats["p99_ms"]:7.2f} ms   slowest worker ready {ready:6.1f} ms   '
+                  f'errors {stats["errors"]}')
+
+
+if __name__ == '__main__':
+    main()
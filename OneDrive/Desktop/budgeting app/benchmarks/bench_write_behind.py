@@ -0,0 +1,83 @@
+"""/api/calculate-budget latency for a logged-in user with and without write-behind
+
+Runs the route through Flask's test client against a scratch database,
+writing each budget snapshot inline or through the write-behind queue, and
+reports p50/p99/max latency for both. The two modes alternate in rounds so
+machine noise and database growth hit both alike. Every request uses a new
+income so each one records a snapshot.
+
+    python benchmarks/bench_write_behind.py --requests 5000 --rounds 10
+    BUDGET_DB_SYNCHRONOUS=FULL python benchmarks/bench_write_behind.py   # fsync every commit
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+from load_test import unthrottled_rate_limits  # noqa: E402
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(backend, client, requests, write_behind, rng):
+    backend.snapshot_writer.enabled = write_behind
+    latencies = []
+    for _ in range(requests):
+        body = {"yearly_income": rng.randrange(20000, 400000), "filing_status": "single",
+                "county": "Los Angeles"}
+        started = time.perf_counter()
+        client.post('/api/calculate-budget', json=body)
+        latencies.append(time.perf_counter() - started)
+    backend.snapshot_writer.flush()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000, help='requests per mode')
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['BUDGET_DB_PATH'] = os.path.join(tmp, 'bench.db')
+        os.environ.setdefault('BUDGET_HASH_WORKERS', '0')
+        os.environ.setdefault('BUDGET_RATE_LIMITS', unthrottled_rate_limits())
+        import budget_backend as backend
+
+        backend.init_db()
+        client = backend.app.test_client()
+        client.post('/api/register', json={"username": "bench", "email": "bench@example.com",
+                                           "password": "benchmark-password"})
+
+        rng = random.Random(0)
+        modes = (('inline', False), ('write-behind', True))
+        for _, enabled in modes:
+            run(backend, client, min(500, args.requests), enabled, rng)  # warm up
+
+        results = {name: [] for name, _ in modes}
+        per_round = max(1, args.requests // args.rounds)
+        for round_number in range(args.rounds):
+            for name, enabled in (modes if round_number % 2 == 0 else modes[::-1]):
+                results[name].extend(run(backend, client, per_round, enabled, rng))
+        for latencies in results.values():
+            latencies.sort()
+
+        for name, latencies in results.items():
+            print(f'{name:>13}: p50 {percentile(latencies, 0.5) * 1000:7.3f} ms   '
+                  f'p99 {percentile(latencies, 0.99) * 1000:7.3f} ms   max {latencies[-1] * 1000:7.3f} ms')
+        inline, queued = results['inline'], results['write-behind']
+        for label, fraction in (('p50', 0.5), ('p99', 0.99)):
+            drop = 1 - percentile(queued, fraction) / percentile(inline, fraction)
+            print(f'{label} reduced by {drop:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Compare the Flask dev server against the ASGI entry point under load
+
+Starts each server on a scratch database, drives it with concurrent
+keep-alive clients for a fixed duration and reports requests/sec and
+p50/p99 latency. Pass --url to load-test a server that is already running.
+
+    python benchmarks/load_test.py --concurrency 32 --duration 10
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'flask-dev': [sys.executable, '-c',
+                  'import sys, budget_backend as b; b.init_db(); '
+                  'b.app.run(host="127.0.0.1", port=int(sys.argv[1]))'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1',
+             '--log-level', 'warning', '--no-access-log', '--port'],
+}
+
+ENDPOINTS = [
+    ('POST', '/api/calculate-budget', lambda rng: {"yearly_income": rng.randrange(20000, 400000),
+                                                   "filing_status": rng.choice(['single', 'married']),
+                                                   "county": "Los Angeles"}),
+    ('POST', '/api/convert-income', lambda rng: {"amount": rng.randrange(15, 120), "from_type": "hourly"}),
+    ('GET', '/api/counties', None),
+]
+
+
+def unthrottled_rate_limits():
+    """BUDGET_RATE_LIMITS keeping every default limit, with rates no benchmark reaches
+
+    Limiting stays on, so its cost is part of every measurement.
+    """
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    from rate_limits import DEFAULT_LIMITS
+
+    rate_fields = ('ip_rate', 'ip_burst', 'user_rate', 'user_burst')
+    return json.dumps({
+        route: {field: 1e9 if field in rate_fields and value else value
+                for field, value in limit._asdict().items()}
+        for route, limit in DEFAULT_LIMITS.items()
+    })
+
+
+def wait_for(url, timeout=15):
+    parsed = urllib.parse.urlparse(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=1)
+            conn.request('GET', '/api/counties')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not start within {timeout}s')
+
+
+def client(url, stop_at, latencies, errors, seed):
+    parsed = urllib.parse.urlparse(url)
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=10)
+    while time.monotonic() < stop_at:
+        method, path, make_body = rng.choice(ENDPOINTS)
+        body = json.dumps(make_body(rng)) if make_body else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append('connection')
+            conn.close()
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def load(url, concurrency, duration):
+    latencies, errors = [], []
+    stop_at = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(url, stop_at, latencies, errors, i))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    if not latencies:
+        return {"requests": 0, "errors": len(errors)}
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def report(name, stats):
+    if not stats["requests"]:
+        print(f'{name:>10}: no successful requests ({stats["errors"]} errors)')
+        return
+    print(f'{name:>10}: {stats["rps"]:9.1f} req/s   p50 {stats["p50_ms"]:7.2f} ms   '
+          f'p99 {stats["p99_ms"]:7.2f} ms   errors {stats["errors"]}')
+
+
+def run_server(name, port, concurrency, duration, db_path):
+    env = dict(os.environ, BUDGET_DB_PATH=db_path, BUDGET_RATE_LIMITS=unthrottled_rate_limits())
+    process = subprocess.Popen(SERVERS[name] + [str(port)], cwd=APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_for(url)
+        return load(url, concurrency, duration)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='load-test this running server instead of starting both')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    if args.url:
+        report(args.url, load(args.url, args.concurrency, args.duration))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for offset, name in enumerate(SERVERS):
+            stats = run_server(name, args.port + offset, args.concurrency, args.duration,
+                               os.path.join(tmp, f'{name}.db'))
+            report(name, stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,166 +1,158 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 import sqlite3
-import hashlib
 import json
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
 import os
+import secrets
+
+import database
+import expenses
+import exports
+import goals
+import history_archive
+import income_conversion
+import passwords
+from rate_limits import RateLimiter
+from instrumentation import metrics
+import reports
+import scenarios
+import sessions
+from static_payloads import FilePayload, Payload, PayloadCache
+from tax_tables import FILING_STATUSES, TaxRegistry, UnknownTaxYear, status_key
+import write_behind
 
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'  # Change this in production
+# Sessions are stored server-side; the cookie only holds a random session id
+app.secret_key = os.environ.get('BUDGET_SECRET_KEY') or secrets.token_hex(32)
+session_store = sessions.SessionStore()
+app.session_interface = sessions.ServerSessionInterface(session_store)
+
 CORS(app)
+metrics.init_app(app)
+# Per-route token buckets and concurrency caps; see rate_limits.DEFAULT_LIMITS.
+# Installed after the metrics hooks so rejected requests are still measured
+rate_limiter = RateLimiter()
+rate_limiter.init_app(app)
 
-# California tax data - Enhanced with county-specific rates
-CA_TAX_BRACKETS = [
-    {"min": 0, "max": 10756, "rate": 0.01},
-    {"min": 10756, "max": 25499, "rate": 0.02},
-    {"min": 25499, "max": 40245, "rate": 0.04},
-    {"min": 40245, "max": 55866, "rate": 0.06},
-    {"min": 55866, "max": 70606, "rate": 0.08},
-    {"min": 70606, "max": 360659, "rate": 0.093},
-    {"min": 360659, "max": 432787, "rate": 0.103},
-    {"min": 432787, "max": 721314, "rate": 0.113},
-    {"min": 721314, "max": 1000000, "rate": 0.123},
-    {"min": 1000000, "max": float('inf'), "rate": 0.133}
-]
-
-# County-specific additional tax rates (example data - you can update with actual CSV data)
-COUNTY_TAX_RATES = {
-    "Los Angeles": 0.0025,
-    "San Francisco": 0.0038,
-    "San Diego": 0.0015,
-    "Orange": 0.0020,
-    "Sacramento": 0.0018,
-    "Riverside": 0.0012,
-    "Alameda": 0.0028,
-    "Santa Clara": 0.0035,
-    "Fresno": 0.0015,
-    "Kern": 0.0010,
-    "San Bernardino": 0.0012,
-    "Ventura": 0.0022,
-    "Contra Costa": 0.0025,
-    "Santa Barbara": 0.0020,
-    "Solano": 0.0018
-}
+BATCH_MAX_ROWS = 100000
+BUDGET_CACHE_SIZE = 4096
+
+# Tax brackets, county rates and FICA parameters per tax year, loaded from tax_data/
+tax_registry = TaxRegistry()
 
-CA_STANDARD_DEDUCTION_SINGLE = 5540
-CA_STANDARD_DEDUCTION_MARRIED = 11080
-FEDERAL_STANDARD_DEDUCTION_SINGLE = 14600
-FEDERAL_STANDARD_DEDUCTION_MARRIED = 29200
+# Budget snapshots are written in batches off the request path; BUDGET_WRITE_BEHIND=0 writes inline
+snapshot_writer = write_behind.WriteBehindQueue(
+    database.insert_budget_profiles,
+    enabled=os.environ.get('BUDGET_WRITE_BEHIND', '1').lower() not in ('0', 'false', 'no', 'off'),
+    name='budget-snapshot-writer',
+    # Rows are (user_id, ...); reads wait only for their own user's snapshots
+    key=itemgetter(0),
+    # Rows that can't be written at shutdown are kept next to the database
+    spill_path=lambda: database.get_pool().path + '.snapshot-spill'
+)
 
 def init_db():
     """Initialize the database"""
-    conn = sqlite3.connect('budget_app.db')
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create budget_profiles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS budget_profiles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            yearly_income REAL NOT NULL,
-            filing_status TEXT DEFAULT 'single',
-            county TEXT DEFAULT 'Los Angeles',
-            housing_budget REAL,
-            transportation_budget REAL,
-            food_budget REAL,
-            savings_budget REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Create user_expenses table for tracking actual expenses
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_expenses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            category TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    database.init_schema()
 
-def calculate_ca_state_tax(income, filing_status='single'):
+def calculate_ca_state_tax(income, filing_status='single', tax_year=None, tables=None):
     """Calculate California state income tax"""
-    deduction = CA_STANDARD_DEDUCTION_SINGLE if filing_status == 'single' else CA_STANDARD_DEDUCTION_MARRIED
+    tables = tables or tax_registry.get(tax_year)
+    deduction = tables.state_deductions[status_key(filing_status)]
     
     if income <= deduction:
         return 0
     
-    taxable_income = income - deduction
-    tax = 0
-    
-    for bracket in CA_TAX_BRACKETS:
-        if taxable_income <= bracket["min"]:
-            break
-        
-        bracket_income = min(taxable_income, bracket["max"]) - bracket["min"]
-        tax += bracket_income * bracket["rate"]
-    
-    return tax
+    return tables.engine.state.tax(income - deduction)
 
-def calculate_federal_tax(income, filing_status='single'):
+def calculate_federal_tax(income, filing_status='single', tax_year=None, tables=None):
     """Calculate federal income tax"""
-    federal_brackets_single = [
-        {"min": 0, "max": 11000, "rate": 0.10},
-        {"min": 11000, "max": 44725, "rate": 0.12},
-        {"min": 44725, "max": 95375, "rate": 0.22},
-        {"min": 95375, "max": 182050, "rate": 0.24},
-        {"min": 182050, "max": 231250, "rate": 0.32},
-        {"min": 231250, "max": 578125, "rate": 0.35},
-        {"min": 578125, "max": float('inf'), "rate": 0.37}
-    ]
-    
-    federal_brackets_married = [
-        {"min": 0, "max": 22000, "rate": 0.10},
-        {"min": 22000, "max": 89450, "rate": 0.12},
-        {"min": 89450, "max": 190750, "rate": 0.22},
-        {"min": 190750, "max": 364200, "rate": 0.24},
-        {"min": 364200, "max": 462500, "rate": 0.32},
-        {"min": 462500, "max": 693750, "rate": 0.35},
-        {"min": 693750, "max": float('inf'), "rate": 0.37}
-    ]
-    
-    brackets = federal_brackets_single if filing_status == 'single' else federal_brackets_married
-    deduction = FEDERAL_STANDARD_DEDUCTION_SINGLE if filing_status == 'single' else FEDERAL_STANDARD_DEDUCTION_MARRIED
+    tables = tables or tax_registry.get(tax_year)
+    status = status_key(filing_status)
+    deduction = tables.federal_deductions[status]
     
     if income <= deduction:
         return 0
     
-    taxable_income = income - deduction
-    tax = 0
-    
-    for bracket in brackets:
-        if taxable_income <= bracket["min"]:
-            break
-        
-        bracket_income = min(taxable_income, bracket["max"]) - bracket["min"]
-        tax += bracket_income * bracket["rate"]
-    
-    return tax
+    return tables.engine.federal[status].tax(income - deduction)
 
-def calculate_county_tax(income, county):
+def calculate_county_tax(income, county, tax_year=None, tables=None):
     """Calculate county-specific tax"""
-    county_rate = COUNTY_TAX_RATES.get(county, 0.0015)  # Default rate if county not found
+    tables = tables or tax_registry.get(tax_year)
+    county_rate = tables.county_rates.get(county, tables.default_county_rate)  # Default rate if county not found
     return income * county_rate
 
+BUDGET_TIPS = {
+    "housing": [
+        "Keep housing costs at 30% or less of your monthly income in most CA counties",
+        "In high-cost areas like SF and Silicon Valley, up to 35% may be necessary",
+        "Include utilities, parking, and renter's insurance in your housing budget",
+        "Research rent control laws in your city for tenant protections",
+        "Consider house-hacking or roommates to reduce costs",
+        "Look for apartments near public transit to save on transportation"
+    ],
+    "transportation": [
+        "California has excellent public transportation in major cities",
+        "Consider getting a monthly transit pass instead of driving daily",
+        "If you must drive, budget for gas, insurance, maintenance, and parking",
+        "Carpooling apps like Waze Carpool can reduce commute costs",
+        "Electric vehicles may qualify for CA rebates and HOV lane access",
+        "Bike-friendly cities like Davis and Berkeley can save money"
+    ],
+    "food": [
+        "California has year-round farmers markets with affordable fresh produce",
+        "Shop at stores like Trader Joe's, Costco, or ethnic grocery stores for savings",
+        "Meal prep on weekends to avoid expensive takeout during busy weekdays",
+        "Take advantage of happy hour specials and restaurant week deals",
+        "Consider CSA (Community Supported Agriculture) boxes for fresh, local produce",
+        "Generic brands can save 20-30% on grocery bills"
+    ],
+    "savings": [
+        "Build an emergency fund with 3-6 months expenses (CA cost of living is high)",
+        "Take advantage of employer 401(k) matching - it's free money",
+        "California has high taxes, so consider Roth IRA for tax-free growth",
+        "Look into high-yield savings accounts for emergency funds",
+        "Automate savings transfers to make it effortless",
+        "Consider investing in index funds for long-term growth"
+    ],
+    "utilities": [
+        "California has tiered electricity rates - conserve during peak hours",
+        "Solar panels may be cost-effective due to CA incentives and sunny weather",
+        "Use programmable thermostats to save on heating/cooling costs",
+        "Bundle internet, cable, and phone services for discounts",
+        "Consider time-of-use electricity plans if you can shift usage",
+        "Water conservation measures can significantly reduce bills"
+    ],
+    "healthcare": [
+        "California has Covered California marketplace for health insurance",
+        "Many employers offer HSA accounts - contribute pre-tax dollars",
+        "Use urgent care instead of ER for non-emergency situations",
+        "Look into community health centers for affordable care",
+        "Consider telehealth options for routine consultations",
+        "Preventive care is often covered 100% by insurance"
+    ],
+    "entertainment": [
+        "Take advantage of California's free outdoor activities - beaches, hiking, parks",
+        "Many museums have free days for residents",
+        "Look for happy hour deals and early bird specials at restaurants",
+        "Consider streaming services instead of cable TV",
+        "Free events like outdoor concerts and festivals are common",
+        "California libraries often have free events and classes"
+    ],
+    "general": [
+        "California's cost of living varies dramatically by region - adjust expectations",
+        "Track expenses for at least a month to understand spending patterns",
+        "Use apps like Mint or YNAB to automate budget tracking",
+        "Take advantage of California's strong consumer protection laws",
+        "Consider side hustles - CA has a large gig economy",
+        "Research local tax credits and deductions specific to California",
+        "Plan for seasonal expenses like earthquake insurance or fire evacuation costs"
+    ]
+}
+
 def calculate_budget_breakdown(monthly_income, income_level='medium'):
     """Calculate recommended budget breakdown based on income level"""
     if monthly_income < 3000:  # Low income - more conservative
@@ -197,25 +189,13 @@ def calculate_budget_breakdown(monthly_income, income_level='medium'):
             "miscellaneous": monthly_income * 0.05  # 5% for miscellaneous
         }
 
-def get_housing_recommendations(monthly_income, county):
+def get_housing_recommendations(monthly_income, county, tax_year=None, tables=None):
     """Get housing recommendations based on income and county"""
+    tables = tables or tax_registry.get(tax_year)
     recommended_housing = monthly_income * 0.30
     
     # County-specific adjustments
-    county_multipliers = {
-        "San Francisco": 1.4,
-        "Santa Clara": 1.3,
-        "San Mateo": 1.35,
-        "Alameda": 1.2,
-        "Orange": 1.15,
-        "Los Angeles": 1.1,
-        "San Diego": 1.1,
-        "Ventura": 1.05,
-        "Contra Costa": 1.1,
-        "Santa Barbara": 1.1
-    }
-    
-    multiplier = county_multipliers.get(county, 1.0)
+    multiplier = tables.housing_multipliers.get(county, tables.default_housing_multiplier)
     adjusted_housing = recommended_housing * multiplier
     
     return {
@@ -225,10 +205,10 @@ def get_housing_recommendations(monthly_income, county):
             "max": recommended_housing * 1.2
         },
         "county_factor": multiplier,
-        "tips": get_housing_tips(county, monthly_income)
+        "tips": get_housing_tips(county, monthly_income, tables=tables)
     }
 
-def get_housing_tips(county, monthly_income):
+def get_housing_tips(county, monthly_income, tax_year=None, tables=None):
     """Get county-specific housing tips"""
     base_tips = [
         "Include utilities, parking, and renter's insurance in your housing budget",
@@ -236,9 +216,8 @@ def get_housing_tips(county, monthly_income):
         "Look for apartments with good public transit access to save on transportation"
     ]
     
-    high_cost_counties = ["San Francisco", "Santa Clara", "San Mateo", "Alameda"]
-    
-    if county in high_cost_counties:
+    tables = tables or tax_registry.get(tax_year)
+    if county in tables.high_cost_counties:
         base_tips.extend([
             "Consider house-hacking or finding roommates to reduce costs",
             "Look into suburbs with good transit connections to downtown",
@@ -254,9 +233,39 @@ def get_housing_tips(county, monthly_income):
     
     return base_tips
 
+def hash_password(password):
+    """Salted KDF hash of a password for storage; runs in the hashing process pool"""
+    return passwords.get_hasher().hash(password)
+
+def authenticate(username, password):
+    """(id, username) when the password matches, else None
+
+    Legacy sha256 hashes and hashes made with an outdated cost are replaced
+    with one from the configured hasher once the password has been verified.
+    """
+    hasher = passwords.get_hasher()
+    user = database.find_user_for_login(username)
+    if not hasher.verify(password, user[2] if user else None):
+        return None
+    if hasher.needs_rehash(user[2]):
+        database.update_password_hash(user[0], hasher.hash(password))
+    return user[0], user[1]
+
+FRONTEND_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budget_frontend.html')
+
+def load_frontend(path=FRONTEND_PATH):
+    with open(path, 'rb') as f:
+        # Browsers revalidate on every load; unchanged pages are a 304
+        return Payload(f.read(), 'text/html; charset=utf-8', 'no-cache')
+
+# Responses serialized and compressed once, served with ETags; the UI is
+# rebuilt when the file changes, so a redeploy shows up within a second
+frontend_payload = FilePayload(FRONTEND_PATH, load_frontend)
+budget_tips_payload = Payload.json(BUDGET_TIPS, 'public, max-age=86400')
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return frontend_payload.get().response(request)
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -269,18 +278,13 @@ def register():
         return jsonify({"error": "Missing required fields"}), 400
     
     # Hash password
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    try:
+        password_hash = hash_password(password)
+    except passwords.HasherBusy:
+        return jsonify({"error": "Server busy, try again"}), 503
     
     try:
-        conn = sqlite3.connect('budget_app.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO users (username, email, password_hash)
-            VALUES (?, ?, ?)
-        ''', (username, email, password_hash))
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
+        user_id = database.create_user(username, email, password_hash)
         
         session['user_id'] = user_id
         session['username'] = username
@@ -299,17 +303,10 @@ def login():
     if not all([username, password]):
         return jsonify({"error": "Missing username or password"}), 400
     
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    conn = sqlite3.connect('budget_app.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, username FROM users 
-        WHERE username = ? AND password_hash = ?
-    ''', (username, password_hash))
-    
-    user = cursor.fetchone()
-    conn.close()
+    try:
+        user = authenticate(username, password)
+    except passwords.HasherBusy:
+        return jsonify({"error": "Server busy, try again"}), 503
     
     if user:
         session['user_id'] = user[0]
@@ -323,30 +320,26 @@ def logout():
     session.clear()
     return jsonify({"success": True, "message": "Logged out successfully"})
 
-@app.route('/api/calculate-budget', methods=['POST'])
-def calculate_budget():
-    data = request.get_json()
-    yearly_income = float(data.get('yearly_income', 0))
-    filing_status = data.get('filing_status', 'single')
-    county = data.get('county', 'Los Angeles')
-    
-    if yearly_income <= 0:
-        return jsonify({"error": "Invalid income amount"}), 400
-    
-    # Calculate taxes
-    federal_tax = calculate_federal_tax(yearly_income, filing_status)
-    state_tax = calculate_ca_state_tax(yearly_income, filing_status)
-    county_tax = calculate_county_tax(yearly_income, county)
-    
-    # Social Security and Medicare (FICA)
-    social_security_tax = min(yearly_income * 0.062, 160200 * 0.062)  # 6.2% up to wage base
-    medicare_tax = yearly_income * 0.0145  # 1.45%
+def calculate_fica_taxes(yearly_income, filing_status='single', tax_year=None, tables=None):
+    """Calculate Social Security and Medicare taxes"""
+    tables = tables or tax_registry.get(tax_year)
+    social_security_tax = min(yearly_income * tables.social_security_rate, tables.social_security_wage_base * tables.social_security_rate)  # 6.2% up to wage base
+    medicare_tax = yearly_income * tables.medicare_rate  # 1.45%
     
     # Additional Medicare tax for high earners
-    if yearly_income > (200000 if filing_status == 'single' else 250000):
-        additional_medicare = (yearly_income - (200000 if filing_status == 'single' else 250000)) * 0.009
+    threshold = tables.additional_medicare_thresholds[status_key(filing_status)]
+    if yearly_income > threshold:
+        additional_medicare = (yearly_income - threshold) * tables.additional_medicare_rate
         medicare_tax += additional_medicare
     
+    return social_security_tax, medicare_tax
+
+def build_budget_result(yearly_income, filing_status, county, tables, federal_tax, state_tax,
+                        county_tax, social_security_tax, medicare_tax):
+    """Build the calculate-budget response from already computed taxes
+    
+    Returns the response dict and the unrounded budget breakdown.
+    """
     total_taxes = federal_tax + state_tax + county_tax + social_security_tax + medicare_tax
     net_income = yearly_income - total_taxes
     monthly_net_income = net_income / 12
@@ -358,22 +351,9 @@ def calculate_budget():
     budget_breakdown = calculate_budget_breakdown(monthly_net_income, income_level)
     
     # Get housing recommendations
-    housing_recommendations = get_housing_recommendations(monthly_net_income, county)
+    housing_recommendations = get_housing_recommendations(monthly_net_income, county, tables=tables)
     
-    # Save to database if user is logged in
-    if 'user_id' in session:
-        conn = sqlite3.connect('budget_app.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO budget_profiles (user_id, yearly_income, filing_status, county, housing_budget, transportation_budget, food_budget, savings_budget)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], yearly_income, filing_status, county, 
-              budget_breakdown['housing'], budget_breakdown['transportation'], 
-              budget_breakdown['food'], budget_breakdown['savings']))
-        conn.commit()
-        conn.close()
-    
-    return jsonify({
+    result = {
         "yearly_income": yearly_income,
         "federal_tax": round(federal_tax, 2),
         "state_tax": round(state_tax, 2),
@@ -388,92 +368,192 @@ def calculate_budget():
         "tax_rate": round((total_taxes / yearly_income) * 100, 2),
         "income_level": income_level,
         "filing_status": filing_status,
-        "county": county
-    })
+        "county": county,
+        "tax_year": tables.tax_year
+    }
+    return result, budget_breakdown
 
-@app.route('/api/budget-tips', methods=['GET'])
-def get_budget_tips():
-    tips = {
-        "housing": [
-            "Keep housing costs at 30% or less of your monthly income in most CA counties",
-            "In high-cost areas like SF and Silicon Valley, up to 35% may be necessary",
-            "Include utilities, parking, and renter's insurance in your housing budget",
-            "Research rent control laws in your city for tenant protections",
-            "Consider house-hacking or roommates to reduce costs",
-            "Look for apartments near public transit to save on transportation"
-        ],
-        "transportation": [
-            "California has excellent public transportation in major cities",
-            "Consider getting a monthly transit pass instead of driving daily",
-            "If you must drive, budget for gas, insurance, maintenance, and parking",
-            "Carpooling apps like Waze Carpool can reduce commute costs",
-            "Electric vehicles may qualify for CA rebates and HOV lane access",
-            "Bike-friendly cities like Davis and Berkeley can save money"
-        ],
-        "food": [
-            "California has year-round farmers markets with affordable fresh produce",
-            "Shop at stores like Trader Joe's, Costco, or ethnic grocery stores for savings",
-            "Meal prep on weekends to avoid expensive takeout during busy weekdays",
-            "Take advantage of happy hour specials and restaurant week deals",
-            "Consider CSA (Community Supported Agriculture) boxes for fresh, local produce",
-            "Generic brands can save 20-30% on grocery bills"
-        ],
-        "savings": [
-            "Build an emergency fund with 3-6 months expenses (CA cost of living is high)",
-            "Take advantage of employer 401(k) matching - it's free money",
-            "California has high taxes, so consider Roth IRA for tax-free growth",
-            "Look into high-yield savings accounts for emergency funds",
-            "Automate savings transfers to make it effortless",
-            "Consider investing in index funds for long-term growth"
-        ],
-        "utilities": [
-            "California has tiered electricity rates - conserve during peak hours",
-            "Solar panels may be cost-effective due to CA incentives and sunny weather",
-            "Use programmable thermostats to save on heating/cooling costs",
-            "Bundle internet, cable, and phone services for discounts",
-            "Consider time-of-use electricity plans if you can shift usage",
-            "Water conservation measures can significantly reduce bills"
-        ],
-        "healthcare": [
-            "California has Covered California marketplace for health insurance",
-            "Many employers offer HSA accounts - contribute pre-tax dollars",
-            "Use urgent care instead of ER for non-emergency situations",
-            "Look into community health centers for affordable care",
-            "Consider telehealth options for routine consultations",
-            "Preventive care is often covered 100% by insurance"
-        ],
-        "entertainment": [
-            "Take advantage of California's free outdoor activities - beaches, hiking, parks",
-            "Many museums have free days for residents",
-            "Look for happy hour deals and early bird specials at restaurants",
-            "Consider streaming services instead of cable TV",
-            "Free events like outdoor concerts and festivals are common",
-            "California libraries often have free events and classes"
-        ],
-        "general": [
-            "California's cost of living varies dramatically by region - adjust expectations",
-            "Track expenses for at least a month to understand spending patterns",
-            "Use apps like Mint or YNAB to automate budget tracking",
-            "Take advantage of California's strong consumer protection laws",
-            "Consider side hustles - CA has a large gig economy",
-            "Research local tax credits and deductions specific to California",
-            "Plan for seasonal expenses like earthquake insurance or fire evacuation costs"
-        ]
+def compute_budget(yearly_income, filing_status='single', county='Los Angeles', tax_year=None, tables=None):
+    """Calculate taxes, budget breakdown and housing recommendations for one income
+    
+    The tax tables are resolved once and passed down, so a reload part way
+    through can't mix tables from two loads.
+    """
+    tables = tables or tax_registry.get(tax_year)
+    federal_tax = calculate_federal_tax(yearly_income, filing_status, tables=tables)
+    state_tax = calculate_ca_state_tax(yearly_income, filing_status, tables=tables)
+    county_tax = calculate_county_tax(yearly_income, county, tables=tables)
+    social_security_tax, medicare_tax = calculate_fica_taxes(yearly_income, filing_status, tables=tables)
+    
+    return build_budget_result(yearly_income, filing_status, county, tables, federal_tax, state_tax,
+                               county_tax, social_security_tax, medicare_tax)
+
+def compute_budget_batch(rows, tax_year=None):
+    """Calculate budgets for many incomes with one vectorized tax pass"""
+    tables = tax_registry.get(tax_year)
+    incomes = [row[0] for row in rows]
+    filing_statuses = [row[1] for row in rows]
+    counties = [row[2] for row in rows]
+    taxes = tables.engine.calculate(incomes, filing_statuses, counties)
+    
+    results = []
+    for i, (yearly_income, filing_status, county) in enumerate(rows):
+        result, _ = build_budget_result(
+            yearly_income, filing_status, county, tables,
+            float(taxes["federal_tax"][i]), float(taxes["state_tax"][i]),
+            float(taxes["county_tax"][i]), float(taxes["social_security_tax"][i]),
+            float(taxes["medicare_tax"][i])
+        )
+        results.append(result)
+    return results
+
+def invalid_budget_field(filing_status, county):
+    """Name of the first non-string filing_status/county field, or None
+    
+    Both come straight from JSON and key the budget cache, so lists or
+    objects must be rejected before they reach it.
+    """
+    for name, value in (('filing_status', filing_status), ('county', county)):
+        if not isinstance(value, str):
+            return name
+    return None
+
+@lru_cache(maxsize=BUDGET_CACHE_SIZE)
+def cached_budget(yearly_income, filing_status, county, tables):
+    """Memoized compute_budget; callers must not mutate the returned dicts
+    
+    Keyed on the TaxTables object itself, so a budget computed from tables
+    that were replaced mid-request is never served for the new ones.
+    """
+    return compute_budget(yearly_income, filing_status, county, tables=tables)
+
+@tax_registry.on_reload
+def clear_budget_cache():
+    """Drop budgets cached from the previous tax tables"""
+    cached_budget.cache_clear()
+
+def reload_tax_tables():
+    """Reload the tax tables from disk and drop budgets cached from the old ones"""
+    tax_registry.reload()
+
+@app.before_request
+def check_tax_tables():
+    tax_registry.reload_if_changed()
+
+def budget_cache_stats():
+    info = cached_budget.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0
     }
+
+@app.route('/api/calculate-budget', methods=['POST'])
+def calculate_budget():
+    with metrics.stage('parse'):
+        data = request.get_json()
+        yearly_income = float(data.get('yearly_income', 0))
+        filing_status = data.get('filing_status', 'single')
+        county = data.get('county', 'Los Angeles')
+    
+    if yearly_income <= 0:
+        return jsonify({"error": "Invalid income amount"}), 400
+    invalid = invalid_budget_field(filing_status, county)
+    if invalid:
+        return jsonify({"error": f"Invalid {invalid}"}), 400
+    
+    try:
+        tables = tax_registry.get(data.get('tax_year'))
+    except UnknownTaxYear as e:
+        return jsonify({"error": str(e)}), 400
+    
+    with metrics.stage('compute'):
+        result, budget_breakdown = cached_budget(yearly_income, filing_status, county, tables)
     
-    return jsonify(tips)
+    # Save to database if user is logged in
+    if 'user_id' in session:
+        snapshot_writer.submit((session['user_id'], yearly_income, filing_status, county, budget_breakdown))
+    
+    with metrics.stage('serialize'):
+        return jsonify(result)
 
-@app.route('/api/convert-income', methods=['POST'])
-def convert_income():
+@app.route('/api/calculate-budget/batch', methods=['POST'])
+def calculate_budget_batch():
+    """Calculate budgets for a list of {yearly_income, filing_status, county} rows"""
     data = request.get_json()
-    amount = float(data.get('amount', 0))
-    from_type = data.get('from_type')  # 'hourly', 'monthly', 'yearly'
-    hours_per_week = float(data.get('hours_per_week', 40))
-    weeks_per_year = float(data.get('weeks_per_year', 52))
+    tax_year = request.args.get('tax_year')
+    if isinstance(data, dict):
+        tax_year = data.get('tax_year', tax_year)
+        data = data.get('rows')
+    
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Expected a non-empty list of rows"}), 400
+    if len(data) > BATCH_MAX_ROWS:
+        return jsonify({"error": f"Batch is limited to {BATCH_MAX_ROWS} rows"}), 400
+    
+    rows = []
+    for index, row in enumerate(data):
+        try:
+            yearly_income = float(row.get('yearly_income', 0))
+        except (AttributeError, TypeError, ValueError):
+            yearly_income = 0
+        if yearly_income <= 0:
+            return jsonify({"error": "Invalid income amount", "row": index}), 400
+        filing_status, county = row.get('filing_status', 'single'), row.get('county', 'Los Angeles')
+        invalid = invalid_budget_field(filing_status, county)
+        if invalid:
+            return jsonify({"error": f"Invalid {invalid}", "row": index}), 400
+        rows.append((yearly_income, filing_status, county))
     
-    if amount <= 0:
-        return jsonify({"error": "Invalid amount"}), 400
+    try:
+        with metrics.stage('compute'):
+            results = compute_budget_batch(rows, tax_year)
+    except UnknownTaxYear as e:
+        return jsonify({"error": str(e)}), 400
     
+    with metrics.stage('serialize'):
+        return jsonify({"results": results})
+
+@app.route('/api/scenarios', methods=['POST'])
+def run_scenarios():
+    """Evaluate an income x county x filing-status grid in one vectorized pass"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    try:
+        tables = tax_registry.get(data.get('tax_year'))
+    except UnknownTaxYear as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        incomes, counties, filing_statuses, fields = scenarios.scenario_axes(data, tables)
+        results = scenarios.run_scenarios(tables.engine, incomes, counties, filing_statuses, fields)
+    except scenarios.ScenarioError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "tax_year": tables.tax_year,
+        "incomes": incomes.tolist(),
+        "counties": counties,
+        "filing_statuses": filing_statuses,
+        "fields": fields,
+        "results": results
+    })
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters for the budget computation cache, plus the snapshot writer's counters"""
+    return jsonify({**budget_cache_stats(), "snapshot_writer": snapshot_writer.stats()})
+
+@app.route('/api/budget-tips', methods=['GET'])
+def get_budget_tips():
+    return budget_tips_payload.response(request)
+
+def convert_income_amount(amount, from_type, hours_per_week=40, weeks_per_year=52):
+    """Convert an income amount to every pay period; returns None for an unknown from_type"""
     # Convert everything to yearly first
     if from_type == 'hourly':
         yearly = amount * hours_per_week * weeks_per_year
@@ -482,7 +562,7 @@ def convert_income():
     elif from_type == 'yearly':
         yearly = amount
     else:
-        return jsonify({"error": "Invalid income type"}), 400
+        return None
     
     # Calculate other formats
     monthly = yearly / 12
@@ -490,22 +570,111 @@ def convert_income():
     weekly = yearly / weeks_per_year
     biweekly = yearly / 26  # 26 pay periods per year
     
-    return jsonify({
+    return {
         "yearly": round(yearly, 2),
         "monthly": round(monthly, 2),
         "hourly": round(hourly, 2),
         "weekly": round(weekly, 2),
         "biweekly": round(biweekly, 2)
-    })
+    }
+
+@app.route('/api/convert-income', methods=['POST'])
+def convert_income():
+    data = request.get_json()
+    amount = float(data.get('amount', 0))
+    from_type = data.get('from_type')  # 'hourly', 'monthly', 'yearly'
+    hours_per_week = float(data.get('hours_per_week', 40))
+    weeks_per_year = float(data.get('weeks_per_year', 52))
+    
+    if amount <= 0:
+        return jsonify({"error": "Invalid amount"}), 400
+    
+    conversions = convert_income_amount(amount, from_type, hours_per_week, weeks_per_year)
+    if conversions is None:
+        return jsonify({"error": "Invalid income type"}), 400
+    
+    return jsonify(conversions)
+
+@app.route('/api/convert-income/batch', methods=['POST'])
+def convert_income_batch():
+    """Convert whole columns of amounts at once; streams columnar JSON or CSV
+
+    Accepts a JSON object of columns (amounts plus from_type, hours_per_week
+    and weeks_per_year as lists or single values) or a CSV upload with those
+    columns. ?format=csv (or Accept: text/csv) selects CSV output.
+    """
+    try:
+        with metrics.stage('parse'):
+            if request.mimetype == 'text/csv':
+                columns = income_conversion.columns_from_csv(request.stream)
+            else:
+                columns = income_conversion.columns_from_json(request.get_json(silent=True))
+        with metrics.stage('compute'):
+            results = income_conversion.convert_columns(*columns)
+    except income_conversion.ConversionError as e:
+        return jsonify({"error": str(e), "row": e.row}), 400
+    
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if request.accept_mimetypes.best_match(['application/json', 'text/csv']) == 'text/csv' else 'json'
+    if fmt == 'csv':
+        return Response(income_conversion.stream_csv(columns[0], columns[1], results), mimetype='text/csv')
+    if fmt != 'json':
+        return jsonify({"error": "Unsupported format; use json or csv"}), 400
+    return Response(income_conversion.stream_json(results), mimetype='application/json')
+
+def get_county_list(tax_year=None):
+    """List of California counties with tax rates"""
+    return [
+        {"name": county, "tax_rate": rate} 
+        for county, rate in tax_registry.get(tax_year).county_rates.items()
+    ]
+
+def build_county_payload(tax_year):
+    return Payload.json(get_county_list(tax_year), 'public, max-age=3600')
+
+# One payload per tax year, rebuilt after the tax tables reload
+county_payloads = PayloadCache(build_county_payload)
+tax_registry.on_reload(county_payloads.clear)
 
 @app.route('/api/counties', methods=['GET'])
 def get_counties():
     """Get list of California counties with tax rates"""
-    counties = [
-        {"name": county, "tax_rate": rate} 
-        for county, rate in COUNTY_TAX_RATES.items()
-    ]
-    return jsonify(counties)
+    try:
+        tax_year = tax_registry.get(request.args.get('tax_year')).tax_year
+    except UnknownTaxYear as e:
+        return jsonify({"error": str(e)}), 400
+    return county_payloads.get(tax_year).response(request)
+
+def get_tax_curves(tax_year=None):
+    """Total tax as a piecewise-linear function of income for every filing status
+    
+    For an income x in [breakpoints[i], breakpoints[i+1]) in county c:
+    tax = taxes[i] + (x - breakpoints[i]) * slopes[i] + x * counties[c]
+    """
+    tables = tax_registry.get(tax_year)
+    return {
+        "tax_year": tables.tax_year,
+        "filing_statuses": {status: tables.engine.tax_curve(status) for status in FILING_STATUSES},
+        "counties": dict(tables.county_rates),
+        "default_county_rate": tables.default_county_rate
+    }
+
+def build_tax_curve_payload(tax_year):
+    return Payload.json(get_tax_curves(tax_year), 'public, max-age=3600')
+
+# Built once per tax year and table load, like the county list
+tax_curve_payloads = PayloadCache(build_tax_curve_payload)
+tax_registry.on_reload(tax_curve_payloads.clear)
+
+@app.route('/api/tax-curves', methods=['GET'])
+def get_tax_curve_table():
+    """Get precomputed tax curves so clients can interpolate net income locally"""
+    try:
+        tax_year = tax_registry.get(request.args.get('tax_year')).tax_year
+    except UnknownTaxYear as e:
+        return jsonify({"error": str(e)}), 400
+    return tax_curve_payloads.get(tax_year).response(request)
 
 @app.route('/api/user-profile', methods=['GET'])
 def get_user_profile():
@@ -513,21 +682,9 @@ def get_user_profile():
     if 'user_id' not in session:
         return jsonify({"error": "Not logged in"}), 401
     
-    conn = sqlite3.connect('budget_app.db')
-    cursor = conn.cursor()
-    
-    # Get recent budget profiles
-    cursor.execute('''
-        SELECT yearly_income, filing_status, county, housing_budget, transportation_budget, 
-               food_budget, savings_budget, created_at
-        FROM budget_profiles 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT 10
-    ''', (session['user_id'],))
-    
-    profiles = cursor.fetchall()
-    conn.close()
+    # Get recent budget profiles, including any still queued
+    snapshot_writer.flush(session['user_id'])
+    profiles = database.recent_budget_profiles(session['user_id'])
     
     profile_data = []
     for profile in profiles:
@@ -547,9 +704,231 @@ def get_user_profile():
         "profiles": profile_data
     })
 
+@app.route('/api/user-profile/history', methods=['GET'])
+def get_user_profile_history():
+    """Full budget history as columnar arrays, including compacted snapshots"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    snapshot_writer.flush(session['user_id'])
+    try:
+        history = history_archive.history(
+            session['user_id'],
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            max_points=request.args.get('max_points', type=int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(history)
+
+@app.route('/api/expenses', methods=['GET'])
+def list_expenses():
+    """Newest-first expenses, paginated with the opaque next_cursor"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    try:
+        items, next_cursor = expenses.list_expenses(
+            session['user_id'],
+            limit=request.args.get('limit', expenses.DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor'),
+            category=request.args.get('category'),
+            since=request.args.get('since'),
+            until=request.args.get('until')
+        )
+    except expenses.ExpenseError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"expenses": items, "next_cursor": next_cursor})
+
+@app.route('/api/expenses', methods=['POST'])
+def create_expense():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    try:
+        expense = expenses.create_expense(session['user_id'], request.get_json() or {})
+    except expenses.ExpenseError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(expense), 201
+
+@app.route('/api/expenses/<int:expense_id>', methods=['GET'])
+def get_expense(expense_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    expense = expenses.get_expense(session['user_id'], expense_id)
+    if expense is None:
+        return jsonify({"error": "Expense not found"}), 404
+    return jsonify(expense)
+
+@app.route('/api/expenses/<int:expense_id>', methods=['PUT'])
+def update_expense(expense_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    try:
+        expense = expenses.update_expense(session['user_id'], expense_id, request.get_json() or {})
+    except expenses.ExpenseError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if expense is None:
+        return jsonify({"error": "Expense not found"}), 404
+    return jsonify(expense)
+
+@app.route('/api/expenses/<int:expense_id>', methods=['DELETE'])
+def delete_expense(expense_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    if not expenses.delete_expense(session['user_id'], expense_id):
+        return jsonify({"error": "Expense not found"}), 404
+    return jsonify({"success": True})
+
+@app.route('/api/expenses/import', methods=['POST'])
+def import_expenses():
+    """Bulk import a CSV or JSON-lines upload, parsed as it streams in"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    fmt = expenses.import_format(request.args.get('format'), request.content_type)
+    if fmt is None:
+        return jsonify({"error": "Unsupported import format; use CSV or JSON lines"}), 400
+    
+    try:
+        imported = expenses.import_expenses(session['user_id'], request.stream, fmt)
+    except expenses.ExpenseError as e:
+        return jsonify({"error": str(e), "line": e.line}), 400
+    
+    return jsonify({"success": True, "imported": imported})
+
+@app.route('/api/goals', methods=['GET'])
+def list_goals():
+    """Savings goals with months-to-goal at their current contribution"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    snapshot_writer.flush(session['user_id'])
+    user_goals = goals.list_goals(session['user_id'])
+    return jsonify({"goals": goals.summarize(user_goals, goals.default_contribution(session['user_id']))})
+
+@app.route('/api/goals', methods=['POST'])
+def create_goal():
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    try:
+        goal = goals.create_goal(session['user_id'], request.get_json() or {})
+    except goals.GoalError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(goal), 201
+
+@app.route('/api/goals/<int:goal_id>', methods=['GET'])
+def get_goal(goal_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    goal = goals.get_goal(session['user_id'], goal_id)
+    if goal is None:
+        return jsonify({"error": "Goal not found"}), 404
+    return jsonify(goal)
+
+@app.route('/api/goals/<int:goal_id>', methods=['PUT'])
+def update_goal(goal_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    try:
+        goal = goals.update_goal(session['user_id'], goal_id, request.get_json() or {})
+    except goals.GoalError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    if goal is None:
+        return jsonify({"error": "Goal not found"}), 404
+    return jsonify(goal)
+
+@app.route('/api/goals/<int:goal_id>', methods=['DELETE'])
+def delete_goal(goal_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    if not goals.delete_goal(session['user_id'], goal_id):
+        return jsonify({"error": "Goal not found"}), 404
+    return jsonify({"success": True})
+
+@app.route('/api/goals/<int:goal_id>/projection', methods=['GET'])
+def get_goal_projection(goal_id):
+    """Months-to-goal, compound-growth trajectory and Monte Carlo ranges for a goal"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    goal = goals.get_goal(session['user_id'], goal_id)
+    if goal is None:
+        return jsonify({"error": "Goal not found"}), 404
+    
+    snapshot_writer.flush(session['user_id'])
+    contribution = goals.contribution_for(goal, goals.default_contribution(session['user_id']))
+    try:
+        projection = goals.project(
+            goal, contribution,
+            paths=request.args.get('paths', goals.DEFAULT_PATHS, type=int),
+            horizon=request.args.get('horizon_months', type=int),
+            seed=request.args.get('seed', type=int)
+        )
+    except goals.GoalError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify(projection)
+
+@app.route('/api/reports/spending', methods=['GET'])
+def get_spending_report():
+    """Monthly spending by category against the latest budget profile"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    months = request.args.get('months', reports.DEFAULT_REPORT_MONTHS, type=int)
+    snapshot_writer.flush(session['user_id'])
+    return jsonify(reports.spending_report(session['user_id'], months))
+
+@app.route('/api/export/<dataset>', methods=['GET'])
+def export_data(dataset):
+    """Stream budgets or expenses as CSV or JSON lines"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    fmt = request.args.get('format', 'csv')
+    if dataset not in exports.EXPORT_DATASETS:
+        return jsonify({"error": "Unknown dataset"}), 404
+    if fmt not in exports.EXPORT_FORMATS:
+        return jsonify({"error": "Unsupported export format; use csv or jsonl"}), 400
+    
+    snapshot_writer.flush(session['user_id'])
+    filename = f"{dataset}.{fmt}"
+    return Response(
+        stream_with_context(exports.stream_export(session['user_id'], dataset, fmt)),
+        mimetype=exports.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.route('/api/export/backup', methods=['GET'])
+def backup_data():
+    """Stream every budget profile and expense as one JSON-lines backup"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    
+    snapshot_writer.flush(session['user_id'])
+    return Response(
+        stream_with_context(exports.stream_backup(session['user_id'])),
+        mimetype=exports.EXPORT_FORMATS['jsonl'],
+        headers={"Content-Disposition": "attachment; filename=budget_backup.jsonl"}
+    )
+
 if __name__ == '__main__':
-    # Create templates directory if it doesn't exist
-    os.makedirs('templates', exist_ok=True)
+    # Development server; use launcher.py for a multi-process deployment
     
     # Initialize database
     init_db()
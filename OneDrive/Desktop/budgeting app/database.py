@@ -0,0 +1,329 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import migrations
+from instrumentation import metrics
+
+# Absolute path so the database doesn't depend on the working directory;
+# override with the BUDGET_DB_PATH environment variable or configure()
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budget_app.db')
+DEFAULT_POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+# NORMAL is durable against crashes of this process in WAL mode; FULL also fsyncs every commit
+SYNCHRONOUS = os.environ.get('BUDGET_DB_SYNCHRONOUS', 'NORMAL').upper()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor adding the time spent inside SQLite to its connection's busy total"""
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.connection.busy += time.perf_counter() - started
+
+    def execute(self, *args):
+        return self._timed(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(super().executemany, *args)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection used when metrics are enabled, so db_execute covers only SQLite calls
+
+    Rows are stepped lazily, so a query's time is spread over execute and
+    the fetches that follow; both count. The caller's own work between them,
+    such as serializing a streamed export, does not.
+    """
+
+    busy = 0.0
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute does not go through cursor(), so route it there
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.busy += time.perf_counter() - started
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections in WAL mode"""
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE, timeout=BUSY_TIMEOUT_MS / 1000):
+        self.path = os.path.abspath(path)
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=TimedConnection if metrics.enabled else sqlite3.Connection
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={SYNCHRONOUS}')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(path=None, size=DEFAULT_POOL_SIZE):
+    """Point the data-access layer at a database file, replacing the current pool"""
+    global _pool
+    path = path or os.environ.get('BUDGET_DB_PATH', DEFAULT_DB_PATH)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(path, size)
+    return _pool
+
+
+def get_pool():
+    if _pool is None:
+        configure()
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for read queries"""
+    pool = get_pool()
+    with metrics.stage('db_connect'):
+        conn = pool.acquire()
+    if not metrics.enabled:
+        try:
+            yield conn
+        finally:
+            pool.release(conn)
+        return
+
+    conn.busy = 0.0
+    try:
+        yield conn
+    finally:
+        metrics.observe_stage('db_execute', conn.busy)
+        pool.release(conn)
+
+
+@contextmanager
+def transaction():
+    """Borrow a pooled connection and commit on success, roll back on error"""
+    with connection() as conn:
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init_schema():
+    """Create or upgrade the application schema; returns the applied migration versions"""
+    with connection() as conn:
+        return migrations.migrate(conn)
+
+
+# Repository functions used by the routes
+
+def create_user(username, email, password_hash):
+    """Insert a user and return the new id; raises sqlite3.IntegrityError on duplicates"""
+    with transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO users (username, email, password_hash)
+            VALUES (?, ?, ?)
+        ''', (username, email, password_hash))
+        return cursor.lastrowid
+
+
+def find_user_for_login(username):
+    """(id, username, password_hash) for a username, or None"""
+    with connection() as conn:
+        return conn.execute('''
+            SELECT id, username, password_hash FROM users
+            WHERE username = ?
+        ''', (username,)).fetchone()
+
+
+def update_password_hash(user_id, password_hash):
+    with transaction() as conn:
+        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+
+
+# Skips a snapshot identical to the user's latest one
+INSERT_BUDGET_PROFILE = '''
+    INSERT INTO budget_profiles (user_id, yearly_income, filing_status, county, housing_budget, transportation_budget, food_budget, savings_budget)
+    SELECT :user_id, :yearly_income, :filing_status, :county, :housing, :transportation, :food, :savings
+    WHERE NOT EXISTS (
+        SELECT 1 FROM (
+            SELECT yearly_income, filing_status, county, housing_budget, transportation_budget, food_budget, savings_budget
+            FROM budget_profiles
+            WHERE user_id = :user_id
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        ) AS latest
+        WHERE latest.yearly_income IS :yearly_income AND latest.filing_status IS :filing_status
+          AND latest.county IS :county AND latest.housing_budget IS :housing
+          AND latest.transportation_budget IS :transportation AND latest.food_budget IS :food
+          AND latest.savings_budget IS :savings
+    )
+'''
+
+
+def _budget_profile_params(user_id, yearly_income, filing_status, county, budget_breakdown):
+    return {"user_id": user_id, "yearly_income": yearly_income, "filing_status": filing_status,
+            "county": county, "housing": budget_breakdown['housing'],
+            "transportation": budget_breakdown['transportation'],
+            "food": budget_breakdown['food'], "savings": budget_breakdown['savings']}
+
+
+def insert_budget_profile(user_id, yearly_income, filing_status, county, budget_breakdown):
+    """Record a budget snapshot unless it is identical to the user's latest one
+
+    Returns True when a row was inserted.
+    """
+    with transaction() as conn:
+        cursor = conn.execute(INSERT_BUDGET_PROFILE, _budget_profile_params(
+            user_id, yearly_income, filing_status, county, budget_breakdown))
+        return cursor.rowcount > 0
+
+
+def insert_budget_profiles(rows):
+    """insert_budget_profile for many (user_id, yearly_income, filing_status, county,
+    budget_breakdown) tuples in one transaction; returns the number inserted"""
+    with transaction() as conn:
+        cursor = conn.executemany(INSERT_BUDGET_PROFILE, (_budget_profile_params(*row) for row in rows))
+        return cursor.rowcount
+
+
+def recent_budget_profiles(user_id, limit=10):
+    with connection() as conn:
+        return conn.execute('''
+            SELECT yearly_income, filing_status, county, housing_budget, transportation_budget,
+                   food_budget, savings_budget, created_at
+            FROM budget_profiles
+            WHERE user_id = ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+
+
+def latest_budget_profile(user_id):
+    with connection() as conn:
+        return conn.execute('''
+            SELECT yearly_income, filing_status, county, housing_budget, transportation_budget,
+                   food_budget, savings_budget, created_at
+            FROM budget_profiles
+            WHERE user_id = ?
+            ORDER BY created_at DESC
+            LIMIT 1
+        ''', (user_id,)).fetchone()
+
+
+def load_session(sid):
+    """(data, expires_at) for a session id, or None"""
+    with connection() as conn:
+        return conn.execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ?', (sid,)).fetchone()
+
+
+def save_session(sid, data, expires_at):
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+        ''', (sid, data, expires_at))
+
+
+def touch_session(sid, expires_at):
+    with transaction() as conn:
+        conn.execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (expires_at, sid))
+
+
+def delete_session(sid):
+    with transaction() as conn:
+        conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+def delete_expired_sessions(now):
+    """Remove sessions that expired before now; returns how many were removed"""
+    with transaction() as conn:
+        return conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,)).rowcount
@@ -0,0 +1,253 @@
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+import database
+
+IMPORT_BATCH_SIZE = 5000
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+EXPENSE_COLUMNS = 'id, category, amount, description, date_added'
+
+
+class ExpenseError(ValueError):
+    """Invalid expense data; line is set for bulk-import rows"""
+
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.line = line
+
+
+def expense_to_dict(row):
+    return {
+        "id": row[0],
+        "category": row[1],
+        "amount": row[2],
+        "description": row[3],
+        "date_added": row[4]
+    }
+
+
+@lru_cache(maxsize=4096)
+def normalize_date(value):
+    """Parse an ISO date or datetime into SQLite's CURRENT_TIMESTAMP format"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip()).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise ExpenseError(f"Invalid date: {value!r}")
+
+
+def validate_expense(data):
+    """Return (category, amount, description, date_added) from a request or import row"""
+    category = data.get('category') or ''
+    if not isinstance(category, str):
+        raise ExpenseError("Invalid category")
+    category = category.strip()
+    if not category:
+        raise ExpenseError("Missing category")
+
+    try:
+        amount = float(data.get('amount'))
+    except (TypeError, ValueError):
+        raise ExpenseError("Invalid amount")
+    if not math.isfinite(amount):
+        raise ExpenseError("Invalid amount")
+
+    description = data.get('description') or None
+    if description is not None and not isinstance(description, str):
+        raise ExpenseError("Invalid description")
+    date_added = data.get('date_added') or data.get('date')
+    date_added = normalize_date(str(date_added)) if date_added else None
+    return category, amount, description, date_added
+
+
+# CRUD
+
+def create_expense(user_id, data):
+    category, amount, description, date_added = validate_expense(data)
+    with database.transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO user_expenses (user_id, category, amount, description, date_added)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', (user_id, category, amount, description, date_added))
+        return get_expense(user_id, cursor.lastrowid, conn)
+
+
+def get_expense(user_id, expense_id, conn=None):
+    if conn is None:
+        with database.connection() as conn:
+            return get_expense(user_id, expense_id, conn)
+
+    row = conn.execute(f'''
+        SELECT {EXPENSE_COLUMNS} FROM user_expenses
+        WHERE id = ? AND user_id = ?
+    ''', (expense_id, user_id)).fetchone()
+    return expense_to_dict(row) if row else None
+
+
+def update_expense(user_id, expense_id, data):
+    """Replace an expense's fields; returns the updated expense or None if it doesn't exist"""
+    category, amount, description, date_added = validate_expense(data)
+    with database.transaction() as conn:
+        cursor = conn.execute('''
+            UPDATE user_expenses
+            SET category = ?, amount = ?, description = ?, date_added = COALESCE(?, date_added)
+            WHERE id = ? AND user_id = ?
+        ''', (category, amount, description, date_added, expense_id, user_id))
+        if cursor.rowcount == 0:
+            return None
+        return get_expense(user_id, expense_id, conn)
+
+
+def delete_expense(user_id, expense_id):
+    with database.transaction() as conn:
+        cursor = conn.execute('DELETE FROM user_expenses WHERE id = ? AND user_id = ?',
+                              (expense_id, user_id))
+        return cursor.rowcount > 0
+
+
+def encode_cursor(expense):
+    return f"{expense['date_added']}|{expense['id']}"
+
+
+def decode_cursor(cursor):
+    try:
+        date_added, expense_id = cursor.rsplit('|', 1)
+        return date_added, int(expense_id)
+    except ValueError:
+        raise ExpenseError("Invalid cursor")
+
+
+def list_expenses(user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, category=None, since=None, until=None):
+    """Newest-first page of expenses using keyset pagination on (date_added, id)
+
+    Returns (expenses, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses = ['user_id = ?']
+    params = [user_id]
+
+    if category:
+        clauses.append('category = ?')
+        params.append(category)
+    if since:
+        clauses.append('date_added >= ?')
+        params.append(normalize_date(since))
+    if until:
+        clauses.append('date_added < ?')
+        params.append(normalize_date(until))
+    if cursor:
+        clauses.append('(date_added, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+
+    with database.connection() as conn:
+        rows = conn.execute(f'''
+            SELECT {EXPENSE_COLUMNS} FROM user_expenses
+            WHERE {' AND '.join(clauses)}
+            ORDER BY date_added DESC, id DESC
+            LIMIT ?
+        ''', (*params, limit + 1)).fetchall()
+
+    expenses = [expense_to_dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(expenses[-1]) if len(rows) > limit else None
+    return expenses, next_cursor
+
+
+# Bulk import
+
+def decode_lines(stream):
+    """Yield the text lines of a binary stream, decoding one line at a time
+
+    Invalid UTF-8 raises ExpenseError with its line number rather than a
+    UnicodeDecodeError from somewhere inside the parser.
+    """
+    if not isinstance(stream, io.BufferedIOBase):
+        stream = io.BufferedReader(stream)
+    for line, raw in enumerate(stream, start=1):
+        try:
+            yield raw.decode('utf-8-sig' if line == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            raise ExpenseError("Invalid UTF-8 text", line)
+
+
+def iter_csv_rows(stream):
+    """Yield (line, row dict) from a binary CSV stream without reading it all"""
+    reader = csv.reader(decode_lines(stream))
+    try:
+        header = [name.strip().lower() for name in next(reader, [])]
+        for row in reader:
+            if row:
+                yield reader.line_num, dict(zip(header, row))
+    except csv.Error as e:
+        raise ExpenseError(f"Invalid CSV: {e}", reader.line_num)
+
+
+def iter_jsonl_rows(stream):
+    """Yield (line, row dict) from a binary JSON-lines stream without reading it all"""
+    for line, raw in enumerate(decode_lines(stream), start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError:
+            raise ExpenseError("Invalid JSON", line)
+        if not isinstance(row, dict):
+            raise ExpenseError("Expected a JSON object", line)
+        yield line, row
+
+
+IMPORT_FORMATS = {
+    'csv': iter_csv_rows,
+    'jsonl': iter_jsonl_rows,
+}
+
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+}
+
+
+def import_format(requested, content_type):
+    """Pick the import format from ?format= or the Content-Type; None if unsupported"""
+    if requested:
+        return requested if requested in IMPORT_FORMATS else None
+    return IMPORT_CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower())
+
+
+def import_expenses(user_id, stream, fmt):
+    """Stream-parse an upload and insert it in executemany batches within one transaction
+
+    Nothing is committed if any row is invalid. Returns the number of rows imported.
+    """
+    parse = IMPORT_FORMATS[fmt]
+
+    def records():
+        for line, row in parse(stream):
+            try:
+                category, amount, description, date_added = validate_expense(row)
+            except ExpenseError as e:
+                raise ExpenseError(str(e), line)
+            yield user_id, category, amount, description, date_added
+
+    rows = records()
+    imported = 0
+    with database.transaction() as conn:
+        while True:
+            batch = list(islice(rows, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            conn.executemany('''
+                INSERT INTO user_expenses (user_id, category, amount, description, date_added)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', batch)
+            imported += len(batch)
+    return imported
@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+import time
+
+import database
+import history_archive
+
+FETCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+CHUNK_SECONDS = 0.1
+
+EXPORT_DATASETS = {
+    'budgets': ('budget_profile', '''
+        SELECT id, yearly_income, filing_status, county, housing_budget, transportation_budget,
+               food_budget, savings_budget, created_at
+        FROM budget_profiles
+        WHERE user_id = ? AND id > ?
+        ORDER BY created_at, id
+    '''),
+    'expenses': ('expense', '''
+        SELECT id, category, amount, description, date_added
+        FROM user_expenses
+        WHERE user_id = ?
+        ORDER BY date_added, id
+    '''),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def iter_rows(user_id, dataset):
+    """Yield (column names, row iterator) pairs straight from a SQLite cursor
+
+    The pooled connection is held only while the generator is being consumed
+    and is returned when it is exhausted or closed.
+    """
+    _, query = EXPORT_DATASETS[dataset]
+    params = (user_id,)
+    if dataset == 'budgets':
+        # Skip live rows an interrupted compaction already archived
+        params += (history_archive.archived_through(user_id),)
+    with database.connection() as conn:
+        cursor = conn.execute(query, params)
+        columns = [column[0] for column in cursor.description]
+
+        def rows():
+            # Compacted budget history predates everything still in SQLite
+            if dataset == 'budgets':
+                yield from history_archive.iter_archived_rows(user_id)
+            while True:
+                batch = cursor.fetchmany(FETCH_SIZE)
+                if not batch:
+                    return
+                yield from batch
+
+        yield columns, rows()
+
+
+def chunked(lines):
+    """Group encoded lines into chunks of roughly CHUNK_BYTES
+
+    The first line goes out on its own so the client sees bytes at once, and
+    a partial chunk is sent once CHUNK_SECONDS have passed since the last
+    one, so small or slow exports never sit in the buffer.
+    """
+    buffer = []
+    size = 0
+    deadline = None
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        now = time.monotonic()
+        if deadline is None or size >= CHUNK_BYTES or now >= deadline:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+            deadline = now + CHUNK_SECONDS
+    if buffer:
+        yield b''.join(buffer)
+
+
+def csv_lines(columns, rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in rows:
+        writer.writerow(row)
+        yield out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+
+
+def jsonl_lines(columns, rows, record_type=None):
+    for row in rows:
+        record = dict(zip(columns, row))
+        if record_type:
+            record = {"type": record_type, **record}
+        yield (json.dumps(record) + '\n').encode()
+
+
+def stream_export(user_id, dataset, fmt):
+    """Generate the export body; the CSV header goes out before any rows are read"""
+    for columns, rows in iter_rows(user_id, dataset):
+        if fmt == 'csv':
+            yield (','.join(columns) + '\r\n').encode()
+            yield from chunked(csv_lines(columns, rows))
+        else:
+            yield from chunked(jsonl_lines(columns, rows))
+
+
+def stream_backup(user_id):
+    """Every dataset for a user as one JSON-lines stream, each record tagged with its type"""
+    for dataset, (record_type, _) in EXPORT_DATASETS.items():
+        for columns, rows in iter_rows(user_id, dataset):
+            yield from chunked(jsonl_lines(columns, rows, record_type))
@@ -0,0 +1,279 @@
+from datetime import date
+
+import numpy as np
+
+import database
+
+DEFAULT_PATHS = 2000
+MAX_PATHS = 20000
+MAX_HORIZON_MONTHS = 600
+# paths x months cap on a single simulation (two float64 arrays of this size)
+MAX_SIMULATION_POINTS = 4000000
+PERCENTILES = (10, 25, 50, 75, 90)
+
+GOAL_COLUMNS = ('id, name, target_amount, current_amount, monthly_contribution, annual_return, '
+                'annual_volatility, target_date, created_at')
+
+
+class GoalError(ValueError):
+    pass
+
+
+def goal_to_dict(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "target_amount": row[2],
+        "current_amount": row[3],
+        "monthly_contribution": row[4],
+        "annual_return": row[5],
+        "annual_volatility": row[6],
+        "target_date": row[7],
+        "created_at": row[8]
+    }
+
+
+def _number(data, field, default=None, minimum=None, maximum=None):
+    value = data.get(field, default)
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise GoalError(f"Invalid {field}")
+    if (not np.isfinite(value) or (minimum is not None and value < minimum)
+            or (maximum is not None and value > maximum)):
+        raise GoalError(f"Invalid {field}")
+    return value
+
+
+def validate_goal(data):
+    """Return the goal columns after name from a request body"""
+    name = (data.get('name') or '').strip()
+    if not name:
+        raise GoalError("Missing name")
+
+    target_amount = _number(data, 'target_amount')
+    if target_amount is None or target_amount <= 0:
+        raise GoalError("Invalid target_amount")
+    current_amount = _number(data, 'current_amount', 0, minimum=0)
+    # None means "use the savings line of the latest budget"
+    monthly_contribution = _number(data, 'monthly_contribution', minimum=0)
+    # Rates are fractions; bounded so the simulation's cumulative growth stays finite
+    annual_return = _number(data, 'annual_return', 0, minimum=-0.99, maximum=1)
+    annual_volatility = _number(data, 'annual_volatility', 0, minimum=0, maximum=1)
+
+    target_date = data.get('target_date') or None
+    if target_date:
+        try:
+            target_date = date.fromisoformat(str(target_date)[:10]).isoformat()
+        except ValueError:
+            raise GoalError(f"Invalid target_date: {target_date!r}")
+
+    return (name, target_amount, current_amount, monthly_contribution,
+            annual_return, annual_volatility, target_date)
+
+
+# CRUD
+
+def create_goal(user_id, data):
+    values = validate_goal(data)
+    with database.transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO goals (user_id, name, target_amount, current_amount, monthly_contribution,
+                               annual_return, annual_volatility, target_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, *values))
+        return get_goal(user_id, cursor.lastrowid, conn)
+
+
+def get_goal(user_id, goal_id, conn=None):
+    if conn is None:
+        with database.connection() as conn:
+            return get_goal(user_id, goal_id, conn)
+
+    row = conn.execute(f'SELECT {GOAL_COLUMNS} FROM goals WHERE id = ? AND user_id = ?',
+                       (goal_id, user_id)).fetchone()
+    return goal_to_dict(row) if row else None
+
+
+def list_goals(user_id):
+    with database.connection() as conn:
+        rows = conn.execute(f'SELECT {GOAL_COLUMNS} FROM goals WHERE user_id = ? ORDER BY id',
+                            (user_id,)).fetchall()
+    return [goal_to_dict(row) for row in rows]
+
+
+def update_goal(user_id, goal_id, data):
+    """Replace a goal's fields; returns the updated goal or None if it doesn't exist"""
+    values = validate_goal(data)
+    with database.transaction() as conn:
+        cursor = conn.execute('''
+            UPDATE goals
+            SET name = ?, target_amount = ?, current_amount = ?, monthly_contribution = ?,
+                annual_return = ?, annual_volatility = ?, target_date = ?
+            WHERE id = ? AND user_id = ?
+        ''', (*values, goal_id, user_id))
+        if cursor.rowcount == 0:
+            return None
+        return get_goal(user_id, goal_id, conn)
+
+
+def delete_goal(user_id, goal_id):
+    with database.transaction() as conn:
+        cursor = conn.execute('DELETE FROM goals WHERE id = ? AND user_id = ?', (goal_id, user_id))
+        return cursor.rowcount > 0
+
+
+# Projection engine
+
+def monthly_rate(annual_return):
+    """Monthly rate that compounds to the annual return"""
+    return np.power(1 + np.asarray(annual_return, dtype=float), 1 / 12) - 1
+
+
+def months_to_goal(current, contribution, target, rate):
+    """Whole months until the balance reaches target, elementwise; inf when it never does
+
+    Balances grow by rate each month and the contribution is added at the end
+    of the month.
+    """
+    current, contribution, target, rate = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (current, contribution, target, rate)))
+    months = np.full(current.shape, np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # rate == 0: straight-line saving
+        flat = (target - current) / contribution
+        # rate != 0: solve current*(1+r)^n + c*((1+r)^n - 1)/r = target for n
+        compound = (np.log((target * rate + contribution) / (current * rate + contribution))
+                    / np.log1p(rate))
+    solved = np.where(rate == 0, flat, compound)
+    reachable = np.isfinite(solved) & (solved >= 0)
+    months[reachable] = np.ceil(solved[reachable] - 1e-9)
+    months[current >= target] = 0
+    return months
+
+
+def trajectory(current, contribution, rate, horizon):
+    """Deterministic month-end balances for months 0..horizon"""
+    t = np.arange(horizon + 1, dtype=float)
+    if rate == 0:
+        return current + contribution * t
+    growth = np.power(1 + rate, t)
+    return current * growth + contribution * (growth - 1) / rate
+
+
+def simulate(current, contribution, annual_return, annual_volatility, horizon, paths, rng):
+    """Monte Carlo month-end balances, shape (paths, horizon + 1)
+
+    Monthly returns are normal with the compounded monthly mean and the
+    annual volatility scaled by sqrt(12). The recurrence
+    B[t] = B[t-1] * (1 + R[t]) + c is solved for every path at once as
+    B[t] = G[t] * (B[0] + c * sum(1 / G[1..t])) with G the cumulative growth.
+    """
+    returns = rng.normal(monthly_rate(annual_return), annual_volatility / np.sqrt(12), (paths, horizon))
+    # A month can lose at most everything
+    growth = np.cumprod(np.maximum(1 + returns, 0.0) + 1e-12, axis=1)
+    balances = np.empty((paths, horizon + 1))
+    balances[:, 0] = current
+    balances[:, 1:] = growth * (current + contribution * np.cumsum(1 / growth, axis=1))
+    return balances
+
+
+def months_between(start, end):
+    return (end.year - start.year) * 12 + end.month - start.month
+
+
+def add_months(start, months):
+    """'YYYY-MM' of the month a number of months after start"""
+    index = start.year * 12 + start.month - 1 + int(months)
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def _rounded(values):
+    return np.round(values, 2).tolist()
+
+
+def project(goal, contribution, paths=DEFAULT_PATHS, horizon=None, seed=None, today=None):
+    """Months-to-goal, deterministic trajectory and Monte Carlo ranges for one goal"""
+    today = today or date.today()
+    if not 1 <= paths <= MAX_PATHS:
+        raise GoalError(f"paths must be between 1 and {MAX_PATHS}")
+
+    current, target = goal["current_amount"], goal["target_amount"]
+    rate = float(monthly_rate(goal["annual_return"]))
+    needed = float(months_to_goal(current, contribution, target, rate))
+
+    target_months = None
+    if goal["target_date"]:
+        target_months = max(0, months_between(today, date.fromisoformat(goal["target_date"])))
+
+    if horizon is None:
+        # Long enough to show the goal being reached (with room for bad
+        # markets) or the target date, whichever is later
+        horizon = max(12, target_months or 0, int(needed * 1.5) if np.isfinite(needed) else MAX_HORIZON_MONTHS)
+    horizon = int(min(max(horizon, 1), MAX_HORIZON_MONTHS))
+    if paths * (horizon + 1) > MAX_SIMULATION_POINTS:
+        raise GoalError(f"paths x months is limited to {MAX_SIMULATION_POINTS}")
+
+    result = {
+        "goal": goal,
+        "monthly_contribution": round(contribution, 2),
+        "months_to_goal": int(needed) if np.isfinite(needed) else None,
+        "projected_month": add_months(today, needed) if np.isfinite(needed) else None,
+        "horizon_months": horizon,
+        "months": [add_months(today, t) for t in range(horizon + 1)],
+        "trajectory": _rounded(trajectory(current, contribution, rate, horizon)),
+    }
+
+    rng = np.random.default_rng(seed)
+    balances = simulate(current, contribution, goal["annual_return"], goal["annual_volatility"],
+                        horizon, paths, rng)
+    reached = balances >= target
+    hit = reached.any(axis=1)
+    first_hit = np.where(hit, reached.argmax(axis=1), np.inf)
+
+    # Percentiles of the month the goal is reached; inf (never, within the
+    # horizon) sorts last so it only shows up in the pessimistic tail
+    hit_months = np.percentile(first_hit, PERCENTILES, method='higher')
+    result["monte_carlo"] = {
+        "paths": paths,
+        "seed": seed,
+        "percentiles": {f"p{p}": _rounded(row) for p, row in zip(PERCENTILES, np.percentile(balances, PERCENTILES, axis=0))},
+        "probability_within_horizon": round(float(hit.mean()), 4),
+        "probability_by_target_date": (round(float((first_hit <= target_months).mean()), 4)
+                                       if target_months is not None else None),
+        "months_to_goal": {f"p{p}": (int(m) if np.isfinite(m) else None) for p, m in zip(PERCENTILES, hit_months)},
+    }
+    return result
+
+
+def default_contribution(user_id):
+    """Savings line of the user's latest budget, used by goals without their own contribution"""
+    profile = database.latest_budget_profile(user_id)
+    if profile and profile[6] is not None:
+        return float(profile[6])
+    return 0.0
+
+
+def contribution_for(goal, default):
+    if goal["monthly_contribution"] is not None:
+        return float(goal["monthly_contribution"])
+    return default
+
+
+def summarize(goals, contribution_default, today=None):
+    """Add months_to_goal and projected_month to every goal, computed in one vectorized pass"""
+    if not goals:
+        return goals
+    today = today or date.today()
+    contributions = [contribution_for(g, contribution_default) for g in goals]
+    months = months_to_goal(
+        [g["current_amount"] for g in goals], contributions,
+        [g["target_amount"] for g in goals], monthly_rate([g["annual_return"] for g in goals]))
+    for goal, contribution, needed in zip(goals, contributions, months):
+        goal["effective_contribution"] = round(contribution, 2)
+        goal["progress"] = round(min(goal["current_amount"] / goal["target_amount"], 1.0), 4)
+        goal["months_to_goal"] = int(needed) if np.isfinite(needed) else None
+        goal["projected_month"] = add_months(today, needed) if np.isfinite(needed) else None
+    return goals
@@ -0,0 +1,354 @@
+"""Columnar archive for old budget_profiles snapshots
+
+compact() moves each user's snapshots older than a cutoff (always keeping the
+newest few in SQLite) into a per-user .npy record array: timestamps and ids as
+int64, money columns as float32 and filing status / county as small integer
+codes into a shared vocabulary. Only filing statuses and counties the tax
+tables know are interned; any other value is archived as '', so free-text
+input cannot exhaust the codes. Runs of identical consecutive snapshots are
+collapsed to their first row on the way in. Archives are opened with
+mmap_mode='r', so reading years of history costs a page-in, not a Python
+object per row.
+
+The archive is written before the DELETE of the rows it absorbed commits,
+so a failed or interrupted compaction can leave rows in both places. Every
+reader therefore skips live rows with ids up to archived_through(), the
+highest id any compaction has processed.
+
+    python history_archive.py --older-than-days 30 --keep-recent 10
+"""
+import argparse
+import calendar
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import database
+from tax_tables import FILING_STATUSES, TaxRegistry
+
+DEFAULT_OLDER_THAN_DAYS = 30
+DEFAULT_KEEP_RECENT = 10
+HISTORY_FETCH_SIZE = 5000
+# Last second of 9999-12-31, the latest time a created_at string can hold
+MAX_EPOCH = 253402300799
+
+MONEY_COLUMNS = ('yearly_income', 'housing_budget', 'transportation_budget', 'food_budget', 'savings_budget')
+
+ARCHIVE_DTYPE = np.dtype([
+    ('id', '<i8'),
+    ('created_at', '<i8'),
+    ('yearly_income', '<f4'),
+    ('filing_status', '<u2'),
+    ('county', '<u2'),
+    ('housing_budget', '<f4'),
+    ('transportation_budget', '<f4'),
+    ('food_budget', '<f4'),
+    ('savings_budget', '<f4'),
+])
+
+SNAPSHOT_FIELDS = ('yearly_income', 'filing_status', 'county') + MONEY_COLUMNS[1:]
+
+_lock = threading.Lock()
+
+
+def archive_dir():
+    """BUDGET_HISTORY_DIR, or history_archive/ next to the database file"""
+    return os.environ.get('BUDGET_HISTORY_DIR') or os.path.join(
+        os.path.dirname(database.get_pool().path), 'history_archive')
+
+
+def to_epoch(timestamp):
+    """SQLite CURRENT_TIMESTAMP text (UTC) -> epoch seconds"""
+    return calendar.timegm(time.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S'))
+
+
+def from_epoch(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(seconds)))
+
+
+def _atomic_write(path, write):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class Vocabulary:
+    """Append-only string <-> code table shared by every user archive
+
+    allowed maps a field to the values that may be interned; any other value
+    is encoded as ''. Without it every value is interned, which is only safe
+    for a vocabulary that is never saved.
+    """
+
+    def __init__(self, directory, allowed=None):
+        self.path = os.path.join(directory, 'vocabulary.json')
+        self.allowed = allowed
+        self.values = {'filing_status': [], 'county': []}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.values.update(json.load(f))
+        self.codes = {field: {value: code for code, value in enumerate(values)}
+                      for field, values in self.values.items()}
+
+    def encode(self, field, value):
+        if self.allowed is not None and value not in self.allowed[field]:
+            value = ''
+        codes = self.codes[field]
+        if value not in codes:
+            codes[value] = len(self.values[field])
+            self.values[field].append(value)
+        return codes[value]
+
+    def decode(self, field, codes):
+        values = self.values[field]
+        return [values[code] for code in codes]
+
+    def save(self):
+        _atomic_write(self.path, lambda f: f.write(json.dumps(self.values).encode()))
+
+
+def user_archive_path(user_id, directory=None):
+    return os.path.join(directory or archive_dir(), f'user_{int(user_id)}.npy')
+
+
+def load_archive(user_id, directory=None):
+    """The user's archived snapshots as a read-only memory-mapped record array"""
+    path = user_archive_path(user_id, directory)
+    if not os.path.exists(path):
+        return np.empty(0, dtype=ARCHIVE_DTYPE)
+    return np.load(path, mmap_mode='r')
+
+
+def archived_through(user_id, directory=None):
+    """Highest snapshot id already compacted for the user, or -1
+
+    Snapshot ids grow with created_at, so every live row at or below this
+    id was meant to be deleted by a compaction and is already covered by
+    the archive.
+    """
+    path = user_archive_path(user_id, directory)
+    if not os.path.exists(path):
+        return -1
+    return int(np.load(path, mmap_mode='r')['id'].max(initial=-1))
+
+
+def dedupe(records, previous=None):
+    """Drop records identical to the snapshot immediately before them"""
+    if len(records) == 0:
+        return records
+    keep = np.ones(len(records), dtype=bool)
+    same = np.ones(len(records) - 1, dtype=bool)
+    for field in SNAPSHOT_FIELDS:
+        same &= records[field][1:] == records[field][:-1]
+    keep[1:] = ~same
+    if previous is not None:
+        keep[0] = not all(records[field][0] == previous[field] for field in SNAPSHOT_FIELDS)
+    return records[keep]
+
+
+def compact_user(conn, user_id, cutoff, keep_recent, vocabulary, directory):
+    """Archive one user's old snapshots; returns (rows removed from SQLite, rows archived)"""
+    rows = conn.execute('''
+        SELECT id, created_at, yearly_income, filing_status, county, housing_budget,
+               transportation_budget, food_budget, savings_budget
+        FROM budget_profiles
+        WHERE user_id = ? AND created_at < ?
+          AND id NOT IN (
+              SELECT id FROM budget_profiles WHERE user_id = ?
+              ORDER BY created_at DESC, id DESC LIMIT ?
+          )
+        ORDER BY created_at, id
+    ''', (user_id, cutoff, user_id, keep_recent)).fetchall()
+    if not rows:
+        return 0, 0
+
+    existing = load_archive(user_id, directory)
+    last_id = int(existing['id'].max(initial=-1))
+
+    records = np.empty(len(rows), dtype=ARCHIVE_DTYPE)
+    records['id'] = [row[0] for row in rows]
+    records['created_at'] = [to_epoch(row[1]) for row in rows]
+    records['filing_status'] = [vocabulary.encode('filing_status', row[3] or '') for row in rows]
+    records['county'] = [vocabulary.encode('county', row[4] or '') for row in rows]
+    for offset, field in zip((2, 5, 6, 7, 8), MONEY_COLUMNS):
+        records[field] = [row[offset] if row[offset] is not None else np.nan for row in rows]
+
+    # Rows already archived by an interrupted earlier run are skipped
+    records = records[records['id'] > last_id]
+    records = dedupe(records, existing[-1] if len(existing) else None)
+
+    if len(records):
+        combined = np.concatenate([np.asarray(existing), records])
+        vocabulary.save()
+        # Committed before the DELETE below; readers skip live rows the
+        # archive already covers, so a rollback can't double-count them
+        _atomic_write(user_archive_path(user_id, directory), lambda f: np.save(f, combined))
+
+    conn.executemany('DELETE FROM budget_profiles WHERE id = ?', [(row[0],) for row in rows])
+    return len(rows), len(records)
+
+
+def compact(older_than_days=DEFAULT_OLDER_THAN_DAYS, keep_recent=DEFAULT_KEEP_RECENT, directory=None,
+            registry=None):
+    """Move snapshots older than the cutoff into the columnar archive
+
+    The newest keep_recent snapshots per user always stay in SQLite so recent
+    history and duplicate detection on insert need no archive reads.
+    """
+    directory = directory or archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    cutoff = from_epoch(time.time() - older_than_days * 86400)
+
+    removed = archived = users = 0
+    with _lock:
+        vocabulary = Vocabulary(directory, archivable_values(registry))
+        with database.connection() as conn:
+            user_ids = [row[0] for row in conn.execute('''
+                SELECT DISTINCT user_id FROM budget_profiles
+                WHERE user_id IS NOT NULL AND created_at < ?
+            ''', (cutoff,))]
+
+        for user_id in user_ids:
+            # One short transaction per user keeps writers from waiting on the whole job
+            with database.transaction() as conn:
+                user_removed, user_archived = compact_user(
+                    conn, user_id, cutoff, keep_recent, vocabulary, directory)
+            removed += user_removed
+            archived += user_archived
+            users += bool(user_removed)
+
+    return {"users": users, "rows_removed": removed, "rows_archived": archived}
+
+
+def archivable_values(registry=None):
+    """Filing statuses and counties (of any loaded tax year) the archive may intern"""
+    registry = registry or TaxRegistry()
+    counties = set()
+    for year in registry.years():
+        counties.update(registry.get(year).county_rates)
+    return {'filing_status': set(FILING_STATUSES), 'county': counties}
+
+
+def parse_time(value):
+    """Epoch seconds from a number or a 'YYYY-MM-DD[ HH:MM:SS]' string"""
+    if value is None or value == '':
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    if seconds is not None:
+        # Also rejects nan and inf, which int() and gmtime() can't take
+        if not 0 <= seconds <= MAX_EPOCH:
+            raise ValueError(f"Invalid date: {value!r}")
+        return int(seconds)
+    text = str(value).replace('T', ' ')
+    if len(text) == 10:
+        text += ' 00:00:00'
+    try:
+        return to_epoch(text)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r}")
+
+
+def history(user_id, since=None, until=None, max_points=None):
+    """Columnar budget history: the memory-mapped archive followed by live SQLite rows
+
+    since/until are epoch seconds or 'YYYY-MM-DD[ HH:MM:SS]' strings. When
+    max_points is given the series is evenly strided down to at most that many
+    points, always keeping the newest snapshot.
+    """
+    directory = archive_dir()
+    archived = load_archive(user_id, directory)
+    # Live rows are encoded into the same codes as the archive in memory
+    # only; the vocabulary file is never written from here. Their codes are
+    # uint32 since any number of distinct free-text values may be live
+    vocabulary = Vocabulary(directory)
+    since, until = parse_time(since), parse_time(until)
+
+    clauses = ['user_id = ?', 'id > ?']
+    params = [user_id, int(archived['id'].max(initial=-1))]
+    if since is not None:
+        clauses.append('created_at >= ?')
+        params.append(from_epoch(since))
+    if until is not None:
+        clauses.append('created_at < ?')
+        params.append(from_epoch(until))
+
+    # Read live rows a page at a time into compact columns rather than
+    # holding a Python tuple per row
+    live = {field: [] for field in ('created_at', 'filing_status', 'county') + MONEY_COLUMNS}
+    with database.connection() as conn:
+        cursor = conn.execute(f'''
+            SELECT created_at, yearly_income, filing_status, county, housing_budget,
+                   transportation_budget, food_budget, savings_budget
+            FROM budget_profiles
+            WHERE {' AND '.join(clauses)}
+            ORDER BY created_at, id
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(HISTORY_FETCH_SIZE)
+            if not rows:
+                break
+            live['created_at'].append(np.array([to_epoch(row[0]) for row in rows], dtype=np.int64))
+            for field, offset in (('filing_status', 2), ('county', 3)):
+                live[field].append(np.array([vocabulary.encode(field, row[offset] or '') for row in rows],
+                                            dtype=np.uint32))
+            for field, offset in zip(MONEY_COLUMNS, (1, 4, 5, 6, 7)):
+                live[field].append(np.array([row[offset] for row in rows], dtype=np.float32))
+
+    columns = {field: np.concatenate([archived[field], *chunks]) for field, chunks in live.items()}
+    timestamps = columns['created_at']
+
+    mask = np.ones(len(timestamps), dtype=bool)
+    if since is not None:
+        mask &= timestamps >= since
+    if until is not None:
+        mask &= timestamps < until
+    index = np.flatnonzero(mask)
+    if max_points and len(index) > max_points > 0:
+        stride = -(-len(index) // max_points)
+        index = index[::-1][::stride][::-1]
+
+    return {
+        "created_at": timestamps[index].tolist(),
+        **{field: np.round(columns[field][index].astype(np.float64), 2).tolist() for field in MONEY_COLUMNS},
+        "filing_status": vocabulary.decode('filing_status', columns['filing_status'][index]),
+        "county": vocabulary.decode('county', columns['county'][index]),
+        "archived": int(len(archived)),
+        "count": int(len(index))
+    }
+
+
+def iter_archived_rows(user_id):
+    """Archived snapshots as budget export rows, oldest first"""
+    directory = archive_dir()
+    archived = load_archive(user_id, directory)
+    if not len(archived):
+        return
+    vocabulary = Vocabulary(directory)
+    for record in archived:
+        yield (
+            int(record['id']), float(record['yearly_income']),
+            vocabulary.values['filing_status'][record['filing_status']],
+            vocabulary.values['county'][record['county']],
+            float(record['housing_budget']), float(record['transportation_budget']),
+            float(record['food_budget']), float(record['savings_budget']),
+            from_epoch(record['created_at'])
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact old budget_profiles snapshots into the columnar archive')
+    parser.add_argument('--older-than-days', type=float, default=DEFAULT_OLDER_THAN_DAYS)
+    parser.add_argument('--keep-recent', type=int, default=DEFAULT_KEEP_RECENT)
+    args = parser.parse_args()
+    print(json.dumps(compact(args.older_than_days, args.keep_recent)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""Opt-in request and stage latency metrics with a sampling profiler for slow requests
+
+Enable with BUDGET_METRICS=1. Route and stage histograms are then exposed in
+Prometheus text format on /metrics. Setting BUDGET_PROFILE_SLOW_MS as well
+starts a sampling profiler that writes collapsed stacks (the input format of
+flamegraph.pl and speedscope) for every request slower than that threshold to
+BUDGET_PROFILE_DIR.
+
+The Flask app is instrumented by Metrics.init_app and the ASGI app by
+MetricsMiddleware. The profiler samples request threads, so it only covers
+the Flask app.
+
+When disabled no request hooks are installed and stage() hands back a shared
+no-op context manager, so instrumented code pays only for a function call.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+
+_NULL_STAGE = nullcontext()
+
+# The route being served; a context variable rather than a thread local so
+# stages timed on the ASGI thread pool are still attributed to their route
+_current_route = ContextVar('budget_metrics_route', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in seconds"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Yield (le, cumulative count) pairs ending with +Inf"""
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), cumulative
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight request threads and dumps the slow ones"""
+
+    def __init__(self, slow_seconds, output_dir, interval=DEFAULT_SAMPLE_INTERVAL_MS / 1000):
+        self.slow_seconds = slow_seconds
+        self.output_dir = output_dir
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='budget-profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self, route, duration):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if stacks and duration >= self.slow_seconds:
+            self.dump(route, duration, stacks)
+
+    def dump(self, route, duration, stacks):
+        slug = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{slug}-{duration * 1000:.0f}ms.folded'
+        with open(os.path.join(self.output_dir, filename), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def collapse_stack(frame):
+    """Root-first 'file:function;file:function' line for a frame"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Metrics:
+    """Per-route and per-stage latency histograms"""
+
+    def __init__(self, enabled=False, profiler=None, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.profiler = profiler
+        self.buckets = buckets
+        self.requests = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        if os.environ.get('BUDGET_METRICS', '').lower() not in ('1', 'true', 'yes', 'on'):
+            return cls()
+        profiler = None
+        slow_ms = os.environ.get('BUDGET_PROFILE_SLOW_MS')
+        if slow_ms:
+            profiler = SamplingProfiler(
+                float(slow_ms) / 1000,
+                os.environ.get('BUDGET_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'budget_profiles')),
+                float(os.environ.get('BUDGET_PROFILE_INTERVAL_MS', DEFAULT_SAMPLE_INTERVAL_MS)) / 1000
+            )
+        return cls(enabled=True, profiler=profiler)
+
+    def stage(self, name):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _observe(self, table, key, value):
+        with self._lock:
+            histogram = table.get(key)
+            if histogram is None:
+                histogram = table[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def observe_stage(self, name, seconds):
+        route = _current_route.get() or 'none'
+        self._observe(self.stages, (route, name), seconds)
+
+    def observe_request(self, route, method, status, seconds):
+        self._observe(self.requests, (route, method, str(status)), seconds)
+
+    def begin_request(self, route):
+        _current_route.set(route)
+        self._local.status = 500
+        self._local.started = time.perf_counter()
+        if self.profiler:
+            self.profiler.begin()
+
+    def set_status(self, status):
+        self._local.status = status
+
+    def end_request(self, method):
+        route = _current_route.get()
+        if route is None:
+            return
+        duration = time.perf_counter() - self._local.started
+        self.observe_request(route, method, self._local.status, duration)
+        _current_route.set(None)
+        if self.profiler:
+            self.profiler.end(route, duration)
+
+    def render(self):
+        """Prometheus text exposition of every histogram"""
+        lines = []
+        with self._lock:
+            self._render(lines, 'budget_request_duration_seconds',
+                         'Request latency by route, method and status',
+                         ('route', 'method', 'status'), self.requests)
+            self._render(lines, 'budget_stage_duration_seconds',
+                         'Time spent in each stage of a request',
+                         ('route', 'stage'), self.stages)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render(lines, name, help_text, label_names, table):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(table.items()):
+            labels = ','.join(f'{label}="{value}"' for label, value in zip(label_names, key))
+            for le, count in histogram.samples():
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+    def init_app(self, app):
+        """Install request hooks and the /metrics endpoint on a Flask app"""
+        if not self.enabled:
+            return
+
+        from flask import Response, request
+
+        @app.before_request
+        def _begin_request():
+            self.begin_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+        @app.after_request
+        def _record_status(response):
+            self.set_status(response.status_code)
+            return response
+
+        @app.teardown_request
+        def _end_request(exc):
+            self.end_request(request.method)
+
+        @app.route('/metrics', methods=['GET'])
+        def metrics_endpoint():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        if self.profiler:
+            self.profiler.start()
+
+
+class MetricsMiddleware:
+    """Request histograms and the /metrics endpoint for an ASGI app
+
+    Requests are labelled with the path template of the route they match, as
+    the Flask hooks do; stages timed while serving them land under that route.
+    """
+
+    def __init__(self, app, metrics, routes):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes
+
+    def _route(self, scope):
+        from starlette.routing import Match
+
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match is not Match.NONE:
+                return route.path
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        if scope['path'] == '/metrics' and scope['method'] == 'GET':
+            from starlette.responses import Response
+
+            response = Response(self.metrics.render(), media_type='text/plain; version=0.0.4')
+            await response(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        token = _current_route.set(route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.observe_request(route, scope['method'], status, time.perf_counter() - started)
+            _current_route.reset(token)
+
+
+metrics = Metrics.from_env()
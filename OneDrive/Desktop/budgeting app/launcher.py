@@ -0,0 +1,175 @@
+"""Pre-forking production launcher for the ASGI app
+
+Each worker runs the app in asgi_app under uvicorn. The parent process
+runs schema migrations once, loads the tax tables and builds the
+pre-serialized reference payloads, then freezes the garbage collector and
+forks the workers. Every worker inherits those read-only structures
+copy-on-write, so starting one is a fork plus a listen on the shared socket,
+not a fresh import. Because the workers are forked from the parent, they
+share the default in-memory rate limit buckets.
+
+Workers accept from one listening socket and the parent replaces any worker
+that dies, waiting longer after each recent crash. When more than
+MAX_RESTARTS workers die within RESTART_WINDOW seconds the parent stops the
+rest and exits with status 1, instead of respawning a worker that cannot
+start in a tight loop.
+
+    python launcher.py --workers 4 --port 8000
+    BUDGET_WORKERS=4 BUDGET_PORT=8000 python launcher.py
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from collections import deque
+
+import uvicorn
+
+import database
+import write_behind
+
+LISTEN_BACKLOG = 2048
+RESTART_BACKOFF = 0.1
+MAX_RESTART_BACKOFF = 10.0
+RESTART_WINDOW = 60.0
+MAX_RESTARTS = 20
+
+
+class RestartPolicy:
+    """Exponential backoff for worker restarts, giving up on a crash loop"""
+
+    def __init__(self, limit=MAX_RESTARTS, window=RESTART_WINDOW, backoff=RESTART_BACKOFF,
+                 max_backoff=MAX_RESTART_BACKOFF, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._exits = deque()
+
+    def record_exit(self):
+        """Seconds to wait before replacing a worker that just exited; None to give up"""
+        now = self.clock()
+        self._exits.append(now)
+        while self._exits[0] <= now - self.window:
+            self._exits.popleft()
+        if len(self._exits) > self.limit:
+            return None
+        return min(self.max_backoff, self.backoff * 2 ** (len(self._exits) - 1))
+
+
+def warm_up():
+    """Import and initialize everything the workers share; returns the ASGI app"""
+    import asgi_app
+    import budget_backend
+
+    budget_backend.init_db()
+    for year in budget_backend.tax_registry.years():
+        budget_backend.county_payloads.get(year)
+        budget_backend.tax_curve_payloads.get(year)
+    budget_backend.frontend_payload.get()
+
+    # SQLite connections must not cross a fork; each worker opens its own
+    database.get_pool().close()
+
+    # Move everything allocated so far out of the collector's reach so GC
+    # passes in the workers don't touch (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+    return asgi_app.app
+
+
+def run_worker(app, listener, forked_at):
+    """Serve requests on the inherited socket until SIGTERM"""
+    # Per-request access lines on stderr cost more than many of the requests
+    server = uvicorn.Server(uvicorn.Config(app, log_level='warning', access_log=False))
+    # uvicorn handles SIGTERM itself and re-raises it once shut down; the
+    # handler it restores must not be the parent's or kill the worker before
+    # queued writes are drained
+    signal.signal(signal.SIGTERM, lambda *_: None)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print(f'worker {os.getpid()} ready in {(time.perf_counter() - forked_at) * 1000:.1f} ms',
+          file=sys.stderr, flush=True)
+    server.run(sockets=[listener])
+
+
+def spawn(app, listener):
+    forked_at = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, listener, forked_at)
+        except BaseException:
+            code = 1
+            raise
+        finally:
+            # os._exit skips atexit, so drain queued writes here
+            write_behind.close_all()
+            os._exit(code)
+    return pid
+
+
+def serve(host, port, workers, restarts=None):
+    """Run the workers until stopped; returns the exit status for the parent"""
+    restarts = restarts or RestartPolicy()
+    app = warm_up()
+    listener = socket.create_server((host, port), backlog=LISTEN_BACKLOG)
+    print(f'serving on http://{host}:{listener.getsockname()[1]} with {workers} workers',
+          file=sys.stderr, flush=True)
+
+    children = {spawn(app, listener) for _ in range(workers)}
+    stopping = False
+    status_code = 0
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if stopping:
+            continue
+        delay = restarts.record_exit()
+        if delay is None:
+            print(f'worker {pid} exited with status {status}; more than {restarts.limit} exits in '
+                  f'{restarts.window:.0f}s, giving up', file=sys.stderr, flush=True)
+            status_code = 1
+            stop()
+            continue
+        print(f'worker {pid} exited with status {status}; restarting in {delay:.1f}s',
+              file=sys.stderr, flush=True)
+        # A signal arriving while asleep runs stop() and the sleep then finishes
+        time.sleep(delay)
+        if not stopping:
+            children.add(spawn(app, listener))
+    listener.close()
+    return status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the budget API with pre-forked workers')
+    parser.add_argument('--host', default=os.environ.get('BUDGET_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BUDGET_PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('BUDGET_WORKERS', os.cpu_count() or 1)))
+    args = parser.parse_args()
+    sys.exit(serve(args.host, args.port, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""Versioned schema migrations tracked with PRAGMA user_version
+
+Each migration is applied once, in order, inside its own transaction. To
+change the schema append a new entry to MIGRATIONS; never edit one that has
+already shipped.
+"""
+
+MIGRATIONS = [
+    (1, "Create users, budget_profiles and user_expenses tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS budget_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            yearly_income REAL NOT NULL,
+            filing_status TEXT DEFAULT 'single',
+            county TEXT DEFAULT 'Los Angeles',
+            housing_budget REAL,
+            transportation_budget REAL,
+            food_budget REAL,
+            savings_budget REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, "Index budget history and expense lookups", [
+        # Profile history: WHERE user_id = ? ORDER BY created_at DESC LIMIT n
+        '''
+        CREATE INDEX IF NOT EXISTS idx_budget_profiles_user_created
+        ON budget_profiles (user_id, created_at DESC)
+        ''',
+        # Expense filters by user, category and date; amount makes it covering
+        # for per-category totals
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_expenses_user_category_date
+        ON user_expenses (user_id, category, date_added, amount)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_expenses_user_date
+        ON user_expenses (user_id, date_added)
+        ''',
+        'ANALYZE',
+    ]),
+    (3, "Maintain per-user, per-category monthly expense totals", [
+        '''
+        CREATE TABLE IF NOT EXISTS expense_monthly_totals (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            month TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, category)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO expense_monthly_totals (user_id, category, month, total, expense_count)
+        SELECT user_id, category, substr(date_added, 1, 7), SUM(amount), COUNT(*)
+        FROM user_expenses
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, category, substr(date_added, 1, 7)
+        ''',
+        # Triggers keep the rollup current for every write path, bulk import included
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_expenses_rollup_insert
+        AFTER INSERT ON user_expenses
+        WHEN NEW.user_id IS NOT NULL
+        BEGIN
+            INSERT INTO expense_monthly_totals (user_id, category, month, total, expense_count)
+            VALUES (NEW.user_id, NEW.category, substr(NEW.date_added, 1, 7), NEW.amount, 1)
+            ON CONFLICT (user_id, month, category) DO UPDATE
+            SET total = total + excluded.total, expense_count = expense_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_expenses_rollup_delete
+        AFTER DELETE ON user_expenses
+        BEGIN
+            UPDATE expense_monthly_totals
+            SET total = total - OLD.amount, expense_count = expense_count - 1
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date_added, 1, 7) AND category = OLD.category;
+            DELETE FROM expense_monthly_totals
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date_added, 1, 7) AND category = OLD.category
+              AND expense_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_expenses_rollup_update
+        AFTER UPDATE OF user_id, category, amount, date_added ON user_expenses
+        BEGIN
+            UPDATE expense_monthly_totals
+            SET total = total - OLD.amount, expense_count = expense_count - 1
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date_added, 1, 7) AND category = OLD.category;
+            DELETE FROM expense_monthly_totals
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date_added, 1, 7) AND category = OLD.category
+              AND expense_count <= 0;
+            INSERT INTO expense_monthly_totals (user_id, category, month, total, expense_count)
+            SELECT NEW.user_id, NEW.category, substr(NEW.date_added, 1, 7), NEW.amount, 1
+            WHERE NEW.user_id IS NOT NULL
+            ON CONFLICT (user_id, month, category) DO UPDATE
+            SET total = total + excluded.total, expense_count = expense_count + 1;
+        END
+        ''',
+    ]),
+    (4, "Store sessions server-side", [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires
+        ON sessions (expires_at)
+        ''',
+    ]),
+    (5, "Index budget history by (user_id, created_at, id)", [
+        # Latest-snapshot lookups order by created_at DESC, id DESC; with id in
+        # the index that is a reverse index scan instead of sorting every row
+        # that shares a timestamp
+        '''
+        CREATE INDEX IF NOT EXISTS idx_budget_profiles_user_created_id
+        ON budget_profiles (user_id, created_at, id)
+        ''',
+        'DROP INDEX IF EXISTS idx_budget_profiles_user_created',
+    ]),
+    (6, "Create savings goals", [
+        '''
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            target_amount REAL NOT NULL,
+            current_amount REAL NOT NULL DEFAULT 0,
+            monthly_contribution REAL,
+            annual_return REAL NOT NULL DEFAULT 0,
+            annual_volatility REAL NOT NULL DEFAULT 0,
+            target_date TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_goals_user
+        ON goals (user_id, id)
+        ''',
+    ]),
+    (7, "Store rate limit token buckets", [
+        '''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (8, "Index rate limit buckets by last use for pruning", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated
+        ON rate_limit_buckets (updated_at)
+        ''',
+    ]),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: latest); returns the applied versions"""
+    target = latest_version() if target is None else target
+    applied = []
+
+    for version, description, statements in MIGRATIONS:
+        if version > target:
+            break
+
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # processes migrate one at a time; re-check the version once held
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
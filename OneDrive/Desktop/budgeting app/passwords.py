@@ -0,0 +1,276 @@
+"""Salted, tunable password hashing off the request path
+
+Passwords are hashed with scrypt (default) or PBKDF2-HMAC-SHA256 from
+hashlib and stored as self-describing strings:
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+
+Hashing runs in a bounded process pool, so a burst of logins uses at most
+BUDGET_HASH_WORKERS cores and never holds the GIL of a request worker or an
+event loop. When more than BUDGET_HASH_MAX_PENDING hashes are queued new
+ones are refused with HasherBusy instead of piling up.
+
+Legacy unsalted sha256 hex digests still verify; needs_rehash() reports them
+(and hashes made with other parameters) so the login path can upgrade them.
+
+    BUDGET_PASSWORD_HASHER   scrypt | pbkdf2
+    BUDGET_SCRYPT_N / _R / _P, BUDGET_PBKDF2_ITERATIONS
+    BUDGET_HASH_WORKERS      pool size; 0 hashes inline in the calling thread
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+SALT_BYTES = 16
+DEFAULT_SCRYPT_N = 2 ** 14
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+DEFAULT_PBKDF2_ITERATIONS = 600000
+# Tries per call when the pool breaks: the original plus one on a fresh pool
+POOL_ATTEMPTS = 2
+
+
+class HasherBusy(RuntimeError):
+    pass
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class ScryptHasher:
+    algorithm = 'scrypt'
+
+    def __init__(self, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P, dklen=32):
+        self.n, self.r, self.p, self.dklen = int(n), int(r), int(p), int(dklen)
+
+    def params(self):
+        return (self.n, self.r, self.p)
+
+    def _derive(self, password, salt, n, r, p, dklen):
+        # OpenSSL needs 128 * r * (n + p + 2) bytes; hashlib's default cap is 32 MiB
+        maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=dklen)
+
+    def hash(self, password):
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = self._derive(password, salt, self.n, self.r, self.p, self.dklen)
+        return f'scrypt${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}'
+
+    def verify(self, password, encoded):
+        _, n, r, p, salt, digest = encoded.split('$')
+        expected = _b64decode(digest)
+        actual = self._derive(password, _b64decode(salt), int(n), int(r), int(p), len(expected))
+        return hmac.compare_digest(actual, expected)
+
+    def encoded_params(self, encoded):
+        return tuple(int(value) for value in encoded.split('$')[1:4])
+
+
+class Pbkdf2Hasher:
+    algorithm = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=DEFAULT_PBKDF2_ITERATIONS, dklen=32):
+        self.iterations, self.dklen = int(iterations), int(dklen)
+
+    def params(self):
+        return (self.iterations,)
+
+    def hash(self, password):
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations, self.dklen)
+        return f'pbkdf2_sha256${self.iterations}${_b64encode(salt)}${_b64encode(digest)}'
+
+    def verify(self, password, encoded):
+        _, iterations, salt, digest = encoded.split('$')
+        expected = _b64decode(digest)
+        actual = hashlib.pbkdf2_hmac('sha256', password.encode(), _b64decode(salt), int(iterations), len(expected))
+        return hmac.compare_digest(actual, expected)
+
+    def encoded_params(self, encoded):
+        return (int(encoded.split('$')[1]),)
+
+
+class LegacySha256Hasher:
+    """Unsalted sha256 hex digests from before salted hashing; verify only"""
+    algorithm = 'sha256'
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+
+
+HASHERS = {
+    'scrypt': ScryptHasher,
+    'pbkdf2': Pbkdf2Hasher,
+    'pbkdf2_sha256': Pbkdf2Hasher,
+}
+
+
+def hasher_from_env():
+    name = os.environ.get('BUDGET_PASSWORD_HASHER', 'scrypt').lower()
+    if name == 'scrypt':
+        return ScryptHasher(
+            n=os.environ.get('BUDGET_SCRYPT_N', DEFAULT_SCRYPT_N),
+            r=os.environ.get('BUDGET_SCRYPT_R', DEFAULT_SCRYPT_R),
+            p=os.environ.get('BUDGET_SCRYPT_P', DEFAULT_SCRYPT_P))
+    if name in ('pbkdf2', 'pbkdf2_sha256'):
+        return Pbkdf2Hasher(os.environ.get('BUDGET_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS))
+    raise ValueError(f'Unknown password hasher: {name}')
+
+
+def identify(encoded, hashers=None):
+    """Hasher able to verify an encoded hash"""
+    algorithm = encoded.split('$', 1)[0]
+    if algorithm == encoded:
+        return LegacySha256Hasher()
+    configured = hashers or {}
+    if algorithm in configured:
+        return configured[algorithm]
+    try:
+        return HASHERS[algorithm]()
+    except KeyError:
+        raise ValueError(f'Unknown password hash algorithm: {algorithm}')
+
+
+# Pool entry points; module-level so they pickle by reference
+
+def _hash(hasher, password):
+    return hasher.hash(password)
+
+
+def _verify(hasher, password, encoded):
+    return hasher.verify(password, encoded)
+
+
+class PasswordHasher:
+    """The configured hasher plus the process pool it runs in"""
+
+    def __init__(self, hasher=None, workers=None, max_pending=None):
+        self.hasher = hasher or hasher_from_env()
+        if workers is None:
+            workers = int(os.environ.get('BUDGET_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+        self.workers = workers
+        if max_pending is None:
+            max_pending = int(os.environ.get('BUDGET_HASH_MAX_PENDING', 64 * max(workers, 1)))
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        # Verified against when the user does not exist so unknown usernames
+        # take as long as wrong passwords
+        self._dummy_hash = None
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn: forking a threaded server process is unsafe
+                    self._pool = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _discard(self, pool):
+        """Drop a broken pool so the next call starts a fresh one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, pool, fn, *args):
+        """Future for fn(*args) in the pool; raises HasherBusy when the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password hashes in progress')
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _call(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        # A worker that dies breaks the whole pool; rebuild it and retry once
+        for _ in range(POOL_ATTEMPTS):
+            pool = self._executor()
+            try:
+                return self._submit(pool, fn, *args).result()
+            except BrokenProcessPool as e:
+                self._discard(pool)
+                error = e
+        raise HasherBusy('Password hashing pool is unavailable') from error
+
+    async def _call_async(self, fn, *args):
+        if self.workers <= 0:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        for _ in range(POOL_ATTEMPTS):
+            pool = self._executor()
+            try:
+                return await asyncio.wrap_future(self._submit(pool, fn, *args))
+            except BrokenProcessPool as e:
+                self._discard(pool)
+                error = e
+        raise HasherBusy('Password hashing pool is unavailable') from error
+
+    def _verify_args(self, password, encoded):
+        encoded = encoded if encoded is not None else self._dummy_hash
+        return identify(encoded, {self.hasher.algorithm: self.hasher}), password, encoded
+
+    def hash(self, password):
+        return self._call(_hash, self.hasher, password)
+
+    def verify(self, password, encoded):
+        """True when password matches encoded; encoded=None fails after the same amount of work"""
+        if encoded is None and self._dummy_hash is None:
+            self._dummy_hash = self.hash(secrets.token_hex(16))
+        matched = self._call(_verify, *self._verify_args(password, encoded))
+        return matched and encoded is not None
+
+    async def hash_async(self, password):
+        return await self._call_async(_hash, self.hasher, password)
+
+    async def verify_async(self, password, encoded):
+        if encoded is None and self._dummy_hash is None:
+            self._dummy_hash = await self.hash_async(secrets.token_hex(16))
+        matched = await self._call_async(_verify, *self._verify_args(password, encoded))
+        return matched and encoded is not None
+
+    def needs_rehash(self, encoded):
+        """True for legacy hashes and hashes made with another algorithm or cost"""
+        algorithm = encoded.split('$', 1)[0]
+        if algorithm != self.hasher.algorithm:
+            return True
+        return self.hasher.encoded_params(encoded) != self.hasher.params()
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_hasher():
+    """Process-wide PasswordHasher, configured from the environment on first use"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = PasswordHasher()
+    return _default
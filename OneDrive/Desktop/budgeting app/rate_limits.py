@@ -0,0 +1,459 @@
+"""Per-route token-bucket rate limits and concurrency limits
+
+Each limited route has token buckets keyed by client IP and, for logged-in
+requests, by user id. A request takes one token from each bucket and gets a
+429 with Retry-After when a bucket is empty. A route can also cap how many
+requests run at once in a worker. Up to max_queue more wait at most
+queue_timeout seconds for a slot. Anything beyond that gets a 503
+immediately instead of adding to the queue.
+
+Buckets live in one of three places:
+
+    memory (default)  fixed-size hash table in an anonymous shared memory
+                      map. It is created at import, so it is shared with
+                      every process forked afterwards, such as the workers
+                      of launcher.py. Each check is a few array reads under
+                      one lock. Processes started some other way (uvicorn
+                      --workers spawns fresh interpreters) each get their
+                      own table, so limits then apply per worker.
+    shared            the same table, but refused in a spawned process
+                      rather than silently becoming per worker.
+    sqlite            a row per bucket in the rate_limit_buckets table.
+                      Shared by any process using the database, at the
+                      cost of one small write per check. Waits at most
+                      STORE_TIMEOUT_MS for the database's write lock. A
+                      background thread deletes rows idle long enough to
+                      have refilled.
+
+Checks fail open: if the bucket store errors or its lock can't be had in
+time, the request is let through and the failure logged, so a busy database
+or a dead worker never turns into errors on limited routes.
+
+Routes without a limit skip all of this after one dict lookup. Configure
+with BUDGET_RATE_LIMIT_BACKEND and BUDGET_RATE_LIMITS. The latter is a JSON
+object mapping routes to RouteLimit fields, merged over DEFAULT_LIMITS.
+Setting it to "off" disables limiting.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+import database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = 1 << 16
+DEFAULT_SWEEP_INTERVAL = 300.0
+LOCK_TIMEOUT = 0.05
+STORE_TIMEOUT_MS = 50
+
+RouteLimit = namedtuple('RouteLimit', [
+    'ip_rate', 'ip_burst',          # tokens/second and bucket size per client IP
+    'user_rate', 'user_burst',      # the same per logged-in user (None: no user bucket)
+    'max_concurrent', 'max_queue', 'queue_timeout',
+], defaults=(None, None, None, 0, 1.0))
+
+DEFAULT_LIMITS = {
+    # Each attempt costs a KDF hash; slow guessing and bursts alike
+    '/api/login': RouteLimit(ip_rate=0.5, ip_burst=10, max_concurrent=8, max_queue=16),
+    '/api/register': RouteLimit(ip_rate=0.2, ip_burst=5, max_concurrent=8, max_queue=16),
+    # Logged-in calls also queue a snapshot write
+    '/api/calculate-budget': RouteLimit(ip_rate=50, ip_burst=200, user_rate=10, user_burst=50,
+                                        max_concurrent=64, max_queue=128),
+    '/api/calculate-budget/batch': RouteLimit(ip_rate=1, ip_burst=10, max_concurrent=4, max_queue=8),
+    '/api/scenarios': RouteLimit(ip_rate=1, ip_burst=10, max_concurrent=4, max_queue=8),
+    '/api/convert-income/batch': RouteLimit(ip_rate=1, ip_burst=10, max_concurrent=4, max_queue=8),
+}
+
+
+def _key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+class SharedBuckets:
+    """Token buckets in a shared memory hash table
+
+    A slot holds a key fingerprint, a token count and the last refill time.
+    A key landing on a slot owned by another key takes it over with a full
+    bucket, so collisions can only make limiting more lenient.
+
+    The pid of the process holding the lock is kept in the map. A worker
+    killed inside take() would otherwise leave every other worker waiting
+    forever; a waiter that times out breaks the lock of a dead holder.
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS):
+        self.slots = slots
+        self._map = mmap.mmap(-1, slots * 24 + 8)
+        self._fingerprints = np.ndarray(slots, dtype=np.uint64, buffer=self._map, offset=0)
+        self._tokens = np.ndarray(slots, dtype=np.float64, buffer=self._map, offset=slots * 8)
+        self._updated = np.ndarray(slots, dtype=np.float64, buffer=self._map, offset=slots * 16)
+        self._owner = np.ndarray(1, dtype=np.int64, buffer=self._map, offset=slots * 24)
+        # A semaphore rather than a threading lock so forked workers share it
+        self._lock = multiprocessing.Lock()
+
+    def _acquire(self):
+        """Take the cross-process lock; False when it can't be had in time"""
+        if self._lock.acquire(timeout=LOCK_TIMEOUT):
+            return True
+        owner = int(self._owner[0])
+        if not owner or _alive(owner):
+            return False
+        logger.warning('Breaking the rate limit lock held by exited process %d', owner)
+        self._owner[0] = 0
+        try:
+            self._lock.release()
+        except ValueError:
+            pass
+        return self._lock.acquire(timeout=LOCK_TIMEOUT)
+
+    def take(self, key, rate, burst, now=None):
+        """Take a token; returns 0 on success, else seconds until one is available"""
+        now = time.time() if now is None else now
+        fingerprint = _key_hash(key)
+        slot = fingerprint % self.slots
+        if not self._acquire():
+            raise StoreUnavailable('Timed out waiting for the rate limit lock')
+        try:
+            self._owner[0] = os.getpid()
+            if int(self._fingerprints[slot]) != fingerprint:
+                self._fingerprints[slot] = fingerprint
+                tokens = float(burst)
+            else:
+                tokens = min(float(burst), float(self._tokens[slot]) + (now - float(self._updated[slot])) * rate)
+            self._updated[slot] = now
+            if tokens >= 1:
+                self._tokens[slot] = tokens - 1
+                return 0
+            self._tokens[slot] = tokens
+        finally:
+            self._owner[0] = 0
+            self._lock.release()
+        return (1 - tokens) / rate
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class StoreUnavailable(Exception):
+    """The bucket store could not be read or updated in time"""
+
+
+class SqliteBuckets:
+    """Token buckets as rows, shared by every process using the database
+
+    A bucket left alone for idle_after seconds has refilled, which is the
+    state a missing row starts in, so deleting it changes nothing.
+    """
+
+    def __init__(self, idle_after=0, sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.idle_after = idle_after
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+
+    def prune(self, now=None):
+        """Delete buckets idle for at least idle_after seconds; returns how many were removed"""
+        now = time.time() if now is None else now
+        with database.transaction() as conn:
+            return conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at <= ?',
+                                (now - self.idle_after,)).rowcount
+
+    def _ensure_sweeper(self):
+        # Started lazily, and again in each forked worker, since threads do not survive fork
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='rate-limit-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.prune()
+            except sqlite3.Error:
+                logger.exception('Rate limit bucket sweep failed')
+
+    def take(self, key, rate, burst, now=None):
+        self._ensure_sweeper()
+        now = time.time() if now is None else now
+        try:
+            return self._take(key, rate, burst, now)
+        except sqlite3.Error as e:
+            raise StoreUnavailable(str(e)) from e
+
+    def _take(self, key, rate, burst, now):
+        with database.transaction() as conn:
+            # Another writer holding the database must not stall the request
+            conn.execute(f'PRAGMA busy_timeout = {STORE_TIMEOUT_MS}')
+            try:
+                return self._update(conn, key, rate, burst, now)
+            finally:
+                conn.execute(f'PRAGMA busy_timeout = {database.BUSY_TIMEOUT_MS}')
+
+    @staticmethod
+    def _update(conn, key, rate, burst, now):
+        row = conn.execute('''
+            INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (:key, :burst - 1, :now)
+            ON CONFLICT (key) DO UPDATE
+            SET tokens = MIN(:burst, tokens + (:now - updated_at) * :rate) - 1, updated_at = :now
+            WHERE MIN(:burst, tokens + (:now - updated_at) * :rate) >= 1
+            RETURNING tokens
+        ''', {"key": key, "rate": rate, "burst": burst, "now": now}).fetchone()
+        if row is not None:
+            return 0
+        tokens = conn.execute('SELECT MIN(?, tokens + (? - updated_at) * ?) FROM rate_limit_buckets WHERE key = ?',
+                              (burst, now, rate, key)).fetchone()[0]
+        return (1 - tokens) / rate
+
+
+class ConcurrencyLimit:
+    """In-flight cap for one route in this process, with a short bounded queue"""
+
+    def __init__(self, max_concurrent, max_queue=0, queue_timeout=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """True once a slot is held; False when the queue is full or the wait timed out"""
+        with self._condition:
+            if self.in_flight < self.max_concurrent:
+                self.in_flight += 1
+                return True
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self.in_flight < self.max_concurrent,
+                                                self.queue_timeout):
+                    return False
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class AsyncConcurrencyLimit:
+    """ConcurrencyLimit for an event loop: queued requests wait without blocking it
+
+    A released slot is handed straight to the longest waiting request, so
+    at most max_concurrent run and at most max_queue wait.
+    """
+
+    def __init__(self, max_concurrent, max_queue=0, queue_timeout=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        """True once a slot is held; False when the queue is full or the wait timed out"""
+        if self.in_flight < self.max_concurrent:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        except BaseException:
+            # Cancelled after release() handed over the slot; pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return True
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class Rejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def headers(self):
+        return {'Retry-After': str(max(1, math.ceil(self.retry_after)))}
+
+
+def limits_from_env():
+    config = os.environ.get('BUDGET_RATE_LIMITS', '').strip()
+    if config.lower() in ('off', '0', 'false', 'no'):
+        return {}
+    limits = dict(DEFAULT_LIMITS)
+    if config:
+        for route, fields in json.loads(config).items():
+            limits[route] = None if fields is None else RouteLimit(**fields)
+    return {route: limit for route, limit in limits.items() if limit is not None}
+
+
+def refill_seconds(limits):
+    """Longest time any bucket in the limits takes to refill from empty"""
+    return max((burst / rate
+                for limit in limits.values()
+                for rate, burst in ((limit.ip_rate, limit.ip_burst), (limit.user_rate, limit.user_burst))
+                if rate), default=0)
+
+
+def buckets_from_env(limits):
+    backend = os.environ.get('BUDGET_RATE_LIMIT_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        return SqliteBuckets(
+            idle_after=refill_seconds(limits),
+            sweep_interval=float(os.environ.get('BUDGET_RATE_LIMIT_SWEEP_INTERVAL', DEFAULT_SWEEP_INTERVAL))
+        )
+    if backend not in ('memory', 'shared'):
+        raise ValueError(f'Unknown rate limit backend: {backend}')
+    # A spawned worker re-imports the app and maps a table of its own
+    if multiprocessing.parent_process() is not None:
+        if backend == 'shared':
+            raise ValueError('The shared rate limit backend needs workers forked by launcher.py; '
+                             'use BUDGET_RATE_LIMIT_BACKEND=memory or sqlite')
+        logger.info('Rate limit buckets are per worker in this spawned process')
+    return SharedBuckets(int(os.environ.get('BUDGET_RATE_LIMIT_SLOTS', DEFAULT_SLOTS)))
+
+
+class RateLimiter:
+    def __init__(self, limits=None, buckets=None):
+        self.limits = limits_from_env() if limits is None else limits
+        self.buckets = buckets if buckets is not None or not self.limits else buckets_from_env(self.limits)
+        self.concurrency = {
+            route: ConcurrencyLimit(limit.max_concurrent, limit.max_queue, limit.queue_timeout)
+            for route, limit in self.limits.items() if limit.max_concurrent
+        }
+
+    def check_rate(self, route, ip, user_id=None):
+        """Raise Rejected (429) when the IP's or user's bucket for the route is empty"""
+        limit = self.limits[route]
+        waits = []
+        if limit.ip_rate and ip:
+            waits.append(self._take(f'{route}|ip|{ip}', limit.ip_rate, limit.ip_burst))
+        if limit.user_rate and user_id is not None:
+            waits.append(self._take(f'{route}|user|{user_id}', limit.user_rate, limit.user_burst))
+        retry_after = max(waits, default=0)
+        if retry_after:
+            raise Rejected(429, "Too many requests", retry_after)
+
+    def _take(self, key, rate, burst):
+        try:
+            return self.buckets.take(key, rate, burst)
+        except StoreUnavailable as e:
+            # Fail open: an unavailable store must not fail the request
+            logger.warning('Rate limit check skipped for %s: %s', key, e)
+            return 0
+
+    def init_app(self, app):
+        """Install the limits as request hooks on a Flask app"""
+        if not self.limits:
+            return
+
+        from flask import g, jsonify, request, session
+
+        @app.before_request
+        def _limit_request():
+            rule = request.url_rule.rule if request.url_rule else None
+            if rule not in self.limits:
+                return None
+            try:
+                self.check_rate(rule, request.remote_addr, session.get('user_id'))
+                concurrency = self.concurrency.get(rule)
+                if concurrency is not None:
+                    if not concurrency.acquire():
+                        raise Rejected(503, "Server busy, try again", 1)
+                    g.concurrency_slot = concurrency
+            except Rejected as e:
+                return jsonify({"error": str(e)}), e.status, e.headers()
+            return None
+
+        @app.teardown_request
+        def _release_slot(exc):
+            concurrency = g.pop('concurrency_slot', None)
+            if concurrency is not None:
+                concurrency.release()
+
+
+class RateLimitMiddleware:
+    """The same limits as ASGI middleware, keyed on the request path"""
+
+    def __init__(self, app, limiter):
+        self.app = app
+        self.limiter = limiter
+        self.concurrency = {
+            route: AsyncConcurrencyLimit(limit.max_concurrent, limit.max_queue, limit.queue_timeout)
+            for route, limit in limiter.limits.items() if limit.max_concurrent
+        }
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path')
+        if scope['type'] != 'http' or path not in self.limiter.limits:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.concurrency import run_in_threadpool
+        from starlette.responses import JSONResponse
+
+        client = scope.get('client')
+        session = scope.get('session') or {}
+        concurrency = self.concurrency.get(path)
+        try:
+            # Checks may wait on a cross-process lock or the database; keep them off the event loop
+            await run_in_threadpool(self.limiter.check_rate, path, client[0] if client else None,
+                                    session.get('user_id'))
+            if concurrency is not None and not await concurrency.acquire():
+                raise Rejected(503, "Server busy, try again", 1)
+        except Rejected as e:
+            await JSONResponse({"error": str(e)}, status_code=e.status, headers=e.headers())(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if concurrency is not None:
+                concurrency.release()
@@ -0,0 +1,62 @@
+from datetime import date
+
+import database
+
+DEFAULT_REPORT_MONTHS = 12
+MAX_REPORT_MONTHS = 120
+
+# Expense categories that have a matching budget_profiles column
+BUDGETED_CATEGORIES = ('housing', 'transportation', 'food', 'savings')
+
+
+def first_month(months, today=None):
+    """'YYYY-MM' of the first month in a window of the given length ending this month"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def monthly_totals(user_id, since_month):
+    """Rollup rows (month, category, total, expense_count) from since_month onwards"""
+    with database.connection() as conn:
+        return conn.execute('''
+            SELECT month, category, total, expense_count
+            FROM expense_monthly_totals
+            WHERE user_id = ? AND month >= ?
+            ORDER BY month DESC, category
+        ''', (user_id, since_month)).fetchall()
+
+
+def spending_report(user_id, months=DEFAULT_REPORT_MONTHS):
+    """Per-month spending by category compared against the latest budget profile
+
+    Reads only the monthly rollup table, so the cost depends on categories x
+    months rather than on the number of expenses.
+    """
+    months = max(1, min(int(months), MAX_REPORT_MONTHS))
+    profile = database.latest_budget_profile(user_id)
+    budget = None
+    if profile:
+        budget = dict(zip(BUDGETED_CATEGORIES, profile[3:7]))
+
+    report = {}
+    for month, category, total, count in monthly_totals(user_id, first_month(months)):
+        entry = report.setdefault(month, {"month": month, "total_spent": 0.0, "categories": []})
+        limit = budget.get(category.lower()) if budget else None
+        entry["total_spent"] += total
+        entry["categories"].append({
+            "category": category,
+            "spent": round(total, 2),
+            "count": count,
+            "budget": round(limit, 2) if limit is not None else None,
+            "remaining": round(limit - total, 2) if limit is not None else None
+        })
+
+    for entry in report.values():
+        entry["total_spent"] = round(entry["total_spent"], 2)
+
+    return {
+        "budget": {k: round(v, 2) for k, v in budget.items() if v is not None} if budget else None,
+        "budget_created_at": profile[7] if profile else None,
+        "months": list(report.values())
+    }
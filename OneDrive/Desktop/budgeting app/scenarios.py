@@ -0,0 +1,92 @@
+import numpy as np
+
+MAX_SCENARIO_POINTS = 1000000
+MAX_INCOME_STEPS = 100000
+
+SCENARIO_FIELDS = (
+    'federal_tax', 'state_tax', 'county_tax', 'social_security_tax', 'medicare_tax',
+    'total_taxes', 'net_yearly_income', 'monthly_net_income', 'effective_rate', 'marginal_rate'
+)
+DEFAULT_SCENARIO_FIELDS = ('total_taxes', 'net_yearly_income', 'effective_rate', 'marginal_rate')
+FILING_STATUSES = ('single', 'married')
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+
+def _string_list(values, name):
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ScenarioError(f"{name} must be a list of strings")
+    return values
+
+
+def income_axis(spec):
+    """Income values from a list or an inclusive {min, max, step} range"""
+    if isinstance(spec, list):
+        if not all(_is_number(value) for value in spec):
+            raise ScenarioError("Incomes must be numbers")
+        incomes = np.array(spec, dtype=float)
+    elif isinstance(spec, dict):
+        bounds = (spec.get('min'), spec.get('max'), spec.get('step', 1000))
+        if not all(_is_number(value) for value in bounds):
+            raise ScenarioError("Income range needs numeric min, max and step")
+        low, high, step = map(float, bounds)
+        if step <= 0 or high < low:
+            raise ScenarioError("Invalid income range")
+        if (high - low) / step >= MAX_INCOME_STEPS:
+            raise ScenarioError(f"Income range is limited to {MAX_INCOME_STEPS} steps")
+        incomes = low + step * np.arange(int((high - low) / step + 1e-9) + 1)
+    else:
+        raise ScenarioError("Expected income as a list or a {min, max, step} range")
+
+    if incomes.size == 0 or incomes.size > MAX_INCOME_STEPS or not np.all(incomes > 0):
+        raise ScenarioError("Incomes must be a non-empty list of positive amounts")
+    return incomes
+
+
+def scenario_axes(data, tables):
+    """(incomes, counties, filing_statuses, fields) from a request body, validated
+
+    Unknown counties fall back to the default county rate, as in a single
+    budget calculation; unknown filing statuses and fields are rejected.
+    """
+    counties = _string_list(data.get('counties') or list(tables.county_rates), 'counties')
+    filing_statuses = _string_list(data.get('filing_statuses') or list(FILING_STATUSES), 'filing_statuses')
+    fields = _string_list(data.get('fields') or list(DEFAULT_SCENARIO_FIELDS), 'fields')
+
+    unknown = [status for status in filing_statuses if status not in FILING_STATUSES]
+    if unknown:
+        raise ScenarioError(f"Unknown filing statuses: {', '.join(unknown)}")
+    unknown = [field for field in fields if field not in SCENARIO_FIELDS]
+    if unknown:
+        raise ScenarioError(f"Unknown fields: {', '.join(unknown)}")
+    return income_axis(data.get('income')), counties, filing_statuses, fields
+
+
+def run_scenarios(engine, incomes, counties, filing_statuses, fields=DEFAULT_SCENARIO_FIELDS):
+    """Evaluate the full income x county x filing-status grid
+
+    Returns columnar results nested as results[filing_status][field], each a
+    list per county (or a single list for county-independent fields), aligned
+    with the incomes axis. The marginal rate is the extra tax on the next dollar.
+    """
+    points = len(incomes) * len(counties) * len(filing_statuses)
+    if points > MAX_SCENARIO_POINTS:
+        raise ScenarioError(f"Scenario grid is limited to {MAX_SCENARIO_POINTS} points")
+
+    results = {}
+    for filing_status in filing_statuses:
+        grid = engine.calculate_grid(incomes, filing_status, counties)
+        if 'effective_rate' in fields:
+            grid['effective_rate'] = grid['total_taxes'] / incomes * 100
+        if 'marginal_rate' in fields:
+            next_dollar = engine.calculate_grid(incomes + 1, filing_status, counties)
+            grid['marginal_rate'] = (next_dollar['total_taxes'] - grid['total_taxes']) * 100
+
+        results[filing_status] = {field: np.round(grid[field], 2).tolist() for field in fields}
+    return results
@@ -0,0 +1,250 @@
+"""Server-side sessions in SQLite with an in-process LRU cache in front
+
+The cookie carries only a random session id; session data lives in the
+sessions table, so any worker process can serve any session and a session
+is revoked by deleting its row. Lookups hit an in-process LRU cache first
+(one dict lookup on the hot path) and fall back to a primary-key read.
+Cached entries are trusted for BUDGET_SESSION_CACHE_TTL seconds, which bounds
+how long a change made by another worker process can go unseen.
+
+The id is rotated whenever session data changes (login, logout), so an id
+handed out before login is never authenticated. Sessions expire
+BUDGET_SESSION_LIFETIME seconds after their last use; a background thread
+deletes expired rows every BUDGET_SESSION_SWEEP_INTERVAL seconds.
+
+Flask uses ServerSessionInterface; the ASGI app uses ServerSessionMiddleware.
+Both share one SessionStore.
+"""
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIFETIME = 7 * 24 * 3600
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 5.0
+DEFAULT_SWEEP_INTERVAL = 300.0
+COOKIE_NAME = 'budget_session'
+MAX_SID_LENGTH = 64
+
+
+class SessionStore:
+    """Session rows plus the LRU cache in front of them"""
+
+    def __init__(self, lifetime=None, cache_size=None, cache_ttl=None, sweep_interval=None):
+        env = os.environ.get
+        self.lifetime = int(lifetime or env('BUDGET_SESSION_LIFETIME', DEFAULT_LIFETIME))
+        self.cache_size = int(cache_size or env('BUDGET_SESSION_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+        self.cache_ttl = float(cache_ttl if cache_ttl is not None else env('BUDGET_SESSION_CACHE_TTL', DEFAULT_CACHE_TTL))
+        self.sweep_interval = float(sweep_interval or env('BUDGET_SESSION_SWEEP_INTERVAL', DEFAULT_SWEEP_INTERVAL))
+        # sid -> (data, expires_at, trusted_until)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+
+    @staticmethod
+    def new_sid():
+        return secrets.token_urlsafe(32)
+
+    def _remember(self, sid, data, expires_at):
+        with self._lock:
+            self._cache[sid] = (data, expires_at, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def cached(self, sid):
+        """(data, expires_at) from the cache, None when not cached or stale"""
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None:
+                return None
+            data, expires_at, trusted_until = entry
+            if time.monotonic() >= trusted_until or expires_at <= time.time():
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+        # Callers mutate their copy; the cached dict only changes through save()
+        return dict(data), expires_at
+
+    def load(self, sid):
+        """(data, expires_at) for a live session, else None"""
+        if not sid or len(sid) > MAX_SID_LENGTH:
+            return None
+        self._ensure_sweeper()
+        found = self.cached(sid)
+        if found is not None:
+            return found
+        row = database.load_session(sid)
+        if row is None or row[1] <= time.time():
+            return None
+        data = json.loads(row[0])
+        self._remember(sid, data, row[1])
+        return dict(data), row[1]
+
+    def save(self, sid, data):
+        """Store data under sid; returns the new expiry"""
+        self._ensure_sweeper()
+        expires_at = int(time.time()) + self.lifetime
+        data = dict(data)
+        database.save_session(sid, json.dumps(data), expires_at)
+        self._remember(sid, data, expires_at)
+        return expires_at
+
+    def needs_touch(self, expires_at):
+        """Extend a session once less than half its lifetime is left, not on every request"""
+        return expires_at - time.time() < self.lifetime / 2
+
+    def touch(self, sid, data):
+        expires_at = int(time.time()) + self.lifetime
+        database.touch_session(sid, expires_at)
+        self._remember(sid, dict(data), expires_at)
+
+    def delete(self, sid):
+        database.delete_session(sid)
+        self._forget(sid)
+
+    def sweep(self):
+        """Delete expired sessions from the table and the cache"""
+        now = time.time()
+        removed = database.delete_expired_sessions(int(now))
+        with self._lock:
+            for sid in [sid for sid, entry in self._cache.items() if entry[1] <= now]:
+                del self._cache[sid]
+        return removed
+
+    def _ensure_sweeper(self):
+        # Started lazily, and again in each forked worker, since threads do not survive fork
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                logger.exception('Session sweep failed')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=0):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+
+
+def _rotate(store, old_sid, data):
+    """Save changed session data under a fresh id and drop the old one"""
+    if old_sid:
+        store.delete(old_sid)
+    if not data:
+        return None
+    sid = store.new_sid()
+    store.save(sid, data)
+    return sid
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by a SessionStore"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(COOKIE_NAME)
+        found = self.store.load(sid)
+        if found is None:
+            return ServerSession()
+        data, expires_at = found
+        return ServerSession(data, sid, expires_at)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.modified:
+            sid = _rotate(self.store, session.sid, dict(session))
+            if sid is None:
+                if session.sid:
+                    response.delete_cookie(COOKIE_NAME, domain=domain, path=path)
+                return
+            response.set_cookie(
+                COOKIE_NAME, sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                domain=domain, path=path)
+        elif session.sid and self.store.needs_touch(session.expires_at):
+            self.store.touch(session.sid, dict(session))
+
+
+class ServerSessionMiddleware:
+    """ASGI middleware exposing a SessionStore as scope['session']"""
+
+    def __init__(self, app, store, https_only=False):
+        self.app = app
+        self.store = store
+        self.https_only = https_only
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket'):
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.concurrency import run_in_threadpool
+        from starlette.datastructures import MutableHeaders
+        from starlette.requests import HTTPConnection
+
+        sid = HTTPConnection(scope).cookies.get(COOKIE_NAME)
+        found = self.store.cached(sid) if sid and len(sid) <= MAX_SID_LENGTH else None
+        if found is None and sid:
+            found = await run_in_threadpool(self.store.load, sid)
+        if found is None:
+            sid, original, expires_at = None, {}, 0
+        else:
+            (original, expires_at) = found
+        scope['session'] = dict(original)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                session = scope['session']
+                if session != original:
+                    new_sid = await run_in_threadpool(_rotate, self.store, sid, dict(session))
+                    headers = MutableHeaders(scope=message)
+                    flags = 'path=/; httponly; samesite=lax' + ('; secure' if self.https_only else '')
+                    if new_sid is not None:
+                        headers.append('Set-Cookie', f'{COOKIE_NAME}={new_sid}; {flags}')
+                    elif sid:
+                        headers.append('Set-Cookie', f'{COOKIE_NAME}=; expires=Thu, 01 Jan 1970 00:00:00 GMT; {flags}')
+                elif sid and self.store.needs_touch(expires_at):
+                    await run_in_threadpool(self.store.touch, sid, session)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,161 @@
+"""Pre-serialized, pre-compressed responses for immutable reference data
+
+A Payload is serialized once and compressed once per supported encoding (gzip
+always, brotli when the brotli package is installed). Every representation
+gets a strong ETag derived from its bytes, so conditional GETs are answered
+with a bodiless 304 and repeat fetches cost a header comparison.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FILE_CHECK_INTERVAL = 1.0
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Below this size compression saves less than the extra header costs
+MIN_COMPRESS_BYTES = 256
+
+
+def _etag(body, suffix=''):
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}{suffix}"'
+
+
+def parse_accept_encoding(header):
+    """Encodings the client accepts, i.e. listed without q=0"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check; uses the weak comparison RFC 9110 prescribes for it"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+class Payload:
+    """One immutable response body with its compressed variants and ETags"""
+
+    def __init__(self, body, content_type, cache_control):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        # encoding -> (body, etag); identity is the fallback
+        self.variants = {'identity': (body, _etag(body))}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            if brotli is not None:
+                self.variants['br'] = (brotli.compress(body, quality=BROTLI_QUALITY), _etag(body, '-br'))
+            self.variants['gzip'] = (gzip.compress(body, GZIP_LEVEL, mtime=0), _etag(body, '-gz'))
+
+    @classmethod
+    def json(cls, data, cache_control):
+        body = json.dumps(data, sort_keys=True, separators=(',', ':')).encode()
+        return cls(body, 'application/json', cache_control)
+
+    def select(self, accept_encoding):
+        """(encoding, body, etag) of the best variant for an Accept-Encoding header"""
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                return (encoding,) + self.variants[encoding]
+        return ('identity',) + self.variants['identity']
+
+    def respond(self, accept_encoding=None, if_none_match=None):
+        """(status, body, headers) for a request, 304 when the client's copy is current"""
+        encoding, body, etag = self.select(accept_encoding)
+        headers = {'ETag': etag, 'Cache-Control': self.cache_control}
+        if len(self.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if etag_matches(if_none_match, etag):
+            return 304, b'', headers
+
+        headers['Content-Type'] = self.content_type
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, body, headers
+
+    def response(self, request):
+        """Flask response for the current request"""
+        from flask import Response
+
+        status, body, headers = self.respond(request.headers.get('Accept-Encoding'),
+                                             request.headers.get('If-None-Match'))
+        return Response(body, status=status, headers=headers)
+
+
+class PayloadCache:
+    """Payloads built on first use per key and kept until clear()"""
+
+    def __init__(self, build):
+        self.build = build
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, key=None):
+        payload = self._payloads.get(key)
+        if payload is None:
+            with self._lock:
+                payload = self._payloads.get(key)
+                if payload is None:
+                    payload = self._payloads[key] = self.build(key)
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._payloads = {}
+
+
+class FilePayload:
+    """A payload built from a file and rebuilt when the file changes
+
+    The file's mtime and size are checked at most every check_interval
+    seconds, so the fast path is a clock read.
+    """
+
+    def __init__(self, path, build, check_interval=FILE_CHECK_INTERVAL):
+        self.path = path
+        self.build = build
+        self.check_interval = check_interval
+        self._payload = None
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        now = time.monotonic()
+        if self._payload is None or now >= self._next_check:
+            with self._lock:
+                self._next_check = now + self.check_interval
+                signature = self._file_signature()
+                if self._payload is None or signature != self._signature:
+                    self._payload, self._signature = self.build(self.path), signature
+        return self._payload
@@ -0,0 +1,213 @@
+import bisect
+
+import numpy as np
+
+
+class CompiledBrackets:
+    """Progressive brackets compiled into cumulative-tax lookup tables"""
+
+    def __init__(self, brackets):
+        self.lower = tuple(float(b["min"]) for b in brackets)
+        self.rates = tuple(float(b["rate"]) for b in brackets)
+
+        # Tax owed on everything below each bracket's lower bound, summed in
+        # bracket order so results match the original per-bracket loop
+        cumulative = []
+        tax = 0
+        for bracket in brackets:
+            cumulative.append(tax)
+            tax += (bracket["max"] - bracket["min"]) * bracket["rate"]
+        self.cumulative = tuple(cumulative)
+
+        self._lower = np.array(self.lower)
+        self._rates = np.array(self.rates)
+        self._cumulative = np.array(self.cumulative, dtype=float)
+
+    def tax(self, taxable_income):
+        """Tax on a single positive taxable income"""
+        i = bisect.bisect_left(self.lower, taxable_income) - 1
+        return self.cumulative[i] + (taxable_income - self.lower[i]) * self.rates[i]
+
+    def tax_array(self, taxable_income):
+        """Tax on an array of taxable incomes (zero where not positive)"""
+        taxable_income = np.asarray(taxable_income, dtype=float)
+        i = np.searchsorted(self._lower, taxable_income, side='left') - 1
+        i = np.clip(i, 0, len(self.lower) - 1)
+        tax = self._cumulative[i] + (taxable_income - self._lower[i]) * self._rates[i]
+        return np.where(taxable_income > 0, tax, 0.0)
+
+    def marginal_rate_array(self, taxable_income):
+        """Rate on the next dollar for an array of taxable incomes (zero where not positive)"""
+        taxable_income = np.asarray(taxable_income, dtype=float)
+        i = np.searchsorted(self._lower, taxable_income, side='right') - 1
+        i = np.clip(i, 0, len(self.lower) - 1)
+        return np.where(taxable_income > 0, self._rates[i], 0.0)
+
+
+class TaxEngine:
+    """Federal, CA, county and FICA taxes for whole arrays of incomes"""
+
+    def __init__(self, federal_brackets, federal_deductions, state_brackets,
+                 state_deductions, county_rates, default_county_rate,
+                 social_security_rate, social_security_wage_base,
+                 medicare_rate, additional_medicare_rate,
+                 additional_medicare_thresholds):
+        self.federal = {status: CompiledBrackets(brackets)
+                        for status, brackets in federal_brackets.items()}
+        self.federal_deductions = dict(federal_deductions)
+        self.state = CompiledBrackets(state_brackets)
+        self.state_deductions = dict(state_deductions)
+        self.county_rates = dict(county_rates)
+        self.default_county_rate = default_county_rate
+        self.social_security_rate = social_security_rate
+        self.social_security_wage_base = social_security_wage_base
+        self.medicare_rate = medicare_rate
+        self.additional_medicare_rate = additional_medicare_rate
+        self.additional_medicare_thresholds = dict(additional_medicare_thresholds)
+
+    @staticmethod
+    def _status_key(filing_status):
+        return 'single' if filing_status == 'single' else 'married'
+
+    def _by_status(self, incomes, married, table, compute):
+        """Evaluate compute(incomes, table[status]) separately for each filing status"""
+        result = np.zeros_like(incomes)
+        for status, mask in (('single', ~married), ('married', married)):
+            if mask.any():
+                result[mask] = compute(incomes[mask], table[status])
+        return result
+
+    def federal_tax(self, incomes, married):
+        def compute(income, status):
+            brackets, deduction = status
+            return brackets.tax_array(income - deduction)
+        table = {status: (self.federal[status], self.federal_deductions[status])
+                 for status in ('single', 'married')}
+        return self._by_status(incomes, married, table, compute)
+
+    def state_tax(self, incomes, married):
+        def compute(income, deduction):
+            return self.state.tax_array(income - deduction)
+        return self._by_status(incomes, married, self.state_deductions, compute)
+
+    def county_tax(self, incomes, counties):
+        rates = np.array([self.county_rates.get(county, self.default_county_rate)
+                          for county in counties], dtype=float)
+        return incomes * rates
+
+    def fica_taxes(self, incomes, married):
+        social_security = np.minimum(
+            incomes * self.social_security_rate,
+            self.social_security_wage_base * self.social_security_rate)
+        thresholds = np.where(married,
+                              self.additional_medicare_thresholds['married'],
+                              self.additional_medicare_thresholds['single'])
+        medicare = incomes * self.medicare_rate
+        medicare = np.where(
+            incomes > thresholds,
+            medicare + (incomes - thresholds) * self.additional_medicare_rate,
+            medicare)
+        return social_security, medicare
+
+    def calculate(self, incomes, filing_statuses, counties):
+        """Compute every tax component for parallel sequences of inputs
+
+        Returns a dict of float64 arrays keyed like the /api/calculate-budget
+        response fields.
+        """
+        incomes = np.asarray(incomes, dtype=float)
+        married = np.array([self._status_key(s) == 'married' for s in filing_statuses],
+                           dtype=bool)
+
+        federal_tax = self.federal_tax(incomes, married)
+        state_tax = self.state_tax(incomes, married)
+        county_tax = self.county_tax(incomes, counties)
+        social_security_tax, medicare_tax = self.fica_taxes(incomes, married)
+
+        total_taxes = federal_tax + state_tax + county_tax + social_security_tax + medicare_tax
+        net_income = incomes - total_taxes
+
+        return {
+            "federal_tax": federal_tax,
+            "state_tax": state_tax,
+            "county_tax": county_tax,
+            "social_security_tax": social_security_tax,
+            "medicare_tax": medicare_tax,
+            "total_taxes": total_taxes,
+            "net_yearly_income": net_income,
+            "monthly_net_income": net_income / 12,
+        }
+
+    def calculate_grid(self, incomes, filing_status, counties):
+        """Compute taxes for every (county, income) pair under one filing status
+
+        County-dependent results are 2-D arrays shaped (len(counties),
+        len(incomes)); the others are 1-D over incomes and broadcast against them.
+        """
+        incomes = np.asarray(incomes, dtype=float)
+        status = self._status_key(filing_status)
+        married = np.full(incomes.shape, status == 'married')
+
+        federal_tax = self.federal[status].tax_array(incomes - self.federal_deductions[status])
+        state_tax = self.state.tax_array(incomes - self.state_deductions[status])
+        social_security_tax, medicare_tax = self.fica_taxes(incomes, married)
+        rates = np.array([self.county_rates.get(county, self.default_county_rate)
+                          for county in counties], dtype=float)
+        county_tax = incomes[None, :] * rates[:, None]
+
+        total_taxes = federal_tax + state_tax + county_tax + social_security_tax + medicare_tax
+        net_income = incomes - total_taxes
+
+        return {
+            "federal_tax": federal_tax,
+            "state_tax": state_tax,
+            "county_tax": county_tax,
+            "social_security_tax": social_security_tax,
+            "medicare_tax": medicare_tax,
+            "total_taxes": total_taxes,
+            "net_yearly_income": net_income,
+            "monthly_net_income": net_income / 12,
+        }
+
+    def tax_curve(self, filing_status):
+        """Federal, state and FICA tax as a piecewise-linear function of income
+
+        Returns breakpoints (starting at 0), the tax at each breakpoint and
+        the marginal rate up to the next one; the last rate applies to every
+        income above the last breakpoint. County tax is a flat rate on
+        income, so it is left out and added to every slope by the caller.
+        Breakpoints where the rate doesn't change are dropped.
+        """
+        status = self._status_key(filing_status)
+        federal_deduction = self.federal_deductions[status]
+        state_deduction = self.state_deductions[status]
+        threshold = self.additional_medicare_thresholds[status]
+
+        breakpoints = np.concatenate((
+            [0.0, self.social_security_wage_base, threshold],
+            federal_deduction + np.array(self.federal[status].lower),
+            state_deduction + np.array(self.state.lower),
+        ))
+        breakpoints = np.unique(breakpoints[breakpoints >= 0])
+
+        # Every component is linear between breakpoints, so the rate just
+        # past each one holds until the next
+        above = breakpoints + np.append(np.diff(breakpoints) / 2, 1.0)
+        slopes = (self.federal[status].marginal_rate_array(above - federal_deduction)
+                  + self.state.marginal_rate_array(above - state_deduction)
+                  + np.where(above < self.social_security_wage_base, self.social_security_rate, 0.0)
+                  + self.medicare_rate
+                  + np.where(above > threshold, self.additional_medicare_rate, 0.0))
+        keep = np.append(True, ~np.isclose(slopes[1:], slopes[:-1], rtol=0, atol=1e-12))
+        breakpoints, slopes = breakpoints[keep], slopes[keep]
+
+        married = np.full(breakpoints.shape, status == 'married')
+        social_security_tax, medicare_tax = self.fica_taxes(breakpoints, married)
+        taxes = (self.federal[status].tax_array(breakpoints - federal_deduction)
+                 + self.state.tax_array(breakpoints - state_deduction)
+                 + social_security_tax + medicare_tax)
+        return {
+            "breakpoints": breakpoints.tolist(),
+            "taxes": taxes.tolist(),
+            "slopes": slopes.tolist(),
+        }
@@ -0,0 +1,191 @@
+"""Per-year tax tables loaded from tax_data/ into an immutable, hot-reloadable registry
+
+Each tax year is a <year>.json file with the federal and California brackets,
+standard deductions, default county values and FICA parameters, plus an
+optional <year>_counties.csv with county,tax_rate,housing_multiplier,high_cost
+rows. Brackets list only their lower bound; the upper bound is the next
+bracket's lower bound.
+
+Files are parsed once into TaxTables (tuples, read-only mappings and a
+compiled TaxEngine with cumulative bracket offsets). reload() builds a
+complete new set of tables before swapping it in with a single assignment,
+so a request never sees half-loaded data.
+"""
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+from tax_engine import TaxEngine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAX_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tax_data')
+RELOAD_CHECK_INTERVAL = 5.0
+FILING_STATUSES = ('single', 'married')
+
+
+class UnknownTaxYear(ValueError):
+    pass
+
+
+def expand_brackets(brackets):
+    """[{min, rate}, ...] -> [{min, max, rate}, ...] ending with an open top bracket"""
+    brackets = sorted(brackets, key=lambda b: b["min"])
+    uppers = [b["min"] for b in brackets[1:]] + [float('inf')]
+    return tuple(
+        MappingProxyType({"min": b["min"], "max": upper, "rate": b["rate"]})
+        for b, upper in zip(brackets, uppers)
+    )
+
+
+def status_key(filing_status):
+    return 'single' if filing_status == 'single' else 'married'
+
+
+class TaxTables:
+    """Immutable tax data for one year"""
+
+    def __init__(self, data, county_rows=()):
+        self.tax_year = int(data["tax_year"])
+
+        federal = data["federal"]
+        self.federal_brackets = MappingProxyType(
+            {status: expand_brackets(federal["brackets"][status]) for status in FILING_STATUSES})
+        self.federal_deductions = MappingProxyType(dict(federal["standard_deduction"]))
+
+        california = data["california"]
+        self.state_brackets = expand_brackets(california["brackets"])
+        self.state_deductions = MappingProxyType(dict(california["standard_deduction"]))
+
+        counties = data.get("counties", {})
+        county_rates = dict(counties.get("tax_rates", {}))
+        housing_multipliers = dict(counties.get("housing_multipliers", {}))
+        high_cost = list(counties.get("high_cost", []))
+        for row in county_rows:
+            name = row["county"].strip()
+            if row.get("tax_rate"):
+                county_rates[name] = float(row["tax_rate"])
+            if row.get("housing_multiplier"):
+                housing_multipliers[name] = float(row["housing_multiplier"])
+            if (row.get("high_cost") or '').strip().lower() in ('1', 'yes', 'true') and name not in high_cost:
+                high_cost.append(name)
+
+        self.county_rates = MappingProxyType(county_rates)
+        self.default_county_rate = counties["default_tax_rate"]
+        self.housing_multipliers = MappingProxyType(housing_multipliers)
+        self.default_housing_multiplier = counties.get("default_housing_multiplier", 1.0)
+        self.high_cost_counties = frozenset(high_cost)
+
+        fica = data["fica"]
+        self.social_security_rate = fica["social_security_rate"]
+        self.social_security_wage_base = fica["social_security_wage_base"]
+        self.medicare_rate = fica["medicare_rate"]
+        self.additional_medicare_rate = fica["additional_medicare_rate"]
+        self.additional_medicare_thresholds = MappingProxyType(dict(fica["additional_medicare_threshold"]))
+
+        self.engine = TaxEngine(
+            federal_brackets=self.federal_brackets,
+            federal_deductions=self.federal_deductions,
+            state_brackets=self.state_brackets,
+            state_deductions=self.state_deductions,
+            county_rates=self.county_rates,
+            default_county_rate=self.default_county_rate,
+            social_security_rate=self.social_security_rate,
+            social_security_wage_base=self.social_security_wage_base,
+            medicare_rate=self.medicare_rate,
+            additional_medicare_rate=self.additional_medicare_rate,
+            additional_medicare_thresholds=self.additional_medicare_thresholds
+        )
+
+
+def data_files(data_dir):
+    """Sorted (name, mtime_ns, size) for every table file, used to detect changes"""
+    entries = []
+    for name in sorted(os.listdir(data_dir)):
+        if name.endswith('.json') or name.endswith('_counties.csv'):
+            stat = os.stat(os.path.join(data_dir, name))
+            entries.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+def load_year(data_dir, json_name):
+    with open(os.path.join(data_dir, json_name)) as f:
+        data = json.load(f)
+
+    county_rows = ()
+    csv_path = os.path.join(data_dir, f'{os.path.splitext(json_name)[0]}_counties.csv')
+    if os.path.exists(csv_path):
+        with open(csv_path, newline='') as f:
+            county_rows = list(csv.DictReader(f))
+
+    return TaxTables(data, county_rows)
+
+
+def load_all(data_dir):
+    tables = {}
+    for name in sorted(os.listdir(data_dir)):
+        if name.endswith('.json'):
+            year_tables = load_year(data_dir, name)
+            tables[year_tables.tax_year] = year_tables
+    if not tables:
+        raise FileNotFoundError(f'No tax tables found in {data_dir}')
+    return MappingProxyType(tables)
+
+
+class TaxRegistry:
+    """All loaded tax years, swapped atomically on reload"""
+
+    def __init__(self, data_dir=None, default_year=None, check_interval=RELOAD_CHECK_INTERVAL):
+        self.data_dir = data_dir or os.environ.get('BUDGET_TAX_DATA_DIR', DEFAULT_TAX_DATA_DIR)
+        self.default_year = default_year or os.environ.get('BUDGET_TAX_YEAR')
+        self.check_interval = check_interval
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._signature, self._tables = data_files(self.data_dir), load_all(self.data_dir)
+
+    def years(self):
+        return sorted(self._tables)
+
+    def get(self, tax_year=None):
+        """Tables for a tax year (default: BUDGET_TAX_YEAR or the latest year loaded)"""
+        tables = self._tables
+        year = tax_year or self.default_year or max(tables)
+        try:
+            return tables[int(year)]
+        except (KeyError, TypeError, ValueError):
+            raise UnknownTaxYear(f"No tax tables for year {tax_year}")
+
+    def on_reload(self, callback):
+        """Call callback() after every successful reload"""
+        self._callbacks.append(callback)
+        return callback
+
+    def reload(self):
+        """Re-read every table file and swap the new tables in; a bad file leaves the old ones live"""
+        with self._lock:
+            signature = data_files(self.data_dir)
+            tables = load_all(self.data_dir)
+            self._signature, self._tables = signature, tables
+        for callback in self._callbacks:
+            callback()
+
+    def reload_if_changed(self):
+        """Reload when a table file changed; checks the disk at most every check_interval seconds"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        if data_files(self.data_dir) == self._signature:
+            return False
+        try:
+            self.reload()
+        except (OSError, ValueError, KeyError, TypeError):
+            # Keep serving the previous tables until the files are fixed
+            logger.exception('Failed to reload tax tables from %s', self.data_dir)
+            return False
+        return True
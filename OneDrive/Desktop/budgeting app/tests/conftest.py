@@ -0,0 +1,80 @@
+"""Shared fixtures: every test gets its own database file and a logged-in client"""
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# Configured before the app is imported: hash passwords in-process, no
+# limits unless a test builds its own RateLimiter, and never touch the
+# repository's own database file
+os.environ.setdefault('BUDGET_HASH_WORKERS', '0')
+os.environ.setdefault('BUDGET_RATE_LIMITS', 'off')
+os.environ.setdefault('BUDGET_DB_PATH', os.path.join(tempfile.mkdtemp(), 'budget_app.db'))
+
+import pytest  # noqa: E402
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi_app  # noqa: E402
+import budget_backend  # noqa: E402
+import database  # noqa: E402
+
+USER = {"username": "tester", "email": "tester@example.com", "password": "correct horse"}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv('BUDGET_HISTORY_DIR', str(tmp_path / 'history'))
+    database.configure(str(tmp_path / 'budget_app.db'))
+    budget_backend.init_db()
+    yield database
+    budget_backend.snapshot_writer.flush()
+    database.get_pool().close()
+
+
+@pytest.fixture
+def client(db):
+    client = budget_backend.app.test_client()
+    response = client.post('/api/register', json=USER)
+    assert response.status_code == 200, response.get_json()
+    return client
+
+
+@pytest.fixture
+def asgi_client(db):
+    client = TestClient(asgi_app.app)
+    response = client.post('/api/register', json=USER)
+    if response.status_code != 200:
+        # Already registered through the Flask client in the same test
+        response = client.post('/api/login', json=USER)
+    assert response.status_code == 200, response.json()
+    return client
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def post(request):
+    """POST through the logged-in Flask or ASGI client; returns (status, json)
+
+    Pass json= for a JSON body or raw= for bytes sent as application/json.
+    """
+    if request.param == 'flask':
+        client = request.getfixturevalue('client')
+
+        def post(path, json=None, raw=None):
+            if raw is not None:
+                response = client.post(path, data=raw, content_type='application/json')
+            else:
+                response = client.post(path, json=json)
+            return response.status_code, response.get_json()
+    else:
+        client = request.getfixturevalue('asgi_client')
+
+        def post(path, json=None, raw=None):
+            if raw is not None:
+                response = client.post(path, content=raw, headers={'Content-Type': 'application/json'})
+            else:
+                response = client.post(path, json=json)
+            return response.status_code, response.json()
+    return post
@@ -0,0 +1,38 @@
+import pytest
+
+import expenses
+
+
+@pytest.mark.parametrize('amount', ['nan', 'inf', '-inf', 'Infinity', float('nan'), float('inf')])
+def test_non_finite_amount_is_rejected(amount):
+    with pytest.raises(expenses.ExpenseError, match='Invalid amount'):
+        expenses.validate_expense({"category": "food", "amount": amount})
+
+
+@pytest.mark.parametrize('body', [
+    '{"category": "food", "amount": "inf"}',
+    '{"category": "food", "amount": NaN}',
+    '{"category": "food", "amount": -Infinity}',
+])
+def test_create_rejects_non_finite_amount(client, body):
+    response = client.post('/api/expenses', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid amount"}
+
+    # Nothing was stored, so the user's reads still work
+    assert client.get('/api/expenses').get_json()['expenses'] == []
+    assert client.get('/api/reports/spending').status_code == 200
+
+
+def test_update_rejects_non_finite_amount(client):
+    expense = client.post('/api/expenses', json={"category": "food", "amount": 12.5}).get_json()
+    response = client.put(f'/api/expenses/{expense["id"]}', json={"category": "food", "amount": "nan"})
+    assert response.status_code == 400
+    assert client.get(f'/api/expenses/{expense["id"]}').get_json()['amount'] == 12.5
+
+
+def test_import_reports_line_of_non_finite_amount(client):
+    csv_body = b'category,amount\nfood,10\nrent,inf\n'
+    response = client.post('/api/expenses/import', data=csv_body, content_type='text/csv')
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid amount", "line": 3}
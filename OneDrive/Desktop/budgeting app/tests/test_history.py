@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+import history_archive
+
+
+@pytest.mark.parametrize('value', ['inf', '-inf', 'nan', '1e20', '-1', '253402300800'])
+def test_parse_time_rejects_out_of_range(value):
+    with pytest.raises(ValueError, match='Invalid date'):
+        history_archive.parse_time(value)
+
+
+def test_parse_time_accepts_dates_and_epochs():
+    assert history_archive.parse_time('86400') == 86400
+    assert history_archive.parse_time('1970-01-02') == 86400
+    assert history_archive.parse_time('1970-01-02T00:00:01') == 86401
+    assert history_archive.parse_time(None) is None
+
+
+@pytest.mark.parametrize('query', ['since=inf', 'since=1e20', 'until=-inf', 'since=nan', 'until=notadate'])
+def test_history_rejects_overflowing_times(client, asgi_client, query):
+    flask = client.get(f'/api/user-profile/history?{query}')
+    assert flask.status_code == 400
+    assert 'Invalid date' in flask.get_json()['error']
+
+    asgi = asgi_client.get(f'/api/user-profile/history?{query}')
+    assert asgi.status_code == 400
+    assert asgi.json() == flask.get_json()
+
+
+def insert_snapshots(db, counties, created_at='2000-01-01 00:00:00'):
+    with db.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO budget_profiles (user_id, yearly_income, filing_status, county, created_at)
+            VALUES (1, ?, ?, ?, ?)
+        ''', [(50000 + i, status, county, created_at) for i, (status, county) in enumerate(counties)])
+
+
+def test_compaction_interns_only_known_values(db):
+    directory = history_archive.archive_dir()
+    insert_snapshots(db, [('single', 'Alameda'), ('married', 'Atlantis')]
+                     + [('single', f'free text {i}') for i in range(50)] + [('widowed', 'Alameda')])
+
+    result = history_archive.compact(older_than_days=1, keep_recent=0, directory=directory)
+    assert result['rows_removed'] == 53
+
+    with open(os.path.join(directory, 'vocabulary.json')) as f:
+        vocabulary = json.load(f)
+    assert sorted(vocabulary['county']) == ['', 'Alameda']
+    assert sorted(vocabulary['filing_status']) == ['', 'married', 'single']
+
+    rows = list(history_archive.iter_archived_rows(1))
+    assert [row[3] for row in rows[:2]] == ['Alameda', '']
+    assert rows[-1][2:4] == ('', 'Alameda')
+
+
+def test_history_handles_more_live_values_than_archive_codes(client, db):
+    distinct = 70000
+    insert_snapshots(db, [('single', f'free text {i}') for i in range(distinct)])
+
+    history = client.get('/api/user-profile/history?max_points=3').get_json()
+    assert history['count'] == 3
+    assert history['county'][-1] == f'free text {distinct - 1}'
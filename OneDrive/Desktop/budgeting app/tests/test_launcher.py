@@ -0,0 +1,55 @@
+import signal
+
+import pytest
+
+
+@pytest.fixture
+def launcher():
+    import launcher
+    return launcher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_restart_backoff_doubles_and_is_capped(launcher):
+    clock = FakeClock()
+    policy = launcher.RestartPolicy(limit=10, window=60, backoff=0.5, max_backoff=3, clock=clock)
+    assert [policy.record_exit() for _ in range(5)] == [0.5, 1.0, 2.0, 3, 3]
+
+
+def test_restart_gives_up_on_a_crash_loop(launcher):
+    clock = FakeClock()
+    policy = launcher.RestartPolicy(limit=3, window=60, backoff=0.1, clock=clock)
+    assert all(policy.record_exit() is not None for _ in range(3))
+    assert policy.record_exit() is None
+
+
+def test_restart_forgets_exits_outside_the_window(launcher):
+    clock = FakeClock()
+    policy = launcher.RestartPolicy(limit=2, window=60, backoff=0.1, clock=clock)
+    policy.record_exit()
+    policy.record_exit()
+    clock.now = 61
+    assert policy.record_exit() == 0.1
+
+
+def test_serve_stops_when_workers_cannot_start(launcher, monkeypatch):
+    def crash(app, listener, forked_at):
+        raise RuntimeError('worker failed to start')
+
+    monkeypatch.setattr(launcher, 'warm_up', lambda: None)
+    monkeypatch.setattr(launcher, 'run_worker', crash)
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        policy = launcher.RestartPolicy(limit=3, window=60, backoff=0.01)
+        assert launcher.serve('127.0.0.1', 0, 2, restarts=policy) == 1
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+    assert len(policy._exits) == 4
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import httpx
+import pytest
+from flask import Flask
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+import database
+import rate_limits
+from rate_limits import (AsyncConcurrencyLimit, RateLimiter, RateLimitMiddleware, RouteLimit, SharedBuckets,
+                         SqliteBuckets, StoreUnavailable)
+
+LIMITS = {'/limited': RouteLimit(ip_rate=1000, ip_burst=1000, user_rate=1000, user_burst=1000)}
+
+
+@pytest.fixture
+def write_lock(db):
+    """Another connection holding SQLite's write lock, like a long import or flush"""
+    conn = sqlite3.connect(database.get_pool().path, isolation_level=None)
+    conn.execute('BEGIN IMMEDIATE')
+    yield
+    conn.rollback()
+    conn.close()
+
+
+def test_default_backend_is_in_memory(monkeypatch):
+    monkeypatch.delenv('BUDGET_RATE_LIMIT_BACKEND', raising=False)
+    assert isinstance(rate_limits.buckets_from_env(LIMITS), SharedBuckets)
+
+
+def test_shared_backend_is_refused_in_a_spawned_process(monkeypatch):
+    monkeypatch.setattr(rate_limits.multiprocessing, 'parent_process', lambda: object())
+    monkeypatch.setenv('BUDGET_RATE_LIMIT_BACKEND', 'shared')
+    with pytest.raises(ValueError, match='forked'):
+        rate_limits.buckets_from_env(LIMITS)
+    monkeypatch.setenv('BUDGET_RATE_LIMIT_BACKEND', 'memory')
+    assert isinstance(rate_limits.buckets_from_env(LIMITS), SharedBuckets)
+
+
+def test_sqlite_buckets_fail_open_under_a_held_write_lock(write_lock):
+    limiter = RateLimiter(LIMITS, SqliteBuckets())
+    started = time.perf_counter()
+    limiter.check_rate('/limited', '10.0.0.1', user_id=1)
+    assert time.perf_counter() - started < 1
+
+    with pytest.raises(StoreUnavailable):
+        limiter.buckets.take('key', 1, 1)
+
+
+@pytest.mark.parametrize('buckets', [SharedBuckets(1024), SqliteBuckets()], ids=['memory', 'sqlite'])
+def test_flask_request_is_not_blocked_by_a_held_write_lock(write_lock, buckets):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.add_url_rule('/limited', 'limited', lambda: 'ok')
+    RateLimiter(LIMITS, buckets).init_app(app)
+
+    started = time.perf_counter()
+    response = app.test_client().get('/limited')
+    assert response.status_code == 200
+    assert time.perf_counter() - started < 1
+
+
+def test_sqlite_buckets_still_limit(db):
+    limiter = RateLimiter({'/limited': RouteLimit(ip_rate=0.001, ip_burst=2)}, SqliteBuckets())
+    limiter.check_rate('/limited', 'ip')
+    limiter.check_rate('/limited', 'ip')
+    with pytest.raises(rate_limits.Rejected):
+        limiter.check_rate('/limited', 'ip')
+
+
+def test_lock_held_by_a_dead_worker_is_broken():
+    buckets = SharedBuckets(1024)
+    pid = os.fork()
+    if pid == 0:
+        buckets._lock.acquire()
+        buckets._owner[0] = os.getpid()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert buckets.take('key', 1, 5) == 0
+    assert int(buckets._owner[0]) == 0
+
+
+def test_lock_held_by_a_live_worker_fails_open():
+    buckets = SharedBuckets(1024)
+    limiter = RateLimiter({'/limited': RouteLimit(ip_rate=0.001, ip_burst=1)}, buckets)
+    buckets._lock.acquire()
+    buckets._owner[0] = os.getpid()
+    try:
+        with pytest.raises(StoreUnavailable):
+            buckets.take('key', 1, 1)
+        # Fails open rather than rejecting or raising
+        limiter.check_rate('/limited', 'ip')
+        limiter.check_rate('/limited', 'ip')
+    finally:
+        buckets._owner[0] = 0
+        buckets._lock.release()
+
+
+def test_async_concurrency_limit_queues_then_rejects():
+    async def scenario():
+        limit = AsyncConcurrencyLimit(max_concurrent=1, max_queue=1, queue_timeout=5)
+        assert await limit.acquire()
+        queued = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        assert limit.waiting == 1
+        # The queue is full, so a third request is turned away at once
+        assert not await limit.acquire()
+
+        limit.release()
+        assert await queued
+        assert limit.in_flight == 1 and limit.waiting == 0
+        limit.release()
+        assert limit.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_async_concurrency_limit_times_out_waiting():
+    async def scenario():
+        limit = AsyncConcurrencyLimit(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+        assert await limit.acquire()
+        assert not await limit.acquire()
+        assert limit.waiting == 0
+        limit.release()
+        assert limit.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_middleware_runs_at_most_max_concurrent():
+    running = 0
+    peak = 0
+
+    async def slow(request):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return PlainTextResponse('ok')
+
+    limits = {'/slow': RouteLimit(ip_rate=1000, ip_burst=1000, max_concurrent=2, max_queue=2, queue_timeout=5)}
+    app = RateLimitMiddleware(Starlette(routes=[Route('/slow', slow)]),
+                              limiter=RateLimiter(limits, SharedBuckets(1024)))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://t') as client:
+            responses = await asyncio.gather(*(client.get('/slow') for _ in range(6)))
+        return sorted(response.status_code for response in responses)
+
+    assert asyncio.run(scenario()) == [200, 200, 200, 200, 503, 503]
+    assert peak == 2
@@ -0,0 +1,58 @@
+import pytest
+
+import scenarios
+from tax_tables import TaxRegistry
+
+INCOME = {"min": 50000, "max": 60000, "step": 5000}
+
+
+@pytest.mark.parametrize('body, message', [
+    ({"income": INCOME, "counties": [[1]]}, "counties must be a list of strings"),
+    ({"income": INCOME, "counties": "Alameda"}, "counties must be a list of strings"),
+    ({"income": INCOME, "filing_statuses": [{"a": 1}]}, "filing_statuses must be a list of strings"),
+    ({"income": INCOME, "filing_statuses": ["single", "widowed"]}, "Unknown filing statuses: widowed"),
+    ({"income": INCOME, "fields": 5}, "fields must be a list of strings"),
+    ({"income": INCOME, "fields": [["total_taxes"]]}, "fields must be a list of strings"),
+    ({"income": INCOME, "fields": ["total_taxes", "bogus"]}, "Unknown fields: bogus"),
+    ({"income": [[50000, 60000]]}, "Incomes must be numbers"),
+    ({"income": [50000, "60000"]}, "Incomes must be numbers"),
+    ({"income": [50000, True]}, "Incomes must be numbers"),
+    ({"income": {"min": 1, "max": [2], "step": 1}}, "Income range needs numeric min, max and step"),
+    ({"income": 50000}, "Expected income as a list or a {min, max, step} range"),
+])
+def test_malformed_axes_are_rejected(post, body, message):
+    status, result = post('/api/scenarios', json=body)
+    assert status == 400
+    assert result == {"error": message}
+
+
+@pytest.mark.parametrize('body', [
+    '{"income": [50000, Infinity]}',
+    '{"income": [NaN]}',
+    '{"income": {"min": 1, "max": 10, "step": NaN}}',
+    '{"income": {"min": 1, "max": Infinity, "step": 1}}',
+    '[1, 2]',
+])
+def test_non_finite_or_non_object_body_is_rejected(post, body):
+    status, result = post('/api/scenarios', raw=body.encode())
+    assert status == 400
+    assert 'error' in result
+
+
+def test_scenario_axes_accepts_unknown_county():
+    tables = TaxRegistry().get(None)
+    incomes, counties, filing_statuses, fields = scenarios.scenario_axes(
+        {"income": [50000], "counties": ["Atlantis"], "filing_statuses": ["married"]}, tables)
+    assert incomes.tolist() == [50000.0]
+    assert counties == ["Atlantis"]
+    assert filing_statuses == ["married"]
+    assert fields == list(scenarios.DEFAULT_SCENARIO_FIELDS)
+
+
+def test_valid_grid(post):
+    status, result = post('/api/scenarios', json={
+        "income": INCOME, "counties": ["Alameda"], "filing_statuses": ["single"], "fields": ["total_taxes"]
+    })
+    assert status == 200
+    assert result["incomes"] == [50000.0, 55000.0, 60000.0]
+    assert len(result["results"]["single"]["total_taxes"][0]) == 3
@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+import write_behind
+
+
+class FlakyStore:
+    """write_batch that fails a given number of times before it starts working"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rows = []
+        self.calls = 0
+
+    def __call__(self, rows):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        self.rows.extend(rows)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(write_behind, 'RETRY_DELAY', 0.001)
+    monkeypatch.setattr(write_behind, 'MAX_RETRY_DELAY', 0.01)
+
+
+def make_queue(store, **kwargs):
+    kwargs.setdefault('flush_interval', 0.001)
+    kwargs.setdefault('slice_rows', 2)
+    return write_behind.WriteBehindQueue(store, key=lambda row: row[0], **kwargs)
+
+
+def test_failed_rows_are_retried_not_dropped():
+    # More failures than FLUSH_ATTEMPTS used to drop the batch
+    store = FlakyStore(failures=write_behind.FLUSH_ATTEMPTS * 3)
+    writer = make_queue(store)
+    for i in range(10):
+        writer.submit((1, i))
+    writer.flush()
+    writer.close()
+    assert store.rows == [(1, i) for i in range(10)]
+    assert writer.stats()["failed_writes"] == write_behind.FLUSH_ATTEMPTS * 3
+    assert writer.stats()["dropped_rows"] == 0
+
+
+def test_flush_by_key_waits_through_retries():
+    store = FlakyStore(failures=5)
+    writer = make_queue(store)
+    writer.submit((7, 'a'))
+    writer.flush(7)
+    assert store.rows == [(7, 'a')]
+    writer.close()
+
+
+def test_full_queue_blocks_instead_of_writing_out_of_order():
+    release = threading.Event()
+    written = []
+
+    def slow_store(rows):
+        release.wait()
+        written.extend(rows)
+
+    writer = make_queue(slow_store, max_pending=2, slice_rows=1, max_batch=1)
+    submitter = threading.Thread(target=lambda: [writer.submit((1, i)) for i in range(6)])
+    submitter.start()
+    submitter.join(0.2)
+    # The writer holds one row and the queue two more; the rest wait for room
+    assert submitter.is_alive()
+    assert written == []
+    assert writer.submit((2, 'x'), block=False) is False
+
+    release.set()
+    submitter.join()
+    writer.flush()
+    writer.close()
+    assert written == [(1, i) for i in range(6)]
+
+
+def test_unwritable_rows_are_spilled_at_shutdown_and_replayed(tmp_path):
+    prefix = str(tmp_path / 'snapshots')
+    down = FlakyStore(failures=10 ** 6)
+    writer = make_queue(down, spill_path=lambda: prefix)
+    for i in range(5):
+        writer.submit((1, i))
+    writer.close()
+    assert down.rows == []
+    assert writer.stats()["spilled_rows"] == 5
+    assert len(list(tmp_path.glob('snapshots.*.jsonl'))) == 1
+
+    # The next writer writes the spilled rows back before newer ones
+    up = FlakyStore()
+    writer = make_queue(up, spill_path=lambda: prefix)
+    writer.submit((1, 5))
+    writer.flush()
+    writer.close()
+    assert [tuple(row) for row in up.rows] == [(1, i) for i in range(6)]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rows_are_dropped_and_counted_without_a_spill_path():
+    writer = make_queue(FlakyStore(failures=10 ** 6))
+    writer.submit((1, 0))
+    writer.close()
+    assert writer.stats()["dropped_rows"] == 1
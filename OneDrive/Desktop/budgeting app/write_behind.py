@@ -0,0 +1,263 @@
+"""Write-behind queue that batches inserts off the request path
+
+Requests hand rows to submit() and return; a background thread collects up
+to max_batch rows once that many are waiting or flush_interval seconds have
+passed since the first row of the batch arrived. It writes them in short
+transactions of slice_rows rows and yields between them. A request running
+alongside the writer then waits on one small transaction, not a whole batch.
+That matters most when the writer and the request threads share a core.
+
+Memory is bounded by max_pending queued rows. When the queue is full,
+submit() waits for room, so under overload callers slow down rather than
+lose data, and every row still goes through the writer in submission order.
+
+A failed write is retried with growing delays, up to MAX_RETRY_DELAY apart,
+and the writer does not move on until it succeeds. Failed rows are never
+dropped or reordered; if the database stays down, the queue fills and
+submit() applies backpressure. failed_writes counts the failed attempts. At
+shutdown, rows that still cannot be written after FLUSH_ATTEMPTS tries are
+appended to a spill file when spill_path is set. The next writer to start,
+in any process, writes them back first. stats() reports these counters.
+
+flush() waits until everything submitted so far is on disk. With
+a key function, flush(key) waits only for that key's rows and returns at
+once when none are queued. Readers call it with the user's id so users see
+their own writes without waiting on anyone else's. Queues are drained at
+interpreter exit and by close_all(), which the pre-forking launcher calls
+before a worker exits.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 500
+DEFAULT_SLICE_ROWS = 8
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_MAX_PENDING = 10000
+FLUSH_ATTEMPTS = 3
+RETRY_DELAY = 0.1
+MAX_RETRY_DELAY = 5.0
+
+_STOP = object()
+_queues = []
+
+
+class WriteBehindQueue:
+    """Buffers rows for write_batch(rows) and calls it from a background thread
+
+    spill_path, when given, is a function returning the spill file prefix;
+    rows must then be JSON serializable, and come back as lists.
+    """
+
+    def __init__(self, write_batch, max_batch=DEFAULT_MAX_BATCH, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING, enabled=True, name='write-behind', key=None,
+                 slice_rows=DEFAULT_SLICE_ROWS, spill_path=None):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.slice_rows = slice_rows
+        self.key = key
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.name = name
+        self.spill_path = spill_path
+        self.failed_writes = 0
+        self.spilled_rows = 0
+        self.dropped_rows = 0
+        self._queue = queue.Queue(max_pending)
+        self._full = threading.Event()
+        self._stopping = threading.Event()
+        self._spilling = False
+        self._lock = threading.Lock()
+        # Queued-but-unwritten rows per key, for flush(key)
+        self._pending = Counter()
+        self._written = threading.Condition()
+        self._writer_pid = None
+        self._thread = None
+        _queues.append(self)
+
+    def _ensure_writer(self):
+        # Started lazily, and again in each forked worker, since threads do not survive fork
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, row, block=True):
+        """Queue a row; returns False only when block=False and the queue is full
+
+        With block=True a full queue makes the caller wait for room.
+        """
+        if not self.enabled:
+            self.write_batch([row])
+            return True
+        self._ensure_writer()
+        self._track(row)
+        try:
+            self._queue.put(row, block=block)
+        except queue.Full:
+            self._untrack([row])
+            return False
+        if self._queue.qsize() >= self.max_batch:
+            self._full.set()
+        return True
+
+    def _track(self, row):
+        if self.key is not None:
+            with self._written:
+                self._pending[self.key(row)] += 1
+
+    def _untrack(self, rows):
+        if self.key is not None:
+            with self._written:
+                for row in rows:
+                    key = self.key(row)
+                    self._pending[key] -= 1
+                    if self._pending[key] <= 0:
+                        del self._pending[key]
+                self._written.notify_all()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "failed_writes": self.failed_writes,
+            "spilled_rows": self.spilled_rows,
+            "dropped_rows": self.dropped_rows
+        }
+
+    def has_pending(self, key):
+        """True when rows for key are queued but not yet written"""
+        return bool(self._pending.get(key))
+
+    def flush(self, key=None):
+        """Block until every row submitted so far (or, given a key, every row for it) has been written"""
+        if not self.enabled or self._writer_pid != os.getpid():
+            return
+        if key is None or self.key is None:
+            self._full.set()
+            self._queue.join()
+            return
+        with self._written:
+            if not self._pending.get(key):
+                return
+            self._full.set()
+            self._written.wait_for(lambda: not self._pending.get(key))
+
+    def close(self):
+        """Write everything still queued and stop the background thread"""
+        if self._writer_pid != os.getpid() or not self._thread.is_alive():
+            return
+        # Cuts short any retry delay; writes still failing are spilled
+        self._stopping.set()
+        self._queue.put(_STOP)
+        self._full.set()
+        self._thread.join()
+        self._writer_pid = None
+        self._stopping.clear()
+        self._spilling = False
+
+    def _run(self):
+        self._replay_spills()
+        while True:
+            row = self._queue.get()
+            # Sleep through the interval instead of waking for every row;
+            # submit() cuts the wait short once a full batch is queued
+            if row is not _STOP:
+                self._full.wait(self.flush_interval)
+                self._full.clear()
+
+            batch = []
+            stop = row is _STOP
+            while not stop:
+                batch.append(row)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                stop = row is _STOP
+
+            for start in range(0, len(batch), self.slice_rows):
+                if start:
+                    # Let request threads run between transactions
+                    time.sleep(0)
+                rows = batch[start:start + self.slice_rows]
+                self._write(rows)
+                self._untrack(rows)
+            # Mark done only after the write so flush() means "on disk"
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, rows):
+        """Write rows, retrying until they are written (or, once stopping, spilled)"""
+        attempt = 0
+        while not self._spilling:
+            try:
+                self.write_batch(rows)
+                return
+            except Exception:
+                attempt += 1
+                self.failed_writes += 1
+                if attempt == 1:
+                    logger.exception('Writing %d queued rows failed; retrying', len(rows))
+                if self._stopping.is_set() and attempt >= FLUSH_ATTEMPTS:
+                    # Later rows go to the spill file too, so they stay in order
+                    self._spilling = True
+                    break
+                self._stopping.wait(min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempt - 1)))
+        self._spill(rows)
+
+    def _spill(self, rows):
+        if self.spill_path is None:
+            logger.error('Dropping %d queued rows: the database is unavailable at shutdown', len(rows))
+            self.dropped_rows += len(rows)
+            return
+        with open(f'{self.spill_path()}.{os.getpid()}.jsonl', 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.spilled_rows += len(rows)
+        logger.error('Spilled %d queued rows: the database is unavailable at shutdown', len(rows))
+
+    def _replay_spills(self):
+        """Write rows spilled by earlier writers before anything queued here"""
+        if self.spill_path is None:
+            return
+        prefix = self.spill_path()
+        for path in sorted(glob.glob(f'{glob.escape(prefix)}.*.jsonl')):
+            # Renaming claims the file, so only one process replays it
+            claimed = f'{path}.{os.getpid()}.replaying'
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            logger.warning('Replaying %d spilled rows from %s', len(rows), path)
+            # Rows not written before a shutdown are spilled again by _write
+            for start in range(0, len(rows), self.slice_rows):
+                self._write(rows[start:start + self.slice_rows])
+            os.remove(claimed)
+
+
+def close_all():
+    for write_queue in _queues:
+        write_queue.close()
+
+
+atexit.register(close_all)